@@ -1,46 +1,113 @@
 import google.generativeai as genai
+import logging
 import os
+import threading
+import time
 from PIL import Image
-import PyPDF2
-import docx
 from dotenv import load_dotenv
+import metrics
+from extract_pool import create_extraction_pool
+from local_analyzer import CATEGORY_KEYWORDS, analyze_locally
 
 # Load environment variables from .env file FIRST
 load_dotenv()
 
+log = logging.getLogger(__name__)
+
 # --- DIAGNOSTIC: Check if the key is loaded ---
 api_key = os.getenv("GEMINI_API_KEY")
 model = None  # Initialize as None
 
 if not api_key:
-    print("⚠️ WARNING: GEMINI_API_KEY not found. AI features will be disabled.")
+    log.warning("GEMINI_API_KEY not found. AI features will be disabled.")
 else:
-    print("✅ SUCCESS: Gemini API key loaded.")
+    log.info("Gemini API key loaded")
     # Configure the Gemini API only if key exists
     try:
         genai.configure(api_key=api_key)
         # Use the stable, versioned model name
         model = genai.GenerativeModel('gemini-2.5-flash')
-        print(f"✅ SUCCESS: Gemini model '{model.model_name}' initialized.")
+        log.info("Gemini model %s initialized", model.model_name)
     except Exception as e:
-        print(f"⚠️ WARNING: Failed to configure Gemini. Error: {e}")
+        log.warning("Failed to configure Gemini: %s", e)
         model = None
 
+# --- GEMINI CONCURRENCY ---
+# The SDK client is shared by every request thread in a worker and is safe for concurrent use;
+# this cap keeps a burst of uploads/searches from exceeding the API's rate limits.
+# GEMINI_MAX_CONCURRENCY (4 per worker process), GEMINI_QUEUE_TIMEOUT (30s)
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", 4))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", 30))
+_gemini_slots = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+
+GEMINI_LATENCY = metrics.histogram('gemini_request_duration_seconds', 'Gemini generate_content latency (excluding queueing)',
+                                   ('operation', 'file_type'))
+GEMINI_QUEUE_WAIT = metrics.histogram('gemini_queue_wait_seconds', 'Time spent waiting for a Gemini concurrency slot')
+GEMINI_ERRORS = metrics.counter('gemini_errors_total', 'Failed Gemini calls', ('operation', 'file_type', 'error'))
+ANALYSIS_SOURCE = metrics.counter('file_analysis_total', 'Analyzed files by what decided the result', ('source', 'file_type'))
+
+# --- DOCUMENT PARSING ---
+# PDF/DOCX text is extracted in a process pool with time and memory limits (extract_pool.py).
+extraction_pool = create_extraction_pool()
+
+
+def _generate_content(contents, operation, file_type=''):
+    """model.generate_content() bounded by the per-process concurrency cap, timed per operation and file type."""
+    queued = time.perf_counter()
+    if not _gemini_slots.acquire(timeout=GEMINI_QUEUE_TIMEOUT):
+        GEMINI_ERRORS.inc(operation=operation, file_type=file_type, error='QueueTimeout')
+        raise TimeoutError("Timed out waiting for a free Gemini request slot")
+    start = time.perf_counter()
+    GEMINI_QUEUE_WAIT.observe(start - queued)
+    if operation == 'analyze':
+        ANALYSIS_SOURCE.inc(source='gemini', file_type=file_type)
+    try:
+        response = model.generate_content(contents)
+        response.resolve()
+        return response
+    except Exception as e:
+        GEMINI_ERRORS.inc(operation=operation, file_type=file_type, error=type(e).__name__)
+        raise
+    finally:
+        GEMINI_LATENCY.observe(time.perf_counter() - start, operation=operation, file_type=file_type)
+        _gemini_slots.release()
 
-def analyze_file(file_path):
-    """Analyze file and return both tags and category in a single AI call."""
-    if not model:
-        print("🔴 ERROR in analyze_file: Model not initialized. Skipping analysis.")
-        return {"tags": None, "category": "Uncategorized"}
-    
-    filename = os.path.basename(file_path)
-    print(f"🔍 Analyzing file: {filename}...")
+
+# --- LOCAL-FIRST ANALYSIS ---
+# Files the local analyzer is sure about (e.g. invoice_2024.pdf, main.py) skip Gemini entirely.
+# LOCAL_ANALYSIS_THRESHOLD (0.6): minimum confidence to keep the local result; 1 = always ask Gemini.
+LOCAL_ANALYSIS_THRESHOLD = float(os.getenv("LOCAL_ANALYSIS_THRESHOLD", 0.6))
+
+
+def _local_result(filename, file_type, text=None, image=None):
+    """The local analysis when it is confident enough (or Gemini is unavailable), else None."""
+    local = analyze_locally(filename, text=text, image=image)
+    if local['confidence'] < LOCAL_ANALYSIS_THRESHOLD and model:
+        return None
+    ANALYSIS_SOURCE.inc(source='local', file_type=file_type)
+    log.debug("Analyzed locally", extra={'file_name': filename, 'confidence': local['confidence'], 'category': local['category']})
+    return {"tags": local['tags'] or None, "category": local['category']}
+
+
+def analyze_file(file_path, filename=None):
+    """Tags and category for a file: local heuristics first, one Gemini call when they aren't confident.
+
+    filename is the name the user uploaded the file as. Pass it whenever
+    file_path is a storage or cache path, whose random prefixes would
+    otherwise end up in the prompts and the local tags.
+    """
+    filename = filename or os.path.basename(file_path)
+    log.debug("Analyzing file", extra={'file_name': filename})
     
     try:
         # 1. HANDLE IMAGES
-        if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
+        if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
             img = Image.open(file_path)
             img.load()  # Force load image data into memory
+            local = _local_result(filename, 'image', image=img)
+            if local:
+                img.close()
+                return local
             prompt = f"""You are an expert AI file organizer for a personal cloud storage system. Your task is to analyze this image thoroughly and provide accurate tags and categorization.
 
 FILENAME: {filename}
@@ -80,20 +147,20 @@ CATEGORY OPTIONS (choose the MOST appropriate ONE based on image CONTENT, not fi
 RESPOND IN THIS EXACT FORMAT (no extra text):
 TAGS: tag1, tag2, tag3, tag4, tag5, tag6, tag7
 CATEGORY: CategoryName"""
-            response = model.generate_content([prompt, img])
-            response.resolve()
+            response = _generate_content([prompt, img], operation='analyze', file_type='image')
             img.close()  # Close the image to release file handle
             return _parse_ai_response(response.text, "image")
 
         # 2. HANDLE PDFS
-        elif file_path.lower().endswith('.pdf'):
-            text_content = ""
-            with open(file_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                num_pages = len(reader.pages)
-                for page in reader.pages:
-                    text_content += page.extract_text() or ""
+        elif filename.lower().endswith('.pdf'):
+            extracted = extraction_pool.extract_text(file_path)
+            if extracted['error']:
+                return {"tags": ['pdf', 'document', 'unreadable'], "category": "Documents"}
+            text_content, num_pages = extracted['text'], extracted['pages']
             
+            local = _local_result(filename, 'pdf', text=text_content)
+            if local:
+                return local
             if text_content:
                 prompt = f"""You are an expert AI file organizer for a personal cloud storage system. Your task is to analyze this PDF document thoroughly and provide accurate tags and categorization.
 
@@ -134,16 +201,20 @@ CATEGORY OPTIONS (choose the MOST appropriate ONE):
 RESPOND IN THIS EXACT FORMAT (no extra text):
 TAGS: tag1, tag2, tag3, tag4, tag5, tag6, tag7, tag8
 CATEGORY: CategoryName"""
-                response = model.generate_content(prompt)
-                response.resolve()
+                response = _generate_content(prompt, operation='analyze', file_type='pdf')
                 return _parse_ai_response(response.text, "pdf")
             return {"tags": ['pdf', 'document', 'unreadable'], "category": "Documents"}
 
         # 3. HANDLE WORD DOCUMENTS
-        elif file_path.lower().endswith('.docx'):
-            doc = docx.Document(file_path)
-            text_content = "\n".join([para.text for para in doc.paragraphs])
+        elif filename.lower().endswith('.docx'):
+            extracted = extraction_pool.extract_text(file_path)
+            if extracted['error']:
+                return {"tags": ['docx', 'document', 'unreadable'], "category": "Documents"}
+            text_content = extracted['text']
             
+            local = _local_result(filename, 'docx', text=text_content)
+            if local:
+                return local
             if text_content:
                 prompt = f"""You are an expert AI file organizer for a personal cloud storage system. Your task is to analyze this Word document thoroughly and provide accurate tags and categorization.
 
@@ -180,18 +251,20 @@ CATEGORY OPTIONS (choose the MOST appropriate ONE):
 RESPOND IN THIS EXACT FORMAT (no extra text):
 TAGS: tag1, tag2, tag3, tag4, tag5, tag6, tag7, tag8
 CATEGORY: CategoryName"""
-                response = model.generate_content(prompt)
-                response.resolve()
+                response = _generate_content(prompt, operation='analyze', file_type='docx')
                 return _parse_ai_response(response.text, "docx")
             return {"tags": ['docx', 'document', 'empty'], "category": "Documents"}
 
         # 4. HANDLE TEXT FILES
-        elif file_path.lower().endswith(('.txt', '.md', '.json', '.csv', '.xml', '.html')):
-            ext = os.path.splitext(file_path)[1].strip('.')
+        elif filename.lower().endswith(('.txt', '.md', '.json', '.csv', '.xml', '.html')):
+            ext = os.path.splitext(filename)[1].strip('.')
             try:
                 with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
                     text_content = f.read()[:4000]
                 
+                local = _local_result(filename, 'text', text=text_content)
+                if local:
+                    return local
                 if text_content.strip():
                     prompt = f"""You are an expert AI file organizer. Analyze this {ext.upper()} file and provide tags and categorization.
 
@@ -208,20 +281,22 @@ CATEGORY OPTIONS: Code, Data, Notes, Configuration, Documents, Study Materials,
 RESPOND IN THIS EXACT FORMAT:
 TAGS: tag1, tag2, tag3, tag4, tag5
 CATEGORY: CategoryName"""
-                    response = model.generate_content(prompt)
-                    response.resolve()
+                    response = _generate_content(prompt, operation='analyze', file_type='text')
                     return _parse_ai_response(response.text, ext)
             except Exception as e:
-                print(f"⚠️ Could not read text file: {e}")
+                log.warning("Could not read text file %s: %s", filename, e)
             return {"tags": [ext, 'text', 'file'], "category": "Documents"}
 
         # 5. HANDLE CODE FILES
-        elif file_path.lower().endswith(('.py', '.js', '.java', '.cpp', '.c', '.cs', '.php', '.rb', '.go', '.rs', '.ts', '.jsx', '.tsx')):
-            ext = os.path.splitext(file_path)[1].strip('.')
+        elif filename.lower().endswith(('.py', '.js', '.java', '.cpp', '.c', '.cs', '.php', '.rb', '.go', '.rs', '.ts', '.jsx', '.tsx')):
+            ext = os.path.splitext(filename)[1].strip('.')
             try:
                 with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
                     code_content = f.read()[:3000]
                 
+                local = _local_result(filename, 'code', text=code_content)
+                if local:
+                    return local
                 prompt = f"""You are an expert AI file organizer. Analyze this code file and provide tags and categorization.
 
 FILENAME: {filename}
@@ -235,16 +310,15 @@ Identify: programming language, frameworks/libraries used, purpose of the code,
 RESPOND IN THIS EXACT FORMAT:
 TAGS: tag1, tag2, tag3, tag4, tag5, tag6
 CATEGORY: Code"""
-                response = model.generate_content(prompt)
-                response.resolve()
+                response = _generate_content(prompt, operation='analyze', file_type='code')
                 return _parse_ai_response(response.text, ext)
             except Exception as e:
-                print(f"⚠️ Could not read code file: {e}")
+                log.warning("Could not read code file %s: %s", filename, e)
             return {"tags": [ext, 'code', 'programming'], "category": "Code"}
 
         # 6. HANDLE OTHER FILES (fallback)
         else:
-            ext = os.path.splitext(file_path)[1].strip('.').lower()
+            ext = os.path.splitext(filename)[1].strip('.').lower()
             
             # Map common extensions to categories
             extension_categories = {
@@ -285,7 +359,7 @@ CATEGORY: Code"""
             return {"tags": [ext] if ext else ['file', 'unknown'], "category": "Other"}
 
     except Exception as e:
-        print(f"🔴 ERROR during file analysis for {filename}: {e}")
+        log.exception("File analysis failed", extra={'file_name': filename})
         return {"tags": None, "category": "Uncategorized"}
 
 
@@ -294,7 +368,7 @@ def _parse_ai_response(response_text, file_type):
     tags = []
     category = "Other"
     
-    print(f"📝 Raw AI response:\n{response_text}\n---")
+    log.debug("Raw AI response", extra={'file_type': file_type, 'response': response_text})
     
     try:
         # Try to find TAGS and CATEGORY in the response
@@ -395,16 +469,16 @@ def _parse_ai_response(response_text, file_type):
                 else:
                     category = "Other"
         
-        print(f"✅ SUCCESS: {file_type} analysis complete. Tags: {tags}, Category: {category}")
+        log.debug("Analysis complete", extra={'file_type': file_type, 'tags': tags, 'category': category})
         return {"tags": tags, "category": category}
     except Exception as e:
-        print(f"⚠️ Warning: Could not parse AI response: {e}")
+        log.warning("Could not parse AI response: %s", e)
         return {"tags": [file_type], "category": "Other"}
 
 def find_semantic_matches(query, files_metadata):
     """Find files that semantically match the user's search query."""
     if not model:
-        print("🔴 ERROR in find_semantic_matches: Model not initialized.")
+        log.error("find_semantic_matches: model not initialized")
         return []
     
     if not files_metadata:
@@ -437,8 +511,7 @@ RESPOND WITH ONLY:
 Example response: vacation_photo.jpg, trip_2024.png, beach_sunset.jpg"""
 
     try:
-        response = model.generate_content(prompt)
-        response.resolve()
+        response = _generate_content(prompt, operation='search')
         result = response.text.strip()
         
         if result.upper() == "NONE" or not result:
@@ -446,7 +519,7 @@ Example response: vacation_photo.jpg, trip_2024.png, beach_sunset.jpg"""
         
         return [name.strip() for name in result.split(',') if name.strip()]
     except Exception as e:
-        print(f"🔴 ERROR during semantic search: {e}")
+        log.error("Semantic search failed: %s", e)
         return []
 
 
@@ -460,64 +533,8 @@ def categorize_by_tags_simple(tags_string):
     
     tags_lower = tags_string.lower()
     
-    # Define category keywords (ordered by priority - most specific first)
-    category_keywords = {
-        # Content-specific categories (highest priority)
-        "Sports": ["cricket", "cricketer", "football", "soccer", "basketball", "tennis", "badminton",
-                   "athlete", "player", "match", "tournament", "trophy", "stadium", "team",
-                   "fitness", "gym", "workout", "sport", "olympic", "ipl", "world cup",
-                   "batting", "bowling", "goal", "score", "champion"],
-        "Travel & Nature": ["travel", "vacation", "trip", "journey", "tourism", "landmark",
-                           "landscape", "nature", "mountain", "beach", "ocean", "river", "forest",
-                           "sunset", "sunrise", "scenery", "outdoor", "hiking", "adventure",
-                           "monument", "temple", "heritage", "destination"],
-        "Food & Recipes": ["food", "recipe", "cooking", "meal", "dish", "restaurant", "cuisine",
-                          "breakfast", "lunch", "dinner", "snack", "dessert", "cake", "pizza",
-                          "coffee", "tea", "beverage", "kitchen", "chef", "delicious"],
-        "Celebrations": ["birthday", "party", "wedding", "festival", "celebration", "ceremony",
-                        "diwali", "holi", "christmas", "new year", "anniversary", "graduation",
-                        "event", "decoration", "cake", "gift"],
-        "Animals & Pets": ["dog", "cat", "pet", "animal", "puppy", "kitten", "bird", "fish",
-                          "wildlife", "zoo", "horse", "cow", "lion", "tiger", "elephant"],
-        "Fashion & Lifestyle": ["fashion", "clothing", "outfit", "dress", "style", "accessory",
-                               "shoes", "watch", "jewelry", "lifestyle", "beauty", "makeup",
-                               "hairstyle", "shopping", "brand"],
-        "Vehicles": ["car", "bike", "motorcycle", "vehicle", "automobile", "truck", "bus",
-                    "train", "airplane", "driving", "road", "engine", "speed"],
-        "Technology": ["gadget", "smartphone", "laptop", "computer", "electronic", "device",
-                      "app", "software", "hardware", "tech", "robot", "ai", "machine learning"],
-        
-        # Specific document/media categories
-        "Screenshots": ["screenshot", "screen capture", "screen shot", "snip", "printscreen"],
-        "Memes & Entertainment": ["meme", "funny", "joke", "entertainment", "viral", "humor",
-                                  "movie", "series", "anime", "cartoon"],
-        "Receipts": ["receipt", "purchase receipt", "transaction", "order confirmation"],
-        "Invoices": ["invoice", "billing", "payment due", "amount due"],
-        "Certificates": ["certificate", "certification", "degree", "diploma", "award", "achievement", "license"],
-        "Resume & CV": ["resume", "cv", "curriculum vitae", "cover letter", "job application", "career"],
-        "Financial": ["bank", "statement", "tax", "financial", "investment", "salary", "income", "expense"],
-        "Medical": ["medical", "health", "prescription", "doctor", "hospital", "diagnosis", "patient", "medicine"],
-        "Legal": ["legal", "contract", "agreement", "court", "law", "attorney", "lawyer"],
-        "Code": ["code", "programming", "python", "javascript", "java", "function", "class", "api", "github", "repository"],
-        "Art & Design": ["art", "design", "illustration", "graphic", "creative", "artwork", "drawing", "sketch"],
-        
-        # Broader categories (lower priority)
-        "Study Materials": ["study", "notes", "lecture", "course", "exam", "homework", "assignment", 
-                          "textbook", "education", "school", "university", "college", "research", "academic",
-                          "thesis", "essay", "tutorial", "learning", "student"],
-        "Reports": ["report", "analysis", "summary", "evaluation", "assessment", "findings"],
-        "People & Selfies": ["selfie", "portrait", "group photo", "family", "friends", "photo",
-                            "picture", "photography", "memories"],
-        "Documents": ["document", "form", "id card", "passport", "official", "paper", "pdf", "docx"],
-        "Work & Business": ["work", "project", "meeting", "presentation", "business", "client", "company", "office",
-                           "professional", "corporate", "proposal", "strategy"],
-        "Personal": ["personal", "diary", "journal", "private"],
-        "Music": ["music", "song", "audio", "mp3", "wav", "album", "artist", "playlist"],
-        "Videos": ["video", "movie", "clip", "mp4", "recording", "footage"],
-    }
-    
     # Check each category (priority order matters)
-    for category, keywords in category_keywords.items():
+    for category, keywords in CATEGORY_KEYWORDS.items():
         for keyword in keywords:
             if keyword in tags_lower:
                 return category
@@ -527,7 +544,7 @@ def categorize_by_tags_simple(tags_string):
 
 def categorize_files_with_ai(files_metadata):
     if not model:
-        print("🔴 ERROR in categorize_files_with_ai: Model not initialized.")
+        log.error("categorize_files_with_ai: model not initialized")
         return {"Uncategorized": [meta.filename for meta in files_metadata]}
     if not files_metadata:
         return {}
@@ -536,8 +553,7 @@ def categorize_files_with_ai(files_metadata):
     file_info_string = "\n".join(file_info_list)
     prompt = f"""You are an expert file organizer. Group these files into precise, meaningful categories based on their tags. Use categories like "Documents & IDs", "Study Materials", "Photos & Memories", "Receipts & Invoices", etc. Return ONLY a comma-separated list of key-value pairs. Example: Category:Receipts, Filename:receipt.pdf, Category:Photos, Filename:trip.jpg\n\nFiles:\n{file_info_string}"""
     try:
-        response = model.generate_content(prompt)
-        response.resolve()
+        response = _generate_content(prompt, operation='categorize')
         categorized_files = {}
         parts = response.text.strip().split(',')
         for i in range(0, len(parts), 2):
@@ -554,8 +570,8 @@ def categorize_files_with_ai(files_metadata):
         uncategorized = all_filenames - ai_categorized_filenames
         if uncategorized:
             categorized_files['Other'] = list(uncategorized)
-        print(f"✅ SUCCESS: Files categorized into: {list(categorized_files.keys())}")
+        log.info("Files categorized", extra={'categories': list(categorized_files.keys())})
         return categorized_files
     except Exception as e:
-        print(f"🔴 ERROR during AI categorization: {e}")
+        log.error("AI categorization failed: %s", e)
         return {"Uncategorized": [meta.filename for meta in files_metadata]}
\ No newline at end of file
@@ -1,48 +1,76 @@
-from flask import Flask, render_template, request, redirect, url_for, send_from_directory, flash, session
+from dotenv import load_dotenv
+from logging_setup import configure_logging, init_request_ids
+
+# Load environment variables from .env file, then start the log writer before other modules log at import
+load_dotenv()
+configure_logging()
+
+from flask import Flask, render_template, request, redirect, url_for, send_from_directory, send_file, flash, session, jsonify, Response, stream_with_context, abort, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from dotenv import load_dotenv
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.exceptions import NotFound
+from werkzeug.utils import secure_filename
 from ai_utils import analyze_file, find_semantic_matches, categorize_by_tags_simple
+from storage import create_blob_store, StorageError
+from zip_stream import ZipEntry, stream_zip
+from blob_cache import BlobCache, sha256_file
+from share_links import ShareLinkSigner, RevocationList, SharedFileCache, InvalidShareToken, claim_use, release_use, now_ms
+from share_stats import ShareStatsBuffer
+from direct_upload import UploadTicketSigner, InvalidUploadTicket, analysis_length, fetch_prefix, hash_object
+from user_cache import UserCache, CachedUser
+from auth_guard import SlidingWindowLimiter, PasswordHasher, HashingBusy
+import migrations
+from db_profiles import engine_options, install_sqlite_pragmas
+from replicas import RoutingSession, replica_binds, read_only, remember_write
+from tags import replace_file_tags, delete_file_tags, tag_facets, file_ids_with_tag
+from similarity import SimilarityIndex, dhash_file, duplicate_groups, from_hex, hamming, to_hex, IMAGE_EXTENSIONS
+import metrics
+import versioning
+from profiler import SlowRequestProfiler
+from previews import PreviewRenderer, PreviewTimeout, PreviewUnavailable, THUMBNAIL_SIZES, preview_kind, render_document, render_image, render_snippet
+import atexit
+import click
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from types import SimpleNamespace
 import os
 import secrets
-import boto3
-from botocore.exceptions import ClientError
+import shutil
+import tempfile
+import time
 
-# Load environment variables from .env file
-load_dotenv()
+log = logging.getLogger(__name__)
 
 # --- S3 CONFIGURATION ---
 USE_S3 = os.environ.get('USE_S3', 'false').lower() == 'true'
 S3_BUCKET = os.environ.get('S3_BUCKET_NAME')
-AWS_REGION = os.environ.get('AWS_REGION', 'ap-south-1')
-
-s3_client = None
-if USE_S3:
-    try:
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
-            region_name=AWS_REGION
-        )
-        print("✅ S3 client initialized successfully for bucket:", S3_BUCKET)
-    except Exception as e:
-        print("⚠️ S3 client initialization error:", e)
-        s3_client = None
-else:
-    print("💻 S3 disabled — using local storage")
+if USE_S3 and not S3_BUCKET:
+    log.warning("USE_S3 is set but S3_BUCKET_NAME is missing, falling back to local storage")
+    USE_S3 = False
 
 app = Flask(__name__)
+init_request_ids(app)
 
 # --- CONFIGURATION ---
 # Check if running on Render (production) or locally (development)
 if os.environ.get('RENDER'):
     # 🚀 PRODUCTION MODE (on Render)
-    print("🚀 Running in PRODUCTION mode on Render")
+    log.info("Running in PRODUCTION mode on Render")
     
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
     
+    # Render terminates TLS at one proxy hop; trust its X-Forwarded-For so login throttling sees client IPs
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
+    
     # Use PostgreSQL database from Render
     database_url = os.environ.get('DATABASE_URL')
     if database_url:
@@ -58,7 +86,7 @@ if os.environ.get('RENDER'):
     
 else:
     # 💻 DEVELOPMENT MODE (on your computer)
-    print("💻 Running in DEVELOPMENT mode")
+    log.info("Running in DEVELOPMENT mode")
     
     app.config['SECRET_KEY'] = 'a-very-secret-key-that-you-should-change'
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
@@ -66,16 +94,60 @@ else:
 
 # Common configuration for both environments
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])  # See db_profiles.py
+
+# Read replicas: DATABASE_REPLICA_URLS is a comma-separated list of replica URLs. Handlers marked
+# @read_only_route read from a random replica, except for clients that wrote within
+# REPLICA_STICKY_SECONDS (10), who stay on the primary to see their own changes.
+REPLICA_URLS = [url.strip().replace('postgres://', 'postgresql://', 1)
+                for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+app.config['SQLALCHEMY_BINDS'] = replica_binds(REPLICA_URLS, engine_options)
+read_only_route = read_only(int(os.environ.get('REPLICA_STICKY_SECONDS', 10)))
+if REPLICA_URLS:
+    log.info("Routing read-only requests to %d replica(s)", len(REPLICA_URLS))
+
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # Create upload folder if it doesn't exist
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
-    print(f"📁 Created upload folder: {UPLOAD_FOLDER}")
+    log.info("Created upload folder %s", UPLOAD_FOLDER)
+
+# --- STORAGE BACKEND ---
+# S3 when USE_S3=true, otherwise a hash-sharded local blob store under UPLOAD_FOLDER/blobs.
+# See storage.create_blob_store for the tuning variables.
+storage = create_blob_store(UPLOAD_FOLDER, use_s3=USE_S3)
+if USE_S3:
+    log.info("S3 storage initialized for bucket %s", S3_BUCKET)
+else:
+    log.info("S3 disabled, using local storage")
+
+# --- LOCAL CACHE TIER FOR REMOTE BLOBS ---
+# Optional read-through LRU cache on local disk in front of S3, used by downloads and re-analysis.
+# BLOB_CACHE_ENABLED=true, BLOB_CACHE_DIR, BLOB_CACHE_MAX_MB (512), BLOB_CACHE_VERIFY_ON_HIT=false
+# BLOB_CACHE_MAX_MB is the budget for the whole directory, shared by every worker using it (see blob_cache.py).
+blob_cache = None
+if USE_S3 and os.environ.get('BLOB_CACHE_ENABLED', 'false').lower() == 'true':
+    blob_cache = BlobCache(
+        os.environ.get('BLOB_CACHE_DIR', os.path.join(UPLOAD_FOLDER, 'cache')),
+        max_bytes=int(os.environ.get('BLOB_CACHE_MAX_MB', 512)) * 1024 * 1024,
+        verify_on_hit=os.environ.get('BLOB_CACHE_VERIFY_ON_HIT', 'false').lower() == 'true'
+    )
+    log.info("Blob cache enabled at %s (%d MB)", blob_cache.root, blob_cache.max_bytes // (1024 * 1024))
 
 # --- DATABASE & LOGIN MANAGER SETUP ---
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+with app.app_context():
+    for engine in db.engines.values():
+        install_sqlite_pragmas(engine)
+
+@app.after_request
+def remember_db_write(response):
+    """Start the read-your-writes window for signed-in users whose request wrote to the primary."""
+    if current_user.is_authenticated:
+        return remember_write(response)
+    return response
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -90,17 +162,290 @@ class User(UserMixin, db.Model):
 class FileMetadata(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(300), nullable=False)
-    s3_key = db.Column(db.String(500), nullable=True)  # NEW: stores S3 path
-    tags = db.Column(db.String(500))
+    s3_key = db.Column(db.String(500), nullable=True)  # Storage key (S3 object key, or local blob key when S3 is off)
+    tags = db.Column(db.String(500))  # Comma-joined copy for display; FileTag is the indexed source
     category = db.Column(db.String(100), nullable=True)  # Permanent category storage
     file_size = db.Column(db.Integer, nullable=True, default=0)  # File size in bytes
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the contents, for cache integrity checks
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     share_token = db.Column(db.String(32), unique=True, nullable=True)
+    phash = db.Column(db.String(16), nullable=True)  # Hex dHash of images, for near-duplicate lookup
+
+    # Keep in sync with migrations.index_file_metadata for databases created before these existed
+    __table_args__ = (
+        db.Index('uq_file_metadata_user_filename', 'user_id', 'filename', unique=True),
+        db.Index('ix_file_metadata_user_category', 'user_id', 'category'),
+    )
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)  # Normalized: stripped, lowercase
+
+class FileTag(db.Model):
+    """File-tag association. user_id is denormalized so per-user facets and tag filters are one index scan."""
+    file_id = db.Column(db.Integer, db.ForeignKey('file_metadata.id', ondelete='CASCADE'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (db.Index('ix_file_tag_user_tag', 'user_id', 'tag_id'),)
+
+class ShareRevocation(db.Model):
+    """Share links for file_id issued at or before revoked_at (epoch ms) are no longer valid."""
+    file_id = db.Column(db.Integer, primary_key=True)
+    revoked_at = db.Column(db.BigInteger, nullable=False)
+
+class ShareLinkUse(db.Model):
+    """Use counter for limited-use share links. Unlimited links never touch this table."""
+    jti = db.Column(db.String(16), primary_key=True)
+    uses = db.Column(db.Integer, nullable=False, default=0)
+    max_uses = db.Column(db.Integer, nullable=False)
+
+class ShareLinkStat(db.Model):
+    """Download analytics per share link (signed-link jti, or the legacy token)."""
+    link_id = db.Column(db.String(32), primary_key=True)
+    file_id = db.Column(db.Integer, nullable=False, index=True)
+    downloads = db.Column(db.Integer, nullable=False, default=0)
+    bytes_served = db.Column(db.BigInteger, nullable=False, default=0)
+    last_access = db.Column(db.DateTime, nullable=True)
+
+# Version history (versioning.py); keep in sync with migrations.add_version_tables
+class FileVersion(db.Model):
+    """A previous content of (user_id, filename), made of shared chunks. Tags etc. are restored with it."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    filename = db.Column(db.String(300), nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    file_size = db.Column(db.Integer, nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)
+    tags = db.Column(db.String(500))
+    category = db.Column(db.String(100), nullable=True)
+    phash = db.Column(db.String(16), nullable=True)
+    stored_bytes = db.Column(db.Integer, nullable=False, default=0)  # Size of the chunks this version added
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (db.Index('uq_file_version_user_filename_version', 'user_id', 'filename', 'version', unique=True),)
+
+class Chunk(db.Model):
+    """A content-addressed piece of file data, stored once per user at user_<id>/chunks/<digest>."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    digest = db.Column(db.String(64), nullable=False)  # SHA-256
+    size = db.Column(db.Integer, nullable=False)
+    unused_since = db.Column(db.DateTime, nullable=True, index=True)  # No version uses it; reaped after a grace period
+
+    __table_args__ = (db.Index('uq_chunk_user_digest', 'user_id', 'digest', unique=True),)
+
+class FileVersionChunk(db.Model):
+    version_id = db.Column(db.Integer, db.ForeignKey('file_version.id', ondelete='CASCADE'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    chunk_id = db.Column(db.Integer, db.ForeignKey('chunk.id'), nullable=False, index=True)
+
+# --- SHARE LINK SIGNING ---
+# Links are HMAC-signed, so forged, expired or revoked ones are rejected without a database lookup;
+# valid ones are resolved to the file's current row (see resolve_share_token), cached per worker by file id
+# for SHARE_FILE_CACHE_TTL (30s). SHARE_LINK_SECRET must be identical on every worker (defaults to SECRET_KEY).
+# SHARE_LINK_DEFAULT_HOURS (168), SHARE_LINK_MAX_HOURS (8760), SHARE_REVOCATION_REFRESH_SECONDS (30)
+SHARE_LINK_DEFAULT_HOURS = int(os.environ.get('SHARE_LINK_DEFAULT_HOURS', 168))
+SHARE_LINK_MAX_HOURS = int(os.environ.get('SHARE_LINK_MAX_HOURS', 24 * 365))
+share_signer = ShareLinkSigner(os.environ.get('SHARE_LINK_SECRET') or app.config['SECRET_KEY'])
+share_revocations = RevocationList(
+    lambda: db.session.query(ShareRevocation.file_id, ShareRevocation.revoked_at).all(),
+    refresh_seconds=int(os.environ.get('SHARE_REVOCATION_REFRESH_SECONDS', 30))
+)
+
+def load_shared_file(file_id):
+    """What share links need of a file, detached from the session; None if it no longer exists."""
+    file_meta = db.session.get(FileMetadata, file_id)
+    if file_meta is None:
+        return None
+    return SimpleNamespace(**{column: getattr(file_meta, column) for column in (
+        'id', 'user_id', 'filename', 's3_key', 'file_size', 'content_hash')})
+
+shared_files = SharedFileCache(load_shared_file, ttl=int(os.environ.get('SHARE_FILE_CACHE_TTL', 30)))
+
+# --- SHARE LINK ANALYTICS ---
+# Counters are buffered per worker and written in one batched upsert every
+# SHARE_STATS_FLUSH_SECONDS (30) or once SHARE_STATS_MAX_PENDING (500) links are dirty.
+def flush_share_stats(batch):
+    rows = [
+        {'link_id': link_id, 'file_id': file_id, 'downloads': downloads, 'bytes_served': nbytes,
+         'last_access': datetime.fromtimestamp(last, tz=timezone.utc).replace(tzinfo=None)}
+        for link_id, (downloads, nbytes, last, file_id) in batch.items()
+    ]
+    with app.app_context():
+        table = ShareLinkStat.__table__
+        dialect = db.engine.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(table).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.link_id],
+                set_={
+                    'downloads': table.c.downloads + stmt.excluded.downloads,
+                    'bytes_served': table.c.bytes_served + stmt.excluded.bytes_served,
+                    'last_access': stmt.excluded.last_access,
+                }
+            )
+            db.session.execute(stmt)
+        else:
+            for row in rows:
+                stat = db.session.get(ShareLinkStat, row['link_id'])
+                if stat:
+                    stat.downloads += row['downloads']
+                    stat.bytes_served += row['bytes_served']
+                    stat.last_access = row['last_access']
+                else:
+                    db.session.add(ShareLinkStat(**row))
+        db.session.commit()
+
+share_stats = ShareStatsBuffer(
+    flush_share_stats,
+    flush_interval=int(os.environ.get('SHARE_STATS_FLUSH_SECONDS', 30)),
+    max_pending=int(os.environ.get('SHARE_STATS_MAX_PENDING', 500))
+)
+share_stats.start()
+atexit.register(share_stats.flush)
+
+def share_link_stats(link_id):
+    """Persisted counters plus this worker's unflushed ones for a single link."""
+    stat = db.session.get(ShareLinkStat, link_id)
+    downloads, nbytes, last = share_stats.pending(link_id)
+    last_access = datetime.fromtimestamp(last, tz=timezone.utc).replace(tzinfo=None) if last else None
+    if stat:
+        downloads += stat.downloads
+        nbytes += stat.bytes_served
+        if stat.last_access and (last_access is None or stat.last_access > last_access):
+            last_access = stat.last_access
+    return {'downloads': downloads, 'bytes_served': nbytes, 'last_access': last_access}
+
+def resolve_share_token(token):
+    """Return (file, payload) for a share token, or abort with 404.
+
+    Signed tokens are verified in memory, then resolved by id and owner to a
+    cached snapshot of the file's current row (see shared_files). payload is
+    None for legacy random tokens.
+    """
+    if not ShareLinkSigner.is_signed(token):
+        return FileMetadata.query.filter_by(share_token=token).first_or_404(), None
+    try:
+        payload = share_signer.verify(token)
+    except InvalidShareToken as e:
+        abort(404, description=str(e))
+    if share_revocations.is_revoked(payload):
+        abort(404, description='This share link has been revoked')
+    file_meta = shared_files.get(payload['f'])
+    if file_meta is None or file_meta.user_id != payload['u']:
+        abort(404, description='This shared file no longer exists')
+    return file_meta, payload
 
 # --- FLASK-LOGIN USER LOADER ---
+# Authenticated requests are served from a per-worker TTL cache instead of a User query each time.
+# USER_CACHE_TTL (60s), REDIS_URL for an optional shared tier (USER_CACHE_LOCAL_TTL, 5s).
+user_cache = UserCache(
+    ttl=int(os.environ.get('USER_CACHE_TTL', 60)),
+    redis_url=os.environ.get('REDIS_URL'),
+    local_ttl=int(os.environ.get('USER_CACHE_LOCAL_TTL', 5))
+)
+
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, target):
+    """Drop the cached snapshot whenever a user's password or profile changes."""
+    user_cache.invalidate(target.id)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    user = db.session.get(User, user_id)
+    if user is None:
+        return None
+    cached = CachedUser(user.id, user.username)
+    user_cache.set(cached)
+    return cached
+
+def send_local_file(file_meta):
+    """Serve a file from the local blob store, falling back to the legacy per-user folder."""
+    blob_path = storage.local_path(file_meta.s3_key) if file_meta.s3_key else None
+    if blob_path:
+        if os.path.exists(blob_path):
+            return send_file(blob_path, download_name=file_meta.filename)
+    user_folder = os.path.join(app.config['UPLOAD_FOLDER'], str(file_meta.user_id))
+    return send_from_directory(user_folder, file_meta.filename)
+
+@contextmanager
+def local_blob_path(file_meta):
+    """Yield a local filesystem path with the file's contents.
+
+    Local backend: the blob itself. S3 with the cache tier: a cached copy
+    (fetched on a miss and verified against content_hash). S3 without the
+    cache: a temporary download that is removed afterwards.
+    """
+    path = storage.local_path(file_meta.s3_key) if file_meta.s3_key else None
+    if path or not file_meta.s3_key:
+        yield path or os.path.join(app.config['UPLOAD_FOLDER'], str(file_meta.user_id), secure_filename(file_meta.filename))
+    elif blob_cache:
+        yield blob_cache.get_path(file_meta.s3_key,
+                                  lambda out: storage.download(file_meta.s3_key, out),
+                                  expected_hash=file_meta.content_hash)
+    else:
+        temp_dir = tempfile.mkdtemp(prefix='blob-')
+        try:
+            path = os.path.join(temp_dir, secure_filename(file_meta.filename) or 'blob')
+            with open(path, 'wb') as out:
+                storage.download(file_meta.s3_key, out)
+            yield path
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+def serve_file(file_meta):
+    """Response for downloading a file: cached local copy, presigned redirect, or local blob."""
+    if blob_cache and file_meta.s3_key:
+        with local_blob_path(file_meta) as path:
+            return send_file(path, download_name=file_meta.filename)
+    # Remote backends hand out a presigned URL (valid for 1 hour)
+    url = storage.presigned_url(file_meta.s3_key, expires_in=3600) if file_meta.s3_key else None
+    if url:
+        return redirect(url)
+    return send_local_file(file_meta)
+
+def open_file_blob(file_meta):
+    """Open a file's contents for reading from whichever backend holds it."""
+    if file_meta.s3_key:
+        return storage.open(file_meta.s3_key)
+    legacy_path = os.path.join(app.config['UPLOAD_FOLDER'], str(file_meta.user_id), secure_filename(file_meta.filename))
+    return open(legacy_path, 'rb')
+
+# --- LOGIN THROTTLING & PASSWORD HASHING ---
+# Attempts are rate-limited per username and per client IP before any hashing work is done,
+# and hashing runs on a small bounded pool so a credential-stuffing burst can't occupy every
+# request thread. LOGIN_THROTTLE_WINDOW_SECONDS (300), LOGIN_MAX_ATTEMPTS_PER_USER (10),
+# LOGIN_MAX_ATTEMPTS_PER_IP (50), SIGNUP_MAX_PER_IP (10), PASSWORD_HASH_METHOD
+# (pbkdf2:sha256:600000), PASSWORD_HASH_CONCURRENCY (2), PASSWORD_HASH_QUEUE (16).
+LOGIN_THROTTLE_WINDOW = int(os.environ.get('LOGIN_THROTTLE_WINDOW_SECONDS', 300))
+login_user_limiter = SlidingWindowLimiter(int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_USER', 10)), LOGIN_THROTTLE_WINDOW)
+login_ip_limiter = SlidingWindowLimiter(int(os.environ.get('LOGIN_MAX_ATTEMPTS_PER_IP', 50)), LOGIN_THROTTLE_WINDOW)
+signup_ip_limiter = SlidingWindowLimiter(int(os.environ.get('SIGNUP_MAX_PER_IP', 10)), 3600)
+password_hasher = PasswordHasher(
+    method=os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000'),
+    max_workers=int(os.environ.get('PASSWORD_HASH_CONCURRENCY', 2)),
+    max_pending=int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+)
+
+def throttled(template, retry_after):
+    """429 response re-rendering the auth form with a retry hint."""
+    minutes = max(1, (retry_after + 59) // 60)
+    flash(f'Too many attempts. Please try again in {minutes} minute(s).', 'error')
+    return render_template(template), 429, {'Retry-After': str(retry_after)}
+
+def hashing_busy(template):
+    flash('The server is busy. Please try again in a moment.', 'error')
+    return render_template(template), 503, {'Retry-After': '5'}
 
 # --- AUTHENTICATION ROUTES ---
 @app.route('/signup', methods=['GET', 'POST'])
@@ -114,6 +459,10 @@ def signup():
                 flash('Please enter both username and password.', 'error')
                 return render_template('signup.html')
             
+            ip_key = f"signup:{request.remote_addr}"
+            if not signup_ip_limiter.hit(ip_key):
+                return throttled('signup.html', signup_ip_limiter.retry_after(ip_key))
+            
             if len(username) < 3:
                 flash('Username must be at least 3 characters long.', 'error')
                 return render_template('signup.html')
@@ -129,7 +478,7 @@ def signup():
             
             new_user = User(
                 username=username,
-                password=generate_password_hash(password, method='pbkdf2:sha256')
+                password=password_hasher.hash(password)
             )
             db.session.add(new_user)
             db.session.commit()
@@ -137,8 +486,10 @@ def signup():
             flash('Account created successfully! Please log in.', 'success')
             return redirect(url_for('login'))
             
+        except HashingBusy:
+            return hashing_busy('signup.html')
         except Exception as e:
-            print(f"Signup error: {e}")
+            log.exception("Signup error")
             flash('An error occurred during signup. Please try again.', 'error')
             return render_template('signup.html')
     
@@ -155,18 +506,35 @@ def login():
                 flash('Please enter both username and password.', 'error')
                 return render_template('login.html')
             
+            # Both limits are checked before the user lookup or any hashing
+            ip_key = f"ip:{request.remote_addr}"
+            user_key = f"user:{username.lower()}"
+            if not login_ip_limiter.hit(ip_key):
+                return throttled('login.html', login_ip_limiter.retry_after(ip_key))
+            if not login_user_limiter.hit(user_key):
+                return throttled('login.html', login_user_limiter.retry_after(user_key))
+            
             user = User.query.filter_by(username=username).first()
             
-            if not user or not check_password_hash(user.password, password):
+            if not user or not password_hasher.verify(user.password, password):
                 flash('Invalid username or password. Please try again.', 'error')
                 return render_template('login.html')
             
+            login_user_limiter.reset(user_key)
+            if password_hasher.needs_rehash(user.password):
+                # Cost parameters changed since this hash was made; upgrade it while we have the password
+                user.password = password_hasher.hash(password)
+                db.session.commit()
+                log.info("Upgraded password hash", extra={'user_id': user.id, 'method': password_hasher.method})
+            
             login_user(user)
             flash('Login successful!', 'success')
             return redirect(url_for('index'))
             
+        except HashingBusy:
+            return hashing_busy('login.html')
         except Exception as e:
-            print(f"Login error: {e}")
+            log.exception("Login error")
             flash('An error occurred during login. Please try again.', 'error')
             return render_template('login.html')
     
@@ -181,6 +549,7 @@ def logout():
 # --- CORE APPLICATION ROUTES ---
 @app.route('/')
 @login_required
+@read_only_route
 def index():
     try:
         # Check if we're viewing a specific folder
@@ -212,9 +581,16 @@ def index():
         storage_limit = "50 MB"  # Display limit
         storage_percent = min((total_size / (50 * 1024 * 1024)) * 100, 100)  # 50MB limit for display
         
+        # Optional ?tag= filter, resolved through the (user_id, tag_id) index
+        tag_filter = request.args.get('tag', '').strip()
+        shown_files = all_files_metadata
+        if tag_filter:
+            tagged_ids = set(db.session.execute(file_ids_with_tag(current_user.id, tag_filter)).scalars())
+            shown_files = [f for f in all_files_metadata if f.id in tagged_ids]
+        
         # Build categories from stored category column (NO AI CALL!)
         categorized_files = {}
-        for file_meta in all_files_metadata:
+        for file_meta in shown_files:
             category = file_meta.category or "Uncategorized"
             if category not in categorized_files:
                 categorized_files[category] = []
@@ -225,7 +601,7 @@ def index():
         
         if folder_name:
             # Show specific folder view
-            print(f"DEBUG: Viewing folder: {folder_name}")
+            log.debug("Viewing folder", extra={'folder': folder_name})
             folder_files = categorized_files.get(folder_name, [])
             
             return render_template('index.html', 
@@ -240,12 +616,12 @@ def index():
                                  category_stats=category_stats)
         else:
             # Show main dashboard with all categorized folders
-            print(f"DEBUG: Showing main dashboard with {len(all_files_metadata)} files")
+            log.debug("Showing main dashboard", extra={'files': len(all_files_metadata)})
             
             return render_template('index.html', 
                                  viewing_folder=False,
                                  categorized_files=categorized_files, 
-                                 title="Your Smart Dashboard",
+                                 title=f"Files tagged '{tag_filter}'" if tag_filter else "Your Smart Dashboard",
                                  total_files=total_files,
                                  storage_used=storage_used,
                                  storage_limit=storage_limit,
@@ -254,11 +630,12 @@ def index():
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
-        print(f"❌ INDEX ROUTE ERROR: {error_trace}")
+        log.error("Index route error", exc_info=e)
         return f"<pre>Error in index route:\n{error_trace}</pre>", 500
 
 @app.route('/search')
 @login_required
+@read_only_route
 def search():
     query = request.args.get('query', '')
     if not query:
@@ -273,118 +650,668 @@ def search():
     return render_template('index.html', 
                          viewing_folder=False,
                          categorized_files=categorized_results, 
-                         title="Search Results")
+                         title="Search Results",
+                         is_search=True)
 
-@app.route('/upload', methods=['POST'])
-@login_required
-def upload_file():
-    if 'file' not in request.files or request.files['file'].filename == '':
-        flash('No selected file', 'error')
-        return redirect(url_for('index'))
+def store_and_analyze(file):
+    """Save one uploaded file to storage and run AI analysis. Returns its metadata row for upsert."""
+    s3_key = f"user_{current_user.id}/{secrets.token_hex(12)}_{file.filename}"
+    analysis_path = storage.local_path(s3_key)
+    temp_dir = None
+    stored = False
     
-    file = request.files['file']
-    user_folder = os.path.join(app.config['UPLOAD_FOLDER'], str(current_user.id))
-    
-    if not os.path.exists(user_folder):
-        os.makedirs(user_folder)
-    
-    # Save to temp local folder for AI analysis
-    temp_filename = secrets.token_hex(8) + "_" + file.filename
-    temp_path = os.path.join(user_folder, temp_filename)
-    file.save(temp_path)
-    
-    # Get file size
-    file_size = os.path.getsize(temp_path)
-    
-    s3_key = None
     try:
-        # If S3 enabled, upload to S3
-        if USE_S3 and s3_client and S3_BUCKET:
-            s3_key = f"user_{current_user.id}/{secrets.token_hex(12)}_{file.filename}"
-            file.seek(0)  # Reset file pointer
-            s3_client.upload_fileobj(
-                file,
-                S3_BUCKET,
-                s3_key,
-                ExtraArgs={'ContentType': file.content_type}
-            )
-            print(f"✅ File uploaded to S3: {s3_key}")
+        if analysis_path:
+            # Local backend: write straight into the durable store and analyze in place
+            file_size = storage.save(s3_key, file.stream)
+        else:
+            # Remote backend: keep a short-lived local copy for AI analysis, named like the original
+            temp_dir = tempfile.mkdtemp(prefix='upload-')
+            analysis_path = os.path.join(temp_dir, secure_filename(file.filename) or 'upload')
+            file.save(analysis_path)
+            with open(analysis_path, 'rb') as f:
+                file_size = storage.save(s3_key, f, content_type=file.content_type)
+        stored = True
+        content_hash = sha256_file(analysis_path)
+        phash = dhash_file(analysis_path)
+        if blob_cache:
+            # Write-through so previews and re-analysis right after upload don't go back to S3
+            blob_cache.put_file(s3_key, analysis_path)
+        log.debug("File stored", extra={'key': s3_key})
         
-        # Analyze file with AI (from local temp copy) - returns {tags, category}
-        analysis_result = analyze_file(temp_path)
+        # Analyze file with AI - returns {tags, category}
+        analysis_result = analyze_file(analysis_path, file.filename)
         tags = analysis_result.get('tags') if analysis_result else None
         category = analysis_result.get('category', 'Uncategorized') if analysis_result else 'Uncategorized'
         
-        print(f"📦 Saving file: {file.filename}")
-        print(f"   Tags: {tags}")
-        print(f"   Category: {category}")
-        
-        # Save metadata
-        existing_metadata = FileMetadata.query.filter_by(
-            filename=file.filename, 
-            user_id=current_user.id
-        ).first()
+        log.info("File analyzed", extra={'file_name': file.filename, 'category': category, 'tag_count': len(tags or [])})
         
-        if not existing_metadata:
-            new_metadata = FileMetadata(
-                filename=file.filename,
-                s3_key=s3_key,  # Store S3 key
-                tags=','.join(tags) if tags else '',
-                category=category,  # Store category permanently
-                file_size=file_size,  # Store file size
-                user_id=current_user.id
-            )
-            db.session.add(new_metadata)
+        return {
+            'filename': file.filename,
+            's3_key': s3_key,
+            'tags': ','.join(tags) if tags else '',
+            'category': category,
+            'file_size': file_size,
+            'content_hash': content_hash,
+            'phash': phash,
+            'user_id': current_user.id,
+        }
+    except Exception:
+        if stored:
+            try:
+                storage.delete(s3_key)
+            except StorageError:
+                pass
+        raise
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+def upsert_file_metadata(rows):
+    """Insert or replace metadata rows by (user_id, filename) in one statement.
+
+    A replaced file keeps its previous tags if the new analysis produced none,
+    like re-uploading always has.
+    """
+    table = FileMetadata.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
         else:
-            existing_metadata.tags = ','.join(tags) if tags else existing_metadata.tags
-            existing_metadata.category = category  # Update category
-            existing_metadata.file_size = file_size  # Update file size
-            if s3_key:
-                existing_metadata.s3_key = s3_key
-        
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.filename],
+            set_={
+                's3_key': stmt.excluded.s3_key,
+                'tags': db.case((stmt.excluded.tags != '', stmt.excluded.tags), else_=table.c.tags),
+                'category': stmt.excluded.category,
+                'file_size': stmt.excluded.file_size,
+                'content_hash': stmt.excluded.content_hash,
+                'phash': stmt.excluded.phash,
+            }
+        )
+        db.session.execute(stmt)
+    else:
+        for row in rows:
+            existing = FileMetadata.query.filter_by(user_id=row['user_id'], filename=row['filename']).first()
+            if existing:
+                for column, value in row.items():
+                    if column != 'tags' or value:
+                        setattr(existing, column, value)
+            else:
+                db.session.add(FileMetadata(**row))
+
+@app.route('/tags')
+@login_required
+@read_only_route
+def tag_facet_counts():
+    """Per-tag file counts for the current user, most used first."""
+    limit = request.args.get('limit', type=int)
+    return jsonify({'tags': [{'tag': name, 'count': count}
+                             for name, count in tag_facets(db.session, current_user.id, limit)]})
+
+# --- NEAR-DUPLICATE IMAGES ---
+# Images get a 64-bit dHash at upload; each user's hashes are indexed in memory with multi-index hashing (similarity.py).
+# SIMILARITY_MAX_DISTANCE (8): default Hamming radius — re-encodes and resizes land within ~4, burst shots ~10.
+# SIMILARITY_CACHE_USERS (256) indexes kept per worker, rebuilt after SIMILARITY_INDEX_TTL (300s) or when images change.
+SIMILARITY_MAX_DISTANCE = int(os.environ.get('SIMILARITY_MAX_DISTANCE', 8))
+
+def image_hashes(user_id):
+    rows = db.session.query(FileMetadata.id, FileMetadata.phash).filter(
+        FileMetadata.user_id == user_id, FileMetadata.phash != None).all()
+    return [(file_id, from_hex(phash)) for file_id, phash in rows]
+
+def image_hash_signature(user_id):
+    return tuple(db.session.query(db.func.count(FileMetadata.id), db.func.max(FileMetadata.id)).filter(
+        FileMetadata.user_id == user_id, FileMetadata.phash != None).one())
+
+similarity_index = SimilarityIndex(image_hashes, image_hash_signature,
+                                   max_users=int(os.environ.get('SIMILARITY_CACHE_USERS', 256)),
+                                   ttl=int(os.environ.get('SIMILARITY_INDEX_TTL', 300)))
+
+@app.route('/similar/<int:file_id>')
+@login_required
+@read_only_route
+def similar_files(file_id):
+    """Images that look like this one. Optional ?distance= (bits, max 32) and ?limit= (50)."""
+    file_meta = FileMetadata.query.filter_by(id=file_id, user_id=current_user.id).first_or_404()
+    distance = min(max(request.args.get('distance', SIMILARITY_MAX_DISTANCE, type=int), 0), 32)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    result = {'file_id': file_meta.id, 'filename': file_meta.filename, 'distance': distance, 'similar': []}
+    if not file_meta.phash:
+        return jsonify(result)
+    
+    target = from_hex(file_meta.phash)
+    matches, _ = similarity_index.index(current_user.id).search(target, distance)
+    candidate_ids = [match_id for _, match_id in matches if match_id != file_meta.id][:limit * 2]
+    if candidate_ids:
+        # Re-check against the rows themselves: the cached index may still hold deleted or replaced images
+        rows = FileMetadata.query.filter(FileMetadata.user_id == current_user.id,
+                                         FileMetadata.id.in_(candidate_ids), FileMetadata.phash != None).all()
+        similar = sorted((hamming(target, from_hex(f.phash)), f.id, f) for f in rows)
+        result['similar'] = [{'id': f.id, 'filename': f.filename, 'category': f.category, 'distance': d}
+                             for d, _, f in similar if d <= distance][:limit]
+    return jsonify(result)
+
+# --- VERSION HISTORY ---
+# Overwritten files keep their previous contents as chunked, deduplicated versions (versioning.py).
+# VERSION_HISTORY_LIMIT (50) versions per file, 0 disables history; VERSION_CHUNK_KB (64) average
+# chunk size — smaller dedups edits more finely but means more objects; VERSION_UPLOAD_CONCURRENCY (8).
+# Chunks no version uses any more are deleted once unused for VERSION_CHUNK_GRACE_SECONDS (3600), so a
+# snapshot running concurrently with the prune that dropped them can still use them.
+VERSION_HISTORY_LIMIT = int(os.environ.get('VERSION_HISTORY_LIMIT', 50))
+VERSION_UPLOAD_CONCURRENCY = int(os.environ.get('VERSION_UPLOAD_CONCURRENCY', 8))
+VERSION_CHUNK_GRACE_SECONDS = int(os.environ.get('VERSION_CHUNK_GRACE_SECONDS', 3600))
+version_chunker = versioning.Chunker(int(os.environ.get('VERSION_CHUNK_KB', 64)) * 1024)
+# The chunker is pure Python (~6 MB/s), so versioning a 16 MB file takes ~3 s of CPU. Overwrites commit
+# the new file first and version the replaced contents on version_queue, keeping the old blob until then.
+# One worker, so a file's versions are numbered in the order it was overwritten.
+version_queue = ThreadPoolExecutor(max_workers=1, thread_name_prefix='versioning')
+
+def snapshot_file(file_meta, uploaded):
+    """Keep a file's current contents as its newest version before they are replaced.
+
+    uploaded ({digest: size}) collects the chunk blobs stored on the way; if
+    the transaction rolls back, pass it to versioning.retire_chunks.
+    """
+    if not VERSION_HISTORY_LIMIT:
+        return
+    with open_file_blob(file_meta) as f:
+        number, pruned = versioning.snapshot(
+            db.session, storage, f, file_meta.user_id, file_meta.filename, version_chunker,
+            keep=VERSION_HISTORY_LIMIT, concurrency=VERSION_UPLOAD_CONCURRENCY, uploaded=uploaded,
+            file_size=file_meta.file_size, content_hash=file_meta.content_hash, tags=file_meta.tags,
+            category=file_meta.category, phash=file_meta.phash)
+    log.info("File version saved", extra={'file_name': file_meta.filename, 'version': number,
+                                          'new_chunks': len(uploaded), 'pruned_chunks': pruned})
+
+def replaced_contents(file_meta):
+    """What snapshot_file needs of a row about to be overwritten, detached from the session."""
+    return SimpleNamespace(**{column: getattr(file_meta, column) for column in (
+        's3_key', 'user_id', 'filename', 'file_size', 'content_hash', 'tags', 'category', 'phash')})
+
+def snapshot_replaced(replaced):
+    """Keep overwritten contents as versions, then delete their blobs. Runs on version_queue.
+
+    A blob whose contents could not be versioned is kept and recorded for
+    `orphan-cleanup` instead, so a storage hiccup doesn't lose the history.
+    """
+    with app.app_context():
+        for old in replaced:
+            uploaded = {}
+            try:
+                # Deleted meanwhile: its history is gone, so this version would be orphaned
+                if FileMetadata.query.filter_by(user_id=old.user_id, filename=old.filename).count():
+                    snapshot_file(old, uploaded)
+                    db.session.commit()
+            except Exception:
+                log.exception("Could not keep previous version", extra={'file_name': old.filename})
+                db.session.rollback()
+                try:
+                    versioning.retire_chunks(db.session, old.user_id, uploaded)
+                    db.session.commit()
+                except Exception:
+                    log.exception("Could not retire uploaded chunks", extra={'file_name': old.filename})
+                    db.session.rollback()
+                if old.s3_key:
+                    try:
+                        with db.engine.begin() as conn:
+                            migrations.record_orphaned_blobs(conn, [old.s3_key], 'replaced contents not versioned')
+                    except Exception:
+                        log.exception("Could not record unversioned blob", extra={'key': old.s3_key})
+                continue
+            if old.s3_key:
+                for key, err in storage.delete_many([old.s3_key]).items():
+                    log.warning("Could not remove replaced blob %s: %s", key, err)
+                if blob_cache:
+                    blob_cache.invalidate(old.s3_key)
+    reap_chunks()
+
+def reap_chunks():
+    """Delete the chunk blobs that have been unused for longer than the grace period. Runs on version_queue."""
+    with app.app_context():
+        while True:
+            try:
+                keys = versioning.reap_chunks(db.session, VERSION_CHUNK_GRACE_SECONDS)
+                errors = storage.delete_many(keys)
+                db.session.commit()
+            except Exception:
+                log.exception("Could not reap unused chunks")
+                db.session.rollback()
+                return
+            for key, err in errors.items():
+                log.warning("Could not remove chunk %s: %s", key, err)
+            if len(keys) < versioning.LOOKUP_BATCH:
+                return
+
+def version_or_404(file_id, number):
+    file_meta = FileMetadata.query.filter_by(id=file_id, user_id=current_user.id).first_or_404()
+    version = FileVersion.query.filter_by(user_id=current_user.id, filename=file_meta.filename,
+                                          version=number).first_or_404()
+    return file_meta, version
+
+@app.route('/versions/<int:file_id>')
+@login_required
+@read_only_route
+def file_versions(file_id):
+    """Previous versions of a file, newest first, with the storage each one added."""
+    file_meta = FileMetadata.query.filter_by(id=file_id, user_id=current_user.id).first_or_404()
+    versions = FileVersion.query.filter_by(user_id=current_user.id, filename=file_meta.filename) \
+        .order_by(FileVersion.version.desc()).all()
+    return jsonify({
+        'file_id': file_meta.id,
+        'filename': file_meta.filename,
+        'file_size': file_meta.file_size,
+        'history_bytes': sum(v.stored_bytes for v in versions),
+        'versions': [{'version': v.version, 'file_size': v.file_size, 'stored_bytes': v.stored_bytes,
+                      'category': v.category, 'created_at': v.created_at.isoformat() + 'Z'} for v in versions],
+    })
+
+@app.route('/versions/<int:file_id>/<int:number>/download')
+@login_required
+@read_only_route
+def download_file_version(file_id, number):
+    """Stream a previous version, reassembled from its chunks as they are fetched."""
+    file_meta, version = version_or_404(file_id, number)
+    chunks = versioning.chunk_list(db.session, version.id)
+    name, dot, ext = file_meta.filename.rpartition('.')
+    download_name = f"{name} (v{number}){dot}{ext}" if dot else f"{ext} (v{number})"
+    return Response(
+        stream_with_context(versioning.iter_chunks(storage, current_user.id, chunks)),
+        mimetype=mimetypes.guess_type(file_meta.filename)[0] or 'application/octet-stream',
+        headers={
+            'Content-Length': str(sum(size for _, size in chunks)),
+            'Content-Disposition': f'attachment; filename="{secure_filename(download_name) or "download"}"',
+        }
+    )
+
+@app.route('/versions/<int:file_id>/<int:number>/restore', methods=['POST'])
+@login_required
+def restore_file_version(file_id, number):
+    """Make a previous version current again. The contents it replaces become a version themselves."""
+    file_meta, version = version_or_404(file_id, number)
+    if file_meta.content_hash and file_meta.content_hash == version.content_hash:
+        flash(f"'{file_meta.filename}' already has the contents of version {number}.", 'success')
+        return redirect(request.referrer or url_for('index'))
+
+    s3_key = f"user_{current_user.id}/{secrets.token_hex(12)}_{file_meta.filename}"
+    reader = versioning.ChunkReader(versioning.iter_chunks(
+        storage, current_user.id, versioning.chunk_list(db.session, version.id)))
+    try:
+        with reader:
+            storage.save(s3_key, io.BufferedReader(reader, versioning.READ_BLOCK))
+    except (StorageError, versioning.VersionError) as e:
+        log.error("Version restore failed: %s", e)
+        storage.delete(s3_key)
+        flash(f"Could not restore version {number}: {e}", 'error')
+        return redirect(request.referrer or url_for('index'))
+
+    replaced = [replaced_contents(file_meta)] if VERSION_HISTORY_LIMIT else []
+    try:
+        old_key = file_meta.s3_key
+        for column in ('file_size', 'content_hash', 'tags', 'category', 'phash'):
+            setattr(file_meta, column, getattr(version, column))
+        file_meta.s3_key = s3_key
+        replace_file_tags(db.session, [(file_meta.id, file_meta.user_id, version.tags or '')])
         db.session.commit()
-        flash(f"File '{file.filename}' uploaded and analyzed successfully!", 'success')
-        
+        shared_files.invalidate(file_meta.id)
     except Exception as e:
-        print(f"❌ Upload error: {e}")
+        log.exception("Version restore metadata write failed")
+        db.session.rollback()
+        storage.delete_many([s3_key])
+        flash(f"Could not restore version {number}: {e}", 'error')
+        return redirect(request.referrer or url_for('index'))
+
+    if replaced:
+        version_queue.submit(snapshot_replaced, replaced)  # Deletes old_key once versioned
+    elif old_key:
+        for key, err in storage.delete_many([old_key]).items():
+            log.warning("Could not remove blob %s: %s", key, err)
+        if blob_cache:
+            blob_cache.invalidate(old_key)
+    similarity_index.invalidate(current_user.id)
+    flash(f"Restored version {number} of '{file_meta.filename}'.", 'success')
+    return redirect(request.referrer or url_for('index'))
+
+def commit_uploads(rows):
+    """Register stored uploads ({filename: metadata row}) in one transaction.
+
+    Files being overwritten keep their current contents as a version (unless
+    nothing changed), recorded on version_queue after the commit. On failure
+    the new blobs are deleted and the exception re-raised; after the commit
+    the replaced blobs that aren't waiting to be versioned are deleted.
+    """
+    user_id = next(iter(rows.values()))['user_id']
+    try:
+        # Locked (on Postgres) until the commit, so a concurrent upload of the same name waits and then
+        # sees this one's key as the one it replaces, instead of both replacing the same old blob
+        previous = FileMetadata.query.filter(FileMetadata.user_id == user_id,
+                                             FileMetadata.filename.in_(list(rows))).with_for_update().all()
+        previous_ids = [file_meta.id for file_meta in previous]
+        replaced = [replaced_contents(file_meta) for file_meta in previous if VERSION_HISTORY_LIMIT and (
+            not file_meta.content_hash or file_meta.content_hash != rows[file_meta.filename]['content_hash'])]
+        replaced_keys = [file_meta.s3_key for file_meta in previous
+                         if file_meta.s3_key and file_meta.s3_key != rows[file_meta.filename]['s3_key']]
+        upsert_file_metadata(list(rows.values()))
+        tagged = [row for row in rows.values() if row['tags']]
+        if tagged:
+            file_ids = dict(db.session.query(FileMetadata.filename, FileMetadata.id).filter(
+                FileMetadata.user_id == user_id,
+                FileMetadata.filename.in_([row['filename'] for row in tagged])
+            ).all())
+            replace_file_tags(db.session, [(file_ids[row['filename']], row['user_id'], row['tags']) for row in tagged])
+        db.session.commit()
+        shared_files.invalidate(*previous_ids)
+        if any(row['phash'] for row in rows.values()):
+            similarity_index.invalidate(user_id)
+    except Exception:
+        db.session.rollback()
+        storage.delete_many([row['s3_key'] for row in rows.values()])
+        raise
+    
+    # The previous blobs for these filenames are no longer referenced; snapshot_replaced deletes the
+    # ones it versions once their contents live on as chunks
+    if replaced:
+        version_queue.submit(snapshot_replaced, replaced)
+    versioned_keys = {old.s3_key for old in replaced}
+    unversioned_keys = [key for key in replaced_keys if key not in versioned_keys]
+    if unversioned_keys:
+        for key, err in storage.delete_many(unversioned_keys).items():
+            log.warning("Could not remove replaced blob %s: %s", key, err)
+        if blob_cache:
+            for key in unversioned_keys:
+                blob_cache.invalidate(key)
+
+@app.route('/upload', methods=['POST'])
+@login_required
+def upload_file():
+    files = [f for f in request.files.getlist('file') if f.filename]
+    if not files:
+        flash('No selected file', 'error')
+        return redirect(url_for('index'))
+    
+    rows = {}
+    for file in files:
+        try:
+            row = store_and_analyze(file)
+        except Exception as e:
+            log.exception("Upload failed", extra={'file_name': file.filename})
+            flash(f"Upload failed for '{file.filename}': {str(e)}", 'error')
+            continue
+        if file.filename in rows:
+            # Same name twice in one batch: the later file wins, as sequential uploads would
+            storage.delete_many([rows[file.filename]['s3_key']])
+        rows[file.filename] = row
+    if not rows:
+        return redirect(url_for('index'))
+    
+    try:
+        commit_uploads(rows)
+    except Exception as e:
+        log.exception("Upload metadata write failed")
         flash(f'Upload failed: {str(e)}', 'error')
-    finally:
-        # Clean up temp file with retry (file may be locked)
-        import gc
-        gc.collect()  # Force garbage collection to release file handles
-        import time
-        for attempt in range(3):
-            try:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                break
-            except PermissionError:
-                time.sleep(0.5)  # Wait and retry
+        return redirect(url_for('index'))
     
+    if len(rows) == 1:
+        flash(f"File '{next(iter(rows))}' uploaded and analyzed successfully!", 'success')
+    else:
+        flash(f"{len(rows)} files uploaded and analyzed successfully!", 'success')
     return redirect(url_for('index'))
 
+# --- DIRECT-TO-STORAGE UPLOADS ---
+# With S3, the browser uploads straight to the bucket with a presigned POST (direct_upload.py) and the
+# web worker only registers the file; analysis runs afterwards on a small thread pool, reading just the
+# bytes it needs with ranged GETs. The bucket needs a CORS rule allowing POST from the app's origin.
+# DIRECT_UPLOADS (true), DIRECT_UPLOAD_MAX_MB (16), DIRECT_UPLOAD_EXPIRES_SECONDS (900), ANALYSIS_WORKERS (2).
+# UPLOAD_TICKET_SECRET must be identical on every worker (defaults to SECRET_KEY).
+DIRECT_UPLOADS = os.environ.get('DIRECT_UPLOADS', 'true').lower() == 'true'
+DIRECT_UPLOAD_MAX_BYTES = int(os.environ.get('DIRECT_UPLOAD_MAX_MB', 16)) * 1024 * 1024
+DIRECT_UPLOAD_EXPIRES_SECONDS = int(os.environ.get('DIRECT_UPLOAD_EXPIRES_SECONDS', 900))
+upload_tickets = UploadTicketSigner(os.environ.get('UPLOAD_TICKET_SECRET') or app.config['SECRET_KEY'])
+@app.template_global()
+def direct_uploads_enabled():
+    return DIRECT_UPLOADS and USE_S3
+
+analysis_queue = ThreadPoolExecutor(max_workers=int(os.environ.get('ANALYSIS_WORKERS', 2)),
+                                    thread_name_prefix='analysis')
+
+def analyze_uploaded_file(user_id, filename, s3_key, size):
+    """Analyze a directly uploaded file and store the result. Runs on analysis_queue.
+
+    Only the leading bytes the analyzer needs are fetched. When that is the
+    whole object they also give the content hash and image hash; otherwise
+    the content hash comes from one more streamed read of the object.
+    """
+    temp_dir = tempfile.mkdtemp(prefix='analyze-')
+    with app.app_context():
+        try:
+            path = os.path.join(temp_dir, secure_filename(filename) or 'upload')
+            length = analysis_length(filename, size)
+            with open(path, 'wb') as out:
+                digest = fetch_prefix(storage, s3_key, length, out)
+            analysis_result = analyze_file(path, filename)
+            tags = analysis_result.get('tags') if analysis_result else None
+            category = analysis_result.get('category', 'Uncategorized') if analysis_result else 'Uncategorized'
+            
+            file_meta = FileMetadata.query.filter_by(user_id=user_id, filename=filename, s3_key=s3_key).first()
+            if file_meta is None:
+                log.info("Analyzed file was replaced or deleted meanwhile", extra={'file_name': filename})
+                return
+            file_meta.category = category
+            if tags:
+                # Like re-uploading, a replaced file keeps its previous tags if the analysis found none
+                file_meta.tags = ','.join(tags)
+                replace_file_tags(db.session, [(file_meta.id, user_id, file_meta.tags)])
+            if length == size:
+                file_meta.content_hash = digest
+                file_meta.phash = dhash_file(path)
+                if blob_cache:
+                    blob_cache.put_file(s3_key, path)
+            else:
+                file_meta.content_hash = hash_object(storage, s3_key)
+            db.session.commit()
+            if file_meta.phash:
+                similarity_index.invalidate(user_id)
+            log.info("File analyzed", extra={'file_name': filename, 'category': category,
+                                             'tag_count': len(tags or []), 'bytes_read': length})
+        except Exception:
+            log.exception("Background analysis failed", extra={'file_name': filename})
+            db.session.rollback()
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+@app.route('/upload/presign', methods=['POST'])
+@login_required
+def presign_uploads():
+    """Presigned POST policies for uploading files straight to storage.
+
+    Takes {"files": [{"name", "size", "type"}]} and returns {"uploads": [{"name",
+    "url", "fields", "ticket"}]}: the browser POSTs each file to url with fields
+    (file last), then sends the tickets to /upload/complete. 404 {"direct": false}
+    when the backend can't take direct uploads; /upload still works then.
+    """
+    if not DIRECT_UPLOADS:
+        return jsonify({'direct': False}), 404
+    files = (request.get_json(silent=True) or {}).get('files')
+    if not files or not isinstance(files, list):
+        return jsonify({'error': 'No files'}), 400
+    
+    uploads = []
+    for item in files:
+        name = str(item.get('name') or '') if isinstance(item, dict) else ''
+        size = item.get('size') if isinstance(item, dict) else None
+        if not name or len(name) > 300 or '/' in name or '\\' in name:
+            return jsonify({'error': f"Invalid file name '{name}'"}), 400
+        if not isinstance(size, int) or size <= 0:
+            return jsonify({'error': f"Invalid size for '{name}'"}), 400
+        if size > DIRECT_UPLOAD_MAX_BYTES:
+            return jsonify({'error': f"'{name}' is larger than {DIRECT_UPLOAD_MAX_BYTES // (1024 * 1024)} MB"}), 413
+        content_type = str(item.get('type') or '') or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        s3_key = f"user_{current_user.id}/{secrets.token_hex(12)}_{name}"
+        try:
+            post = storage.presigned_post(s3_key, DIRECT_UPLOAD_MAX_BYTES, content_type,
+                                          expires_in=DIRECT_UPLOAD_EXPIRES_SECONDS)
+        except StorageError as e:
+            log.error("Presigning upload failed: %s", e)
+            return jsonify({'error': 'Could not prepare the upload'}), 502
+        if post is None:
+            return jsonify({'direct': False}), 404
+        uploads.append({
+            'name': name,
+            'url': post['url'],
+            'fields': post['fields'],
+            'ticket': upload_tickets.issue(current_user.id, s3_key, name, DIRECT_UPLOAD_MAX_BYTES,
+                                           content_type, DIRECT_UPLOAD_EXPIRES_SECONDS),
+        })
+    return jsonify({'uploads': uploads})
+
+@app.route('/upload/complete', methods=['POST'])
+@login_required
+def complete_uploads():
+    """Register files uploaded through /upload/presign and queue their analysis.
+
+    Takes {"tickets": [...]} and returns {"files": [{"name", "status"}], "message"},
+    where status is 'registered' or an error message and message (when files
+    were registered) is for the dashboard to show.
+    """
+    tickets = (request.get_json(silent=True) or {}).get('tickets')
+    if not tickets or not isinstance(tickets, list):
+        return jsonify({'error': 'No tickets'}), 400
+    
+    rows, results = {}, []
+    for ticket in tickets:
+        try:
+            payload = upload_tickets.verify(ticket, current_user.id)
+        except InvalidUploadTicket as e:
+            results.append({'name': None, 'status': str(e)})
+            continue
+        name, s3_key = payload['n'], payload['k']
+        try:
+            size = storage.stat(s3_key)['size']
+        except StorageError:
+            results.append({'name': name, 'status': 'Upload not found in storage'})
+            continue
+        if size > payload['m']:
+            # The POST policy already enforces this; a second check costs nothing
+            storage.delete(s3_key)
+            results.append({'name': name, 'status': 'File too large'})
+            continue
+        if name in rows:
+            # Same name twice in one batch: the later file wins, as sequential uploads would
+            storage.delete_many([rows[name]['s3_key']])
+        rows[name] = {
+            'filename': name,
+            's3_key': s3_key,
+            'tags': '',
+            'category': 'Uncategorized',  # Until the queued analysis finishes
+            'file_size': size,
+            'content_hash': None,
+            'phash': None,
+            'user_id': current_user.id,
+        }
+        results.append({'name': name, 'status': 'registered'})
+    
+    if rows:
+        # Completing the same ticket twice must not snapshot the file onto itself
+        registered = {key for (key,) in db.session.query(FileMetadata.s3_key).filter(
+            FileMetadata.user_id == current_user.id,
+            FileMetadata.s3_key.in_([row['s3_key'] for row in rows.values()])
+        ).all()}
+        rows = {name: row for name, row in rows.items() if row['s3_key'] not in registered}
+    if rows:
+        try:
+            commit_uploads(rows)
+        except Exception as e:
+            log.exception("Upload metadata write failed")
+            return jsonify({'error': f'Upload failed: {e}'}), 500
+        for row in rows.values():
+            analysis_queue.submit(analyze_uploaded_file, current_user.id, row['filename'], row['s3_key'], row['file_size'])
+    
+    ok = sum(1 for r in results if r['status'] == 'registered')
+    body = {'files': results}
+    if rows:
+        body['message'] = f"{len(rows)} file(s) uploaded, AI analysis is running in the background."
+    return jsonify(body), 200 if ok else 400
+
 @app.route('/uploads/<filename>')
 @login_required
 def uploaded_file(filename):
     file_meta = FileMetadata.query.filter_by(filename=filename, user_id=current_user.id).first_or_404()
     
-    # If S3 enabled and file has S3 key, generate presigned URL
-    if USE_S3 and file_meta.s3_key and s3_client:
-        try:
-            url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': S3_BUCKET, 'Key': file_meta.s3_key},
-                ExpiresIn=3600  # URL valid for 1 hour
-            )
-            return redirect(url)
-        except ClientError as e:
-            print(f"❌ S3 presign error: {e}")
-            flash('Could not retrieve file from storage.', 'error')
-            return redirect(url_for('index'))
-    else:
-        # Fallback to local storage
-        user_folder = os.path.join(app.config['UPLOAD_FOLDER'], str(current_user.id))
-        return send_from_directory(user_folder, filename)
+    try:
+        return serve_file(file_meta)
+    except StorageError as e:
+        log.error("Storage read error: %s", e)
+        flash('Could not retrieve file from storage.', 'error')
+        return redirect(url_for('index'))
+
+# --- PREVIEWS ---
+# Thumbnails (sm/md/lg) and PDF/DOCX snippets rendered on first request and kept in an LRU disk cache
+# (previews.py). URLs carry the content hash, so responses are cached by browsers as immutable.
+# PREVIEW_CACHE_DIR (UPLOAD_FOLDER/previews), PREVIEW_CACHE_MAX_MB (256), PREVIEW_WORKERS (2)
+# renderings at once per worker, PREVIEW_WAIT_SECONDS (15) before answering 503 + Retry-After.
+PREVIEW_MAX_AGE = 365 * 24 * 3600
+PREVIEW_WAIT_SECONDS = float(os.environ.get('PREVIEW_WAIT_SECONDS', 15))
+preview_renderer = PreviewRenderer(
+    BlobCache(os.environ.get('PREVIEW_CACHE_DIR', os.path.join(UPLOAD_FOLDER, 'previews')),
+              max_bytes=int(os.environ.get('PREVIEW_CACHE_MAX_MB', 256)) * 1024 * 1024),
+    workers=int(os.environ.get('PREVIEW_WORKERS', 2))
+)
+
+def preview_token(file_meta):
+    """Short content-derived version for preview URLs; legacy rows without a hash use their storage key."""
+    if file_meta.content_hash:
+        return file_meta.content_hash[:20]
+    return hashlib.sha256(f"{file_meta.user_id}/{file_meta.s3_key or file_meta.filename}".encode()).hexdigest()[:20]
+
+@app.template_global()
+def preview_url(file_meta, variant='md'):
+    """URL of a thumbnail ('sm', 'md', 'lg') or document 'snippet', or None if the file type has none."""
+    kind = preview_kind(file_meta.filename)
+    if kind is None or (variant == 'snippet' and kind != 'document'):
+        return None
+    name = 'snippet.json' if variant == 'snippet' else f'{variant}.jpg'
+    return url_for('file_preview', file_id=file_meta.id, token=preview_token(file_meta), name=name)
+
+@app.route('/preview/<int:file_id>/<token>/<name>')
+@login_required
+@read_only_route
+def file_preview(file_id, token, name):
+    file_meta = FileMetadata.query.filter_by(id=file_id, user_id=current_user.id).first_or_404()
+    variant, _, ext = name.partition('.')
+    kind = preview_kind(file_meta.filename)
+    if kind is None or not ((variant in THUMBNAIL_SIZES and ext == 'jpg') or (variant == 'snippet' and ext == 'json' and kind == 'document')):
+        abort(404)
+    current = preview_token(file_meta)
+    if token != current:
+        # Stale URL from before the file was replaced; don't let the redirect itself be cached
+        response = redirect(url_for('file_preview', file_id=file_id, token=current, name=name))
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    # Only plain values cross into the render thread, not the ORM object
+    source = SimpleNamespace(user_id=file_meta.user_id, filename=file_meta.filename,
+                             s3_key=file_meta.s3_key, content_hash=file_meta.content_hash)
+    def render():
+        with local_blob_path(source) as path:
+            if variant == 'snippet':
+                return render_snippet(path)
+            if kind == 'image':
+                return render_image(path, THUMBNAIL_SIZES[variant])
+            return render_document(path, THUMBNAIL_SIZES[variant])
+    try:
+        path = preview_renderer.get(f"{current}-{name}", render, timeout=PREVIEW_WAIT_SECONDS)
+    except PreviewUnavailable:
+        abort(404)
+    except PreviewTimeout:
+        return Response('Preview is still being generated', status=503, headers={'Retry-After': '2'})
+
+    response = send_file(path, mimetype='application/json' if ext == 'json' else 'image/jpeg',
+                         etag=current + name, conditional=True)
+    response.headers['Cache-Control'] = f'private, max-age={PREVIEW_MAX_AGE}, immutable'
+    return response
 
 @app.route("/delete/<filename>", methods=["POST"])
 @login_required
@@ -398,77 +1325,447 @@ def delete_file(filename):
         flash('Error: File not found.', 'error')
         return redirect(url_for("index"))
     
-    # Delete from S3 if exists
-    if USE_S3 and metadata_to_delete.s3_key and s3_client:
+    # Delete from the storage backend
+    if metadata_to_delete.s3_key:
         try:
-            s3_client.delete_object(Bucket=S3_BUCKET, Key=metadata_to_delete.s3_key)
-            print(f"✅ File deleted from S3: {metadata_to_delete.s3_key}")
-        except ClientError as e:
-            print(f"❌ S3 delete error: {e}")
+            storage.delete(metadata_to_delete.s3_key)
+            if blob_cache:
+                blob_cache.invalidate(metadata_to_delete.s3_key)
+            log.info("File deleted from storage", extra={'key': metadata_to_delete.s3_key})
+        except StorageError as e:
+            log.error("Storage delete error: %s", e)
             flash('Could not delete file from cloud storage.', 'error')
             return redirect(url_for('index'))
     else:
-        # Fallback to local delete
+        # Legacy files saved before the blob store existed
         user_folder = os.path.join(app.config['UPLOAD_FOLDER'], str(current_user.id))
-        file_path = os.path.join(user_folder, filename)
+        file_path = os.path.join(user_folder, secure_filename(filename))
         if os.path.exists(file_path):
             os.remove(file_path)
     
-    # Delete from database
+    # Delete from database, with the file's version history
+    file_id = metadata_to_delete.id
+    delete_file_tags(db.session, [file_id])
+    versioning.delete_history(db.session, current_user.id, [filename])  # Its chunks are reaped later
     db.session.delete(metadata_to_delete)
     db.session.commit()
+    shared_files.invalidate(file_id)
     
     flash(f"File '{filename}' was successfully deleted.", 'success')
     return redirect(url_for("index"))
 
+@app.route('/reanalyze/<int:file_id>', methods=['POST'])
+@login_required
+def reanalyze_file(file_id):
+    """Run AI analysis again on a stored file and refresh its tags and category."""
+    file_meta = FileMetadata.query.filter_by(id=file_id, user_id=current_user.id).first_or_404()
+    try:
+        with local_blob_path(file_meta) as path:
+            analysis_result = analyze_file(path, file_meta.filename)
+            file_meta.phash = dhash_file(path)
+    except (StorageError, OSError) as e:
+        log.error("Re-analysis read error: %s", e)
+        flash('Could not read file from storage.', 'error')
+        return redirect(request.referrer or url_for('index'))
+    
+    tags = analysis_result.get('tags') if analysis_result else None
+    if tags:
+        file_meta.tags = ','.join(tags)
+        replace_file_tags(db.session, [(file_meta.id, file_meta.user_id, tags)])
+    file_meta.category = analysis_result.get('category', 'Uncategorized') if analysis_result else 'Uncategorized'
+    db.session.commit()
+    similarity_index.invalidate(current_user.id)  # phash was rewritten
+    flash(f"File '{file_meta.filename}' re-analyzed: {file_meta.category}", 'success')
+    return redirect(request.referrer or url_for('index'))
+
+# --- BULK FILE OPERATIONS ---
+def select_bulk_files():
+    """Resolve the files targeted by a bulk request: explicit file_ids, or every file in a category."""
+    payload = request.get_json(silent=True) or {}
+    file_ids = payload.get('file_ids') if request.is_json else request.form.getlist('file_ids')
+    category = payload.get('category') if request.is_json else request.form.get('category')
+    
+    query = FileMetadata.query.filter_by(user_id=current_user.id)
+    if file_ids:
+        ids = {int(i) for i in file_ids if str(i).isdigit()}
+        return query.filter(FileMetadata.id.in_(ids)).all() if ids else []
+    if category:
+        if category == 'Uncategorized':
+            return query.filter((FileMetadata.category == None) | (FileMetadata.category == '') |
+                                (FileMetadata.category == 'Uncategorized')).all()
+        return query.filter_by(category=category).all()
+    return []
+
+def bulk_response(results, action):
+    """Return a per-file JSON report for API callers, or flash a summary for the dashboard."""
+    failed = [r for r in results if r['status'] == 'error']
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'results': results, 'succeeded': len(results) - len(failed), 'failed': len(failed)})
+    
+    if not results:
+        flash('No files selected.', 'error')
+    elif failed:
+        names = ', '.join(r['filename'] for r in failed[:5])
+        flash(f"{action} {len(results) - len(failed)} files; {len(failed)} failed ({names}).", 'error')
+    else:
+        flash(f"{action} {len(results)} files.", 'success')
+    return redirect(request.referrer or url_for('index'))
+
+@app.route('/bulk/delete', methods=['POST'])
+@login_required
+def bulk_delete():
+    """Delete many files with batched storage calls and a single DELETE ... WHERE id IN (...)."""
+    files = select_bulk_files()
+    
+    storage_errors = storage.delete_many([f.s3_key for f in files if f.s3_key])
+    
+    results = []
+    deleted_ids = []
+    for f in files:
+        error = storage_errors.get(f.s3_key) if f.s3_key else None
+        if not f.s3_key:
+            # Legacy files saved before the blob store existed
+            legacy_path = os.path.join(app.config['UPLOAD_FOLDER'], str(f.user_id), secure_filename(f.filename))
+            try:
+                if os.path.exists(legacy_path):
+                    os.remove(legacy_path)
+            except OSError as e:
+                error = str(e)
+        if error:
+            results.append({'id': f.id, 'filename': f.filename, 'status': 'error', 'error': error})
+        else:
+            deleted_ids.append(f.id)
+            results.append({'id': f.id, 'filename': f.filename, 'status': 'deleted'})
+            if blob_cache and f.s3_key:
+                blob_cache.invalidate(f.s3_key)
+    
+    if deleted_ids:
+        delete_file_tags(db.session, deleted_ids)
+        deleted = set(deleted_ids)
+        versioning.delete_history(db.session, current_user.id, [f.filename for f in files if f.id in deleted])
+        FileMetadata.query.filter(
+            FileMetadata.user_id == current_user.id,
+            FileMetadata.id.in_(deleted_ids)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        shared_files.invalidate(*deleted_ids)
+    
+    log.info("Bulk delete", extra={'deleted': len(deleted_ids), 'failed': len(files) - len(deleted_ids)})
+    return bulk_response(results, 'Deleted')
+
+@app.route('/bulk/move', methods=['POST'])
+@login_required
+def bulk_move():
+    """Recategorize many files with a single UPDATE."""
+    payload = request.get_json(silent=True) or {}
+    target = ((payload.get('target_category') if request.is_json else request.form.get('target_category')) or '').strip()
+    if not target:
+        if request.is_json:
+            return jsonify({'error': 'target_category is required'}), 400
+        flash('Please choose a destination folder.', 'error')
+        return redirect(request.referrer or url_for('index'))
+    
+    files = select_bulk_files()
+    ids = [f.id for f in files]
+    if ids:
+        FileMetadata.query.filter(
+            FileMetadata.user_id == current_user.id,
+            FileMetadata.id.in_(ids)
+        ).update({FileMetadata.category: target}, synchronize_session=False)
+        db.session.commit()
+    
+    results = [{'id': f.id, 'filename': f.filename, 'status': 'moved', 'category': target} for f in files]
+    return bulk_response(results, f"Moved to '{target}':")
+
+@app.route('/download-zip')
+@login_required
+def download_zip():
+    """Stream a folder (?folder=Category) or a selection (?file_ids=1&file_ids=2) as a ZIP archive.
+
+    The archive is built on the fly as a chunked response, so memory stays flat
+    regardless of how many or how large the files are.
+    """
+    folder = request.args.get('folder')
+    ids = {int(i) for i in request.args.getlist('file_ids') if i.isdigit()}
+    
+    query = FileMetadata.query.filter_by(user_id=current_user.id)
+    if ids:
+        files = query.filter(FileMetadata.id.in_(ids)).all()
+        archive_name = 'selected-files.zip'
+    elif folder:
+        if folder == 'Uncategorized':
+            files = query.filter((FileMetadata.category == None) | (FileMetadata.category == '') |
+                                 (FileMetadata.category == 'Uncategorized')).all()
+        else:
+            files = query.filter_by(category=folder).all()
+        archive_name = f"{secure_filename(folder) or 'folder'}.zip"
+    else:
+        flash('Choose a folder or some files to download.', 'error')
+        return redirect(url_for('index'))
+    
+    if not files:
+        flash('No files to download.', 'error')
+        return redirect(request.referrer or url_for('index'))
+    
+    entries = [
+        ZipEntry(f.filename, (lambda f=f: open_file_blob(f)), size=f.file_size or None)
+        for f in files
+    ]
+    return Response(
+        stream_with_context(stream_zip(entries)),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="{archive_name}"',
+            'X-Accel-Buffering': 'no',  # Don't let a reverse proxy buffer the whole archive
+        }
+    )
+
 # --- FILE SHARING ROUTES ---
 @app.route('/share/<int:file_id>', methods=['POST'])
 @login_required
 def share_file(file_id):
+    """Issue a signed share link. Optional form fields: expires_hours (0 = never), max_uses (0 = unlimited)."""
     file_meta = FileMetadata.query.get_or_404(file_id)
     
     if file_meta.user_id != current_user.id:
         flash('You do not have permission to share this file.', 'error')
         return redirect(url_for('index'))
     
-    if not file_meta.share_token:
-        file_meta.share_token = secrets.token_urlsafe(16)
+    try:
+        expires_hours = int(request.form.get('expires_hours', SHARE_LINK_DEFAULT_HOURS))
+        max_uses = int(request.form.get('max_uses', 0))
+    except ValueError:
+        flash('Invalid share link options.', 'error')
+        return redirect(url_for('index'))
+    expires_hours = min(max(expires_hours, 0), SHARE_LINK_MAX_HOURS)
+    
+    token, payload = share_signer.issue(file_meta,
+                                        expires_in=expires_hours * 3600 or None,
+                                        max_uses=max(max_uses, 0) or None)
+    if 'm' in payload:
+        db.session.add(ShareLinkUse(jti=payload['j'], uses=0, max_uses=payload['m']))
         db.session.commit()
     
-    share_link = url_for('shared_file', token=file_meta.share_token, _external=True)
-    flash(f"Shareable Link: {share_link}", 'info')
+    share_link = url_for('shared_file', token=token, _external=True)
+    details = []
+    if 'e' in payload:
+        details.append(f"expires {datetime.fromtimestamp(payload['e'], tz=timezone.utc):%Y-%m-%d %H:%M} UTC")
+    if 'm' in payload:
+        details.append(f"{payload['m']} download{'s' if payload['m'] != 1 else ''}")
+    flash(f"Shareable Link: {share_link}" + (f" ({', '.join(details)})" if details else ''), 'info')
     return redirect(url_for('index'))
 
+@app.route('/share/<int:file_id>/revoke', methods=['POST'])
+@login_required
+def revoke_share_links(file_id):
+    """Invalidate every share link issued so far for a file."""
+    file_meta = FileMetadata.query.filter_by(id=file_id, user_id=current_user.id).first_or_404()
+    
+    revoked_at = now_ms()
+    revocation = db.session.get(ShareRevocation, file_id)
+    if revocation:
+        revocation.revoked_at = revoked_at
+    else:
+        db.session.add(ShareRevocation(file_id=file_id, revoked_at=revoked_at))
+    file_meta.share_token = None  # Legacy link, if any
+    db.session.commit()
+    share_revocations.mark_revoked(file_id, revoked_at)
+    
+    flash(f"All share links for '{file_meta.filename}' have been revoked.", 'success')
+    return redirect(request.referrer or url_for('index'))
+
 @app.route('/shared/<token>')
+@read_only_route
 def shared_file(token):
-    file_meta = FileMetadata.query.filter_by(share_token=token).first_or_404()
-    return render_template('shared_file.html', filename=file_meta.filename, token=token)
+    file_meta, payload = resolve_share_token(token)
+    expires_at = None
+    if payload and 'e' in payload:
+        expires_at = datetime.fromtimestamp(payload['e'], tz=timezone.utc)
+    # Only the owner sees analytics, so anonymous views stay off the database
+    stats = None
+    if current_user.is_authenticated and current_user.id == file_meta.user_id:
+        stats = share_link_stats(payload['j'] if payload else token)
+    return render_template('shared_file.html', filename=file_meta.filename, token=token,
+                           expires_at=expires_at, max_uses=payload.get('m') if payload else None,
+                           stats=stats)
+
+def serve_shared_file(file_meta, payload):
+    """serve_file for a share link, reloading the row once if the cached snapshot's blob is gone.
+
+    Returns (file actually served, response). The snapshot goes stale when
+    another worker overwrites or restores the file within the cache TTL.
+    """
+    try:
+        return file_meta, serve_file(file_meta)
+    except (StorageError, NotFound):
+        if payload is None:
+            raise
+        shared_files.invalidate(file_meta.id)
+        current = shared_files.get(file_meta.id)
+        if current is None or current.user_id != payload['u'] or current.s3_key == file_meta.s3_key:
+            raise
+    return current, serve_file(current)
 
 @app.route('/download_shared/<token>')
 def download_shared_file(token):
-    file_meta = FileMetadata.query.filter_by(share_token=token).first_or_404()
+    file_meta, payload = resolve_share_token(token)
+    if payload and 'm' in payload:
+        # Limited-use links: one conditional UPDATE claims a use atomically
+        claimed = claim_use(db.session, payload['j'])
+        db.session.commit()
+        if not claimed:
+            return "Error: This share link has reached its download limit.", 410
     
-    # If S3 enabled and file has S3 key, generate presigned URL
-    if USE_S3 and file_meta.s3_key and s3_client:
-        try:
-            url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': S3_BUCKET, 'Key': file_meta.s3_key},
-                ExpiresIn=3600
-            )
-            return redirect(url)
-        except ClientError as e:
-            print(f"❌ S3 shared presign error: {e}")
-            return "Error: Could not retrieve shared file.", 404
-    else:
-        # Fallback to local storage
-        user_folder = os.path.join(app.config['UPLOAD_FOLDER'], str(file_meta.user_id))
-        return send_from_directory(user_folder, file_meta.filename)
+    try:
+        file_meta, response = serve_shared_file(file_meta, payload)
+    except (StorageError, NotFound) as e:
+        log.error("Storage shared read error: %s", e, extra={'file_id': file_meta.id, 'key': file_meta.s3_key})
+        if payload and 'm' in payload:
+            release_use(db.session, payload['j'])  # Nothing was served
+            db.session.commit()
+        return "Error: Could not retrieve shared file.", 404
+    share_stats.record(payload['j'] if payload else token, file_meta.id, file_meta.file_size or 0)
+    return response
+
+@app.route('/share/stats')
+@login_required
+def share_stats_summary():
+    """Download analytics for all of the current user's share links."""
+    share_stats.flush()  # Include this worker's latest counts
+    rows = db.session.query(ShareLinkStat, FileMetadata.filename).join(
+        FileMetadata, FileMetadata.id == ShareLinkStat.file_id
+    ).filter(FileMetadata.user_id == current_user.id).order_by(ShareLinkStat.downloads.desc()).all()
+    return jsonify({'links': [
+        {
+            'link_id': stat.link_id,
+            'file_id': stat.file_id,
+            'filename': filename,
+            'downloads': stat.downloads,
+            'bytes_served': stat.bytes_served,
+            'last_access': stat.last_access.isoformat() + 'Z' if stat.last_access else None,
+        }
+        for stat, filename in rows
+    ]})
 
 # --- DEBUG ROUTES ---
 @app.route('/health')
 def health_check():
-    return {'status': 'healthy', 'message': 'Personal Cloud API is running'}
+    health = {'status': 'healthy', 'message': 'Personal Cloud API is running'}
+    if blob_cache:
+        health['blob_cache'] = blob_cache.stats()
+    health['user_cache'] = user_cache.stats()
+    return health
+
+# --- METRICS ---
+# Prometheus text format at /metrics. METRICS_DIR (unset = this worker only) is a directory shared by
+# the gunicorn workers, each writing its snapshot there every METRICS_FLUSH_SECONDS (5) so any worker
+# can serve the sum. METRICS_TOKEN, if set, must be sent as "Authorization: Bearer <token>".
+REQUEST_LATENCY = metrics.histogram('http_request_duration_seconds', 'Time to produce the response, by route',
+                                    ('route', 'method', 'status'))
+REQUEST_DB_QUERIES = metrics.histogram('http_request_db_queries', 'SQL statements executed per request',
+                                       ('route',), buckets=metrics.COUNT_BUCKETS)
+DB_QUERY_LATENCY = metrics.histogram('db_query_duration_seconds', 'SQL statement execution time')
+STORAGE_LATENCY = metrics.histogram('storage_request_duration_seconds', 'Object storage API call latency',
+                                    ('service', 'operation'))
+STORAGE_ERRORS = metrics.counter('storage_errors_total', 'Failed object storage API calls', ('service', 'operation', 'code'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+metrics_writer = None
+if os.environ.get('METRICS_DIR'):
+    metrics_writer = metrics.SnapshotWriter(metrics.REGISTRY, os.environ['METRICS_DIR'],
+                                            interval=float(os.environ.get('METRICS_FLUSH_SECONDS', 5)))
+    metrics_writer.start()
+
+if USE_S3:
+    metrics.instrument_boto_client(storage.client, STORAGE_LATENCY, STORAGE_ERRORS)
+
+def cache_stats():
+    caches = {'user': user_cache.stats()}
+    if blob_cache:
+        caches['blob'] = blob_cache.stats()
+    caches['preview'] = preview_renderer.cache.stats()
+    return {
+        'cache_hits_total': ('Cache lookups served from the cache', ('cache',),
+                             [((name, ), stats['hits']) for name, stats in caches.items()]),
+        'cache_misses_total': ('Cache lookups that fell through', ('cache',),
+                               [((name, ), stats['misses']) for name, stats in caches.items()]),
+    }
+metrics.REGISTRY.add_collector(cache_stats)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def time_query(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY_LATENCY.observe(time.perf_counter() - conn.info.pop('query_start', time.perf_counter()))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'request_started' in g:
+        # The URL rule, not the path, so IDs and filenames don't explode the label space
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.observe(time.perf_counter() - g.request_started,
+                                route=route, method=request.method, status=response.status_code)
+        REQUEST_DB_QUERIES.observe(g.get('db_queries', 0), route=route)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if METRICS_TOKEN and not secrets.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}"):
+        abort(401)
+    merged = metrics_writer.collect() if metrics_writer else metrics.local_collect()
+    return Response(metrics.render(merged), mimetype='text/plain; version=0.0.4')
+
+# --- SLOW-REQUEST PROFILER ---
+# Off unless PROFILER_ENABLED=true or switched on at runtime through /debug/profiler. A PROFILER_SAMPLE_RATE
+# (0.05) fraction of requests is stack-sampled every PROFILER_INTERVAL_MS (5); those slower than
+# PROFILER_THRESHOLD_MS (500) are written to PROFILER_OUTPUT_DIR (profiles) as folded stacks and logged with
+# their SQL counts and N+1 suspects (a SELECT repeated PROFILER_N_PLUS_ONE (5)+ times). Any request over
+# PROFILER_QUERY_BUDGET (20) statements is logged too. PROFILER_STATE_FILE shares runtime changes between workers.
+profiler = SlowRequestProfiler(
+    enabled=os.environ.get('PROFILER_ENABLED', 'false').lower() == 'true',
+    sample_rate=float(os.environ.get('PROFILER_SAMPLE_RATE', 0.05)),
+    threshold_ms=float(os.environ.get('PROFILER_THRESHOLD_MS', 500)),
+    interval_ms=float(os.environ.get('PROFILER_INTERVAL_MS', 5)),
+    output_dir=os.environ.get('PROFILER_OUTPUT_DIR', 'profiles'),
+    query_budget=int(os.environ.get('PROFILER_QUERY_BUDGET', 20)),
+    n_plus_one=int(os.environ.get('PROFILER_N_PLUS_ONE', 5)),
+    state_file=os.environ.get('PROFILER_STATE_FILE'),
+)
+profiler.init_app(app)
+PROFILER_TOKEN = os.environ.get('PROFILER_TOKEN')
+
+@app.route('/debug/profiler', methods=['GET', 'POST'])
+def profiler_settings():
+    """Read or change the profiler settings. Requires PROFILER_TOKEN as a bearer token."""
+    if not PROFILER_TOKEN:
+        abort(404)
+    if not secrets.compare_digest(request.headers.get('Authorization', ''), f"Bearer {PROFILER_TOKEN}"):
+        abort(401)
+    if request.method == 'GET':
+        return profiler.settings()
+    data = request.get_json(silent=True) or request.form
+    try:
+        enabled = data.get('enabled')
+        if isinstance(enabled, str):
+            enabled = enabled.lower() in ('1', 'true', 'yes', 'on')
+        sample_rate = float(data['sample_rate']) if data.get('sample_rate') is not None else None
+        threshold_ms = float(data['threshold_ms']) if data.get('threshold_ms') is not None else None
+    except (TypeError, ValueError):
+        return {'error': 'sample_rate and threshold_ms must be numbers'}, 400
+    if sample_rate is not None and not 0 <= sample_rate <= 1:
+        return {'error': 'sample_rate must be between 0 and 1'}, 400
+    settings = profiler.update(enabled=enabled, sample_rate=sample_rate, threshold_ms=threshold_ms)
+    # Nested: a top-level sample_rate would be read as the log sampling override and left out of the JSON
+    log.info("Profiler settings changed", extra={'profiler': settings})
+    return settings
 
 @app.route('/init-db')
 @login_required
@@ -485,7 +1782,7 @@ def init_database():
 @login_required
 def test_s3_upload():
     """Test route to upload a file to S3"""
-    if not USE_S3 or not s3_client or not S3_BUCKET:
+    if not USE_S3:
         return "❌ S3 not enabled or misconfigured", 400
     
     if 'file' not in request.files:
@@ -499,30 +1796,24 @@ def test_s3_upload():
         s3_key = f"user_{current_user.id}/{secrets.token_hex(12)}_{file.filename}"
         
         file.seek(0)
-        s3_client.upload_fileobj(
-            file,
-            S3_BUCKET,
-            s3_key,
-            ExtraArgs={'ContentType': file.content_type}
-        )
+        storage.save(s3_key, file, content_type=file.content_type)
         
-        print(f"✅ File uploaded to S3: {s3_key}")
+        log.info("Test file uploaded to S3", extra={'key': s3_key})
         return f"✅ File uploaded to S3 successfully!\nS3 Key: {s3_key}", 200
         
-    except ClientError as e:
-        print(f"❌ S3 upload error: {e}")
+    except StorageError as e:
+        log.error("S3 test upload error: %s", e)
         return f"❌ S3 upload failed: {e}", 500
 
 @app.route('/test-s3-list', methods=['GET'])
 @login_required
 def test_s3_list():
     """Test route to list objects in S3 bucket"""
-    if not USE_S3 or not s3_client or not S3_BUCKET:
+    if not USE_S3:
         return "❌ S3 not enabled or misconfigured", 400
     
     try:
-        resp = s3_client.list_objects_v2(Bucket=S3_BUCKET, MaxKeys=100)
-        items = resp.get('Contents', [])
+        items = storage.list(limit=100)
         
         if not items:
             return "<pre>✅ S3 bucket is empty (no objects yet)</pre>"
@@ -531,96 +1822,10 @@ def test_s3_list():
         html = "<pre>✅ S3 Objects in bucket:\n" + "\n".join(lines) + "</pre>"
         return html
         
-    except ClientError as e:
-        print(f"❌ S3 list error: {e}")
+    except StorageError as e:
+        log.error("S3 list error: %s", e)
         return f"❌ S3 list failed: {e}", 500
 
-@app.route('/migrate-fix-password-column')
-def migrate_fix_password_column():
-    """Widen password column to 512 chars to fix hash truncation on PostgreSQL"""
-    try:
-        with db.engine.connect() as conn:
-            conn.execute(db.text('ALTER TABLE "user" ALTER COLUMN password TYPE VARCHAR(512)'))
-            conn.commit()
-        return "✅ Password column widened to 512 chars. Existing users with truncated hashes must re-register.", 200
-    except Exception as e:
-        return f"❌ Migration failed: {str(e)}", 500
-
-@app.route('/migrate-all')
-def migrate_all():
-    """Run ALL database migrations at once. Safe to run multiple times."""
-    results = []
-    
-    migrations = [
-        ("password VARCHAR(512)", 'ALTER TABLE "user" ALTER COLUMN password TYPE VARCHAR(512)'),
-        ("s3_key column", "ALTER TABLE file_metadata ADD COLUMN s3_key VARCHAR(500)"),
-        ("category column", "ALTER TABLE file_metadata ADD COLUMN category VARCHAR(100)"),
-        ("file_size column", "ALTER TABLE file_metadata ADD COLUMN file_size INTEGER DEFAULT 0"),
-        ("share_token column", "ALTER TABLE file_metadata ADD COLUMN share_token VARCHAR(32)"),
-    ]
-    
-    with db.engine.connect() as conn:
-        for name, sql in migrations:
-            try:
-                conn.execute(db.text(sql))
-                conn.commit()
-                results.append(f"✅ {name}: added successfully")
-            except Exception as e:
-                conn.rollback()
-                if 'already exists' in str(e).lower() or 'duplicate column' in str(e).lower():
-                    results.append(f"✅ {name}: already exists (skipped)")
-                else:
-                    results.append(f"⚠️ {name}: {str(e)}")
-    
-    return "<pre>" + "\n".join(results) + "</pre>", 200
-
-@app.route('/migrate-add-s3-key')
-def migrate_add_s3_key():
-    """Add s3_key column to file_metadata table if it doesn't exist"""
-    try:
-        with db.engine.connect() as conn:
-            # SQLite doesn't support IF NOT EXISTS, so try-catch
-            try:
-                conn.execute(db.text("ALTER TABLE file_metadata ADD COLUMN s3_key VARCHAR(500)"))
-                conn.commit()
-            except Exception:
-                return "✅ s3_key column already exists", 200
-        return "✅ Migration successful: s3_key column added to file_metadata table", 200
-    except Exception as e:
-        return f"❌ Migration failed: {str(e)}", 500
-
-
-@app.route('/migrate-add-category')
-def migrate_add_category():
-    """Add category column to file_metadata table if it doesn't exist"""
-    try:
-        with db.engine.connect() as conn:
-            # SQLite doesn't support IF NOT EXISTS, so try-catch
-            try:
-                conn.execute(db.text("ALTER TABLE file_metadata ADD COLUMN category VARCHAR(100)"))
-                conn.commit()
-            except Exception:
-                return "✅ category column already exists", 200
-        return "✅ Migration successful: category column added to file_metadata table", 200
-    except Exception as e:
-        return f"❌ Migration failed: {str(e)}", 500
-
-
-@app.route('/migrate-add-filesize')
-def migrate_add_filesize():
-    """Add file_size column to file_metadata table if it doesn't exist"""
-    try:
-        with db.engine.connect() as conn:
-            try:
-                conn.execute(db.text("ALTER TABLE file_metadata ADD COLUMN file_size INTEGER DEFAULT 0"))
-                conn.commit()
-            except Exception:
-                return "✅ file_size column already exists", 200
-        return "✅ Migration successful: file_size column added to file_metadata table", 200
-    except Exception as e:
-        return f"❌ Migration failed: {str(e)}", 500
-
-
 @app.route('/migrate-categories')
 @login_required
 def migrate_categories():
@@ -676,14 +1881,105 @@ def recategorize_all():
         return f"❌ Recategorization failed: {str(e)}", 500
 
 
+# --- SCHEMA MIGRATIONS (CLI) ---
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Apply pending schema migrations (see migrations.py)."""
+    applied = migrations.upgrade(db.engine)
+    print(f"✅ Applied migrations: {applied}" if applied else "✅ Schema is up to date")
+
+@app.cli.command('phash-backfill')
+@click.option('--batch-size', default=200, show_default=True)
+def phash_backfill_command(batch_size):
+    """Compute perceptual hashes for images uploaded before they were recorded.
+
+    All-zero hashes are recomputed too: older versions stored them for flat images, which now get none.
+    """
+    last_id, hashed, scanned = 0, 0, 0
+    while True:
+        batch = FileMetadata.query.filter(FileMetadata.id > last_id,
+                                          db.or_(FileMetadata.phash == None, FileMetadata.phash == to_hex(0))) \
+            .order_by(FileMetadata.id).limit(batch_size).all()
+        if not batch:
+            break
+        last_id = batch[-1].id
+        for file_meta in batch:
+            if not file_meta.filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            scanned += 1
+            try:
+                with local_blob_path(file_meta) as path:
+                    file_meta.phash = dhash_file(path)
+            except (StorageError, OSError) as e:
+                log.warning("phash backfill could not read file %s: %s", file_meta.id, e)
+                continue
+            hashed += bool(file_meta.phash)
+        db.session.commit()
+        print(f"   hashed {hashed} of {scanned} images")
+    print(f"✅ Hashed {hashed} images")
+
+@app.cli.command('duplicate-report')
+@click.option('--distance', default=SIMILARITY_MAX_DISTANCE, show_default=True, help='max Hamming distance in bits')
+@click.option('--user-id', type=int, help='only this user')
+@click.option('--output', type=click.Path(dir_okay=False), help='also write the groups as JSON')
+def duplicate_report_command(distance, user_id, output):
+    """Group each user's near-duplicate images (transitively within --distance)."""
+    user_ids = [user_id] if user_id else [uid for (uid,) in db.session.query(FileMetadata.user_id).filter(
+        FileMetadata.phash != None).distinct()]
+    report = []
+    for uid in user_ids:
+        hashes = image_hashes(uid)
+        groups = duplicate_groups(hashes, distance)
+        if not groups:
+            continue
+        names = dict(db.session.query(FileMetadata.id, FileMetadata.filename).filter(
+            FileMetadata.id.in_([file_id for group in groups for file_id in group])).all())
+        print(f"👤 user {uid}: {len(groups)} groups among {len(hashes)} images")
+        for group in groups:
+            print(f"   {len(group)} × " + ', '.join(names[file_id] for file_id in group[:8]) + (' …' if len(group) > 8 else ''))
+        report.append({'user_id': uid, 'groups': [[{'id': file_id, 'filename': names[file_id]} for file_id in group]
+                                                  for group in groups]})
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"✅ {sum(len(r['groups']) for r in report)} duplicate groups across {len(report)} users")
+
+@app.cli.command('db-status')
+def db_status_command():
+    """List applied and pending schema migrations."""
+    done = migrations.applied_versions(db.engine)
+    for version, description, _, _ in migrations.MIGRATIONS:
+        print(f"{'✅' if version in done else '⏳'} {version:>3}  {description}")
+    orphaned = migrations.orphaned_blobs(db.engine)
+    if orphaned:
+        print(f"⚠️ {len(orphaned)} blobs left unreferenced by migrations or failed versioning; run `flask --app app orphan-cleanup`")
+
+@app.cli.command('orphan-cleanup')
+@click.option('--dry-run', is_flag=True, help='only list the keys')
+def orphan_cleanup_command(dry_run):
+    """Delete blobs that migrations or failed versioning left unreferenced (see migrations.record_orphaned_blobs)."""
+    migrations.forget_orphaned_blobs(db.engine)  # A file row points at it again; not an orphan
+    keys = migrations.orphaned_blobs(db.engine)
+    if dry_run:
+        for key in keys:
+            print(f"   {key}")
+        print(f"🔍 {len(keys)} orphaned blobs")
+        return
+    errors = storage.delete_many(keys)
+    for key, err in errors.items():
+        log.warning("Orphaned blob %s could not be deleted: %s", key, err)
+    migrations.forget_orphaned_blobs(db.engine, [key for key in keys if key not in errors])
+    print(f"✅ Deleted {len(keys) - len(errors)} orphaned blobs" + (f", {len(errors)} failed" if errors else ''))
+
+
 # --- DATABASE INITIALIZATION ---
 # This runs for BOTH Gunicorn (production) and direct execution (development)
 with app.app_context():
     try:
         db.create_all()
-        print("✅ Database tables created!")
+        log.info("Database tables created")
     except Exception as e:
-        print(f"⚠️ Database initialization error: {e}")
+        log.error("Database initialization error: %s", e)
         # Re-raise to prevent app from running with broken database
         raise
 
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+class HashingBusy(Exception):
+    """Raised when the password hashing pool is saturated."""
+
+
+class SlidingWindowLimiter:
+    """In-memory sliding-window rate limiter keyed by arbitrary strings.
+
+    Cheap enough to run before any password hashing. Limits apply per worker
+    process; with N gunicorn workers the effective ceiling is up to N times higher.
+    """
+
+    def __init__(self, max_events, window_seconds, max_keys=100000):
+        self.max_events = max_events
+        self.window = window_seconds
+        self.max_keys = max_keys
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        """Record an attempt. Returns False if key is over its limit (the attempt is not counted)."""
+        now = time.monotonic()
+        with self._lock:
+            events = self._events.get(key)
+            if events is None:
+                if len(self._events) >= self.max_keys:
+                    self._prune(now)
+                events = self._events[key] = deque()
+            while events and events[0] <= now - self.window:
+                events.popleft()
+            if len(events) >= self.max_events:
+                return False
+            events.append(now)
+            return True
+
+    def retry_after(self, key):
+        with self._lock:
+            events = self._events.get(key)
+            if not events:
+                return 0
+            return max(0, int(events[0] + self.window - time.monotonic()) + 1)
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+    def _prune(self, now):
+        cutoff = now - self.window
+        for key in [k for k, ev in self._events.items() if not ev or ev[-1] <= cutoff]:
+            del self._events[key]
+
+
+class PasswordHasher:
+    """Runs password hashing on a small bounded pool so floods can't pin every worker thread.
+
+    ``method`` is any werkzeug hash method string, e.g. ``pbkdf2:sha256:600000``
+    or ``scrypt:32768:8:1``. Stored hashes made with a different method are
+    reported by needs_rehash() so callers can upgrade them after a successful login.
+    """
+
+    def __init__(self, method='pbkdf2:sha256:600000', max_workers=2, max_pending=16, timeout=10):
+        self.method = method
+        self.timeout = timeout
+        self._params = _hash_params(method)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pw-hash')
+        # One slot per running or queued task, so the executor's queue never holds more than max_pending
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many concurrent password operations')
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # A caller that times out leaves the hash running; its slot stays taken until the work really ends
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy('Password operation timed out')
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        try:
+            return _hash_params(stored_hash.split('$', 1)[0]) != self._params
+        except ValueError:
+            return True
+
+
+def _hash_params(method):
+    """Normalize a werkzeug method string to (algorithm, *params), filling in werkzeug's defaults.
+
+    generate_password_hash stores the full parameters, so ``pbkdf2`` and
+    ``pbkdf2:sha256:600000`` describe the same stored hashes.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        if not args:
+            return ('scrypt', 2 ** 15, 8, 1)
+        if len(args) != 3:
+            raise ValueError("'scrypt' takes 3 arguments")
+        return ('scrypt', *map(int, args))
+    if name == 'pbkdf2':
+        if len(args) > 2:
+            raise ValueError("'pbkdf2' takes 2 arguments")
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return ('pbkdf2', hash_name, iterations)
+    raise ValueError(f"Invalid hash method '{method}'")
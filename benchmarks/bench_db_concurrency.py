@@ -0,0 +1,137 @@
+"""Database throughput under several concurrent worker processes.
+
+Simulates gunicorn workers (processes, each with a few request threads)
+running the app's read/write mix against one database, once with SQLAlchemy
+defaults and once with the db_profiles engine profile, and reports
+operations/second, p99 latency and errors (e.g. "database is locked").
+
+    python benchmarks/bench_db_concurrency.py
+    python benchmarks/bench_db_concurrency.py --workers 8 --threads 4 --seconds 10 --write-ratio 0.3
+    python benchmarks/bench_db_concurrency.py --database-url postgresql://localhost/bench
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from db_profiles import engine_options, install_sqlite_pragmas  # noqa: E402
+
+USERS = 50
+FILES_PER_USER = 200
+
+
+def make_engine(url, profile):
+    if profile == 'tuned':
+        engine = create_engine(url, **engine_options(url))
+        install_sqlite_pragmas(engine)
+        return engine
+    return create_engine(url)
+
+
+def setup(url):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text('DROP TABLE IF EXISTS bench_files'))
+        conn.execute(text(
+            'CREATE TABLE bench_files (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, '
+            'filename VARCHAR(300) NOT NULL, tags VARCHAR(500), file_size INTEGER)'))
+        conn.execute(text('CREATE UNIQUE INDEX uq_bench_files ON bench_files (user_id, filename)'))
+        conn.execute(text('INSERT INTO bench_files (id, user_id, filename, tags, file_size) VALUES (:id, :u, :f, :t, :s)'),
+                     [{'id': u * FILES_PER_USER + f, 'u': u, 'f': f"file_{f}", 't': 'a,b', 's': 1000}
+                      for u in range(USERS) for f in range(FILES_PER_USER)])
+    engine.dispose()
+    if url.startswith('sqlite'):
+        # Reset to the rollback journal so the default profile really runs without WAL
+        with create_engine(url).connect() as conn:
+            conn.exec_driver_sql('PRAGMA journal_mode=DELETE')
+
+
+def worker(url, profile, threads, seconds, write_ratio, queue):
+    engine = make_engine(url, profile)
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def run():
+        rng = random.Random()
+        local, local_errors = [], 0
+        while time.monotonic() < deadline:
+            user = rng.randrange(USERS)
+            start = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    if rng.random() < write_ratio:
+                        conn.execute(text('UPDATE bench_files SET tags = :t, file_size = file_size + 1 '
+                                          'WHERE user_id = :u AND filename = :f'),
+                                     {'t': f"t{rng.random()}", 'u': user, 'f': f"file_{rng.randrange(FILES_PER_USER)}"})
+                    else:
+                        conn.execute(text('SELECT * FROM bench_files WHERE user_id = :u'), {'u': user}).fetchall()
+                local.append(time.perf_counter() - start)
+            except Exception:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += local_errors
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    engine.dispose()
+    queue.put((latencies, errors[0]))
+
+
+def run_profile(url, profile, args):
+    setup(url)
+    queue = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(url, profile, args.threads, args.seconds, args.write_ratio, queue))
+             for _ in range(args.workers)]
+    for p in procs:
+        p.start()
+    latencies, errors = [], 0
+    for _ in procs:
+        lat, err = queue.get()
+        latencies.extend(lat)
+        errors += err
+    for p in procs:
+        p.join()
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0
+    print(f"  {profile:<8} {len(latencies) / args.seconds:10.0f} ops/s   p99 {p99:8.2f} ms   errors {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    temp_dir = None
+    url = args.database_url
+    if not url:
+        temp_dir = tempfile.mkdtemp(prefix='bench-db-')
+        url = f"sqlite:///{os.path.join(temp_dir, 'bench.db')}"
+    print(f"📊 {args.workers} workers x {args.threads} threads, {args.write_ratio:.0%} writes, "
+          f"{args.seconds:g}s per profile ({url.split(':', 1)[0]})")
+    try:
+        for profile in ('default', 'tuned'):
+            run_profile(url, profile, args)
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Upload path benchmark: multipart POST through the web worker vs presigned POST straight to S3.
+
+Runs the real app against an in-process moto server (or S3_ENDPOINT_URL) with
+Gemini replaced by benchmarks/fakes.FakeModel, and for each file size reports:
+  - form:   POST /upload — the worker receives the file, stores it and analyzes it
+  - direct: POST /upload/presign, the browser's POST to the bucket, POST /upload/complete,
+            then the queued analysis reading the object back with ranged GETs
+with the time the web worker is busy and the request bytes it has to receive.
+Text files are analyzed from a 64 KB prefix and hashed from one streamed GET; other types are read whole.
+
+    python benchmarks/bench_direct_upload.py
+    python benchmarks/bench_direct_upload.py --sizes-mb 1,4,12 --repeat 5
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BUCKET = 'bench-direct-upload'
+
+
+def start_s3_stand_in():
+    """Return (endpoint_url, stop_fn) for an S3-compatible endpoint."""
+    endpoint = os.environ.get('S3_ENDPOINT_URL')
+    if endpoint:
+        return endpoint, lambda: None
+    from moto.server import ThreadedMotoServer
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    return f"http://{host}:{port}", server.stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes-mb', default='1,4,12', help='file sizes (the form path is capped at 16 MB)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    endpoint, stop = start_s3_stand_in()
+    work = tempfile.mkdtemp(prefix='bench-direct-upload-')
+    os.environ.update(USE_S3='true', S3_BUCKET_NAME=BUCKET, S3_ENDPOINT_URL=endpoint,
+                      DIRECT_UPLOAD_MAX_MB='64', ANALYSIS_WORKERS='1',
+                      AWS_ACCESS_KEY_ID=os.environ.get('AWS_ACCESS_KEY_ID', 'bench'),
+                      AWS_SECRET_ACCESS_KEY=os.environ.get('AWS_SECRET_ACCESS_KEY', 'bench'),
+                      AWS_REGION=os.environ.get('AWS_REGION', 'us-east-1'))
+    os.chdir(work)
+    try:
+        import requests
+        import ai_utils
+        from benchmarks.fakes import FakeModel
+        ai_utils.model = FakeModel(latency=0)
+        import app as A
+
+        A.storage.client.create_bucket(Bucket=BUCKET)
+        client = A.app.test_client()
+        client.post('/signup', data={'username': 'bench', 'password': 'bench-password'})
+        client.post('/login', data={'username': 'bench', 'password': 'bench-password'})
+
+        print(f"📊 {args.repeat} upload(s) per size, S3 at {endpoint}")
+        print(f"  {'file':<16}{'path':<8}{'worker busy':>14}{'bytes via worker':>18}{'to S3':>10}{'analysis':>10}")
+        for size_mb in [float(s) for s in args.sizes_mb.split(',')]:
+            size = int(size_mb * 1024 * 1024)
+            for ext in ('.txt', '.bin'):
+                payload = (b'quarterly report line\n' * (size // 22 + 1))[:size] if ext == '.txt' else os.urandom(size)
+                form_busy = direct_busy = s3_time = analysis_time = 0.0
+                direct_bytes = 0
+                for i in range(args.repeat):
+                    name = f"form_{size_mb:g}mb_{i}{ext}"
+                    start = time.perf_counter()
+                    resp = client.post('/upload', data={'file': (io.BytesIO(payload), name)},
+                                       content_type='multipart/form-data')
+                    form_busy += time.perf_counter() - start
+                    assert resp.status_code == 302, resp.status_code
+
+                    name = f"direct_{size_mb:g}mb_{i}{ext}"
+                    body = json.dumps({'files': [{'name': name, 'size': size, 'type': 'application/octet-stream'}]})
+                    start = time.perf_counter()
+                    upload = client.post('/upload/presign', data=body, content_type='application/json').get_json()['uploads'][0]
+                    direct_busy += time.perf_counter() - start
+                    start = time.perf_counter()
+                    resp = requests.post(upload['url'], data=upload['fields'], files={'file': (name, payload)})
+                    s3_time += time.perf_counter() - start
+                    assert resp.ok, resp.status_code
+                    complete = json.dumps({'tickets': [upload['ticket']]})
+                    start = time.perf_counter()
+                    resp = client.post('/upload/complete', data=complete, content_type='application/json')
+                    direct_busy += time.perf_counter() - start
+                    assert resp.status_code == 200, resp.get_json()
+                    direct_bytes += len(body) + len(complete)
+                    start = time.perf_counter()
+                    A.analysis_queue.submit(lambda: None).result()  # Queued after the analysis; one worker
+                    analysis_time += time.perf_counter() - start
+                n = args.repeat
+                label = f"{size_mb:g} MB {ext}"
+                print(f"  {label:<16}{'form':<8}{form_busy / n * 1000:>11.0f} ms{size:>18,}{'-':>10}{'-':>10}")
+                print(f"  {'':<16}{'direct':<8}{direct_busy / n * 1000:>11.0f} ms{direct_bytes // n:>18,}"
+                      f"{s3_time / n * 1000:>7.0f} ms{analysis_time / n * 1000:>7.0f} ms")
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(work, ignore_errors=True)
+        stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Document extraction benchmark: parsing in the web process vs in the extraction pool.
+
+Generates text-heavy PDFs and measures, for a batch of parses:
+  - throughput in-process (EXTRACT_WORKERS=0, what analyze_file used to do) and with 1, 2, 4 workers
+  - the latency of a "request" thread doing a few ms of Python work in a loop while
+    the parses run, i.e. what GIL contention costs the other requests of a web worker
+  - how long a parse that exceeds the timeout holds its caller
+
+    python benchmarks/bench_extraction.py
+    python benchmarks/bench_extraction.py --pdfs 40 --pages 50 --workers 1,2,4,8
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyPDF2 import PdfWriter  # noqa: E402
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject  # noqa: E402
+from extract_pool import ExtractionPool  # noqa: E402
+
+CALLERS = 8  # Concurrent upload requests asking for extraction
+
+
+def make_pdf(path, pages, lines_per_page=60):
+    writer = PdfWriter()
+    page = writer.add_blank_page(612, 792)
+    font = DictionaryObject({NameObject('/Type'): NameObject('/Font'), NameObject('/Subtype'): NameObject('/Type1'),
+                             NameObject('/BaseFont'): NameObject('/Helvetica')})
+    page[NameObject('/Resources')] = DictionaryObject(
+        {NameObject('/Font'): DictionaryObject({NameObject('/F1'): writer._add_object(font)})})
+    text = b' '.join(b'0 -12 Td (Line %d of a quarterly report, lorem ipsum dolor sit amet.) Tj' % i
+                     for i in range(lines_per_page))
+    content = DecodedStreamObject()
+    content.set_data(b'BT /F1 10 Tf 40 760 Td ' + text + b' ET')
+    page[NameObject('/Contents')] = writer._add_object(content)
+    for _ in range(pages - 1):
+        writer.add_page(page)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+def request_latencies(stop):
+    """Time a small pure-Python unit of work over and over until stop is set (ms per unit)."""
+    samples = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        sum(i * i for i in range(20000))
+        samples.append((time.perf_counter() - start) * 1000)
+        time.sleep(0.005)
+    return samples
+
+
+def run_batch(pool, paths):
+    stop = threading.Event()
+    latencies = []
+    probe = threading.Thread(target=lambda: latencies.extend(request_latencies(stop)))
+    probe.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CALLERS) as callers:
+        results = list(callers.map(pool.extract_text, paths))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    probe.join()
+    assert all(r['error'] is None for r in results), [r for r in results if r['error']][:1]
+    return elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pdfs', type=int, default=16)
+    parser.add_argument('--pages', type=int, default=30)
+    parser.add_argument('--workers', default='1,2,4')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='bench-extraction-')
+    try:
+        template = os.path.join(work, 'report.pdf')
+        make_pdf(template, args.pages)
+        paths = []
+        for i in range(args.pdfs):
+            paths.append(os.path.join(work, f'report{i}.pdf'))
+            shutil.copyfile(template, paths[-1])
+        print(f"📊 {args.pdfs} PDFs x {args.pages} pages, {CALLERS} concurrent callers, {os.cpu_count()} CPU(s)")
+
+        stop = threading.Event()
+        timer = threading.Timer(1.0, stop.set)
+        timer.start()
+        idle = request_latencies(stop)
+        print(f"  idle request latency: p50 {statistics.median(idle):6.1f} ms")
+
+        for workers in [0] + [int(w) for w in args.workers.split(',')]:
+            pool = ExtractionPool(workers=workers, timeout=120)
+            if workers:
+                pool.extract_text(paths[0])  # Start the forkserver and workers outside the timing
+            elapsed, latencies = run_batch(pool, paths)
+            pool.shutdown()
+            label = 'in-process' if not workers else f"{workers} worker(s)"
+            p99 = statistics.quantiles(latencies, n=100)[98] if len(latencies) >= 2 else latencies[0]
+            print(f"  {label:>12}: {args.pdfs / elapsed:6.1f} PDFs/s   request latency p50 "
+                  f"{statistics.median(latencies):6.1f} ms  p99 {p99:6.1f} ms")
+
+        big = os.path.join(work, 'huge.pdf')
+        make_pdf(big, args.pages * 40)
+        pool = ExtractionPool(workers=1, timeout=1)
+        start = time.perf_counter()
+        result = pool.extract_text(big)
+        print(f"  {args.pages * 40}-page PDF with a 1s timeout: {result['error']} after "
+              f"{time.perf_counter() - start:.2f}s")
+        pool.shutdown()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Preview pipeline benchmark: what a dashboard of N photos costs with and without thumbnails.
+
+Generates camera-sized JPEGs and measures, for one page load:
+  - bytes the browser downloads: originals (what the dashboard used to <img>) vs md thumbnails
+  - cold rendering of every thumbnail through PreviewRenderer with 1, 2 and 4 workers,
+    with 8 concurrent "browser" connections like a real page load
+  - warm (cached) lookups
+  - a thundering herd: many concurrent requests for one uncached preview
+
+    python benchmarks/bench_previews.py
+    python benchmarks/bench_previews.py --images 200 --workers 1,2,4,8
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw  # noqa: E402
+from blob_cache import BlobCache  # noqa: E402
+from previews import PreviewRenderer, THUMBNAIL_SIZES, render_image  # noqa: E402
+
+BROWSER_CONNECTIONS = 8
+
+
+def make_photos(directory, count, rng):
+    paths = []
+    for i in range(count):
+        img = Image.new('RGB', (4000, 3000), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(40):
+            x, y = rng.randrange(3600), rng.randrange(2600)
+            draw.ellipse([x, y, x + rng.randint(50, 400), y + rng.randint(50, 400)],
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        path = os.path.join(directory, f'photo{i}.jpg')
+        img.save(path, 'JPEG', quality=90)
+        paths.append(path)
+    return paths
+
+
+def page_load(renderer, paths, size):
+    """Request every thumbnail over BROWSER_CONNECTIONS concurrent connections; returns seconds."""
+    def fetch(path):
+        return renderer.get(f"{os.path.basename(path)}-{size}", lambda: render_image(path, THUMBNAIL_SIZES[size]))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=BROWSER_CONNECTIONS) as browser:
+        list(browser.map(fetch, paths))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=60)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--herd', type=int, default=100, help='concurrent requests for one preview')
+    parser.add_argument('--seed', type=int, default=5)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    work = tempfile.mkdtemp(prefix='bench-previews-')
+    try:
+        print(f"📊 dashboard with {args.images} 4000x3000 JPEGs")
+        paths = make_photos(work, args.images, rng)
+        originals = sum(os.path.getsize(p) for p in paths)
+
+        for workers in [int(w) for w in args.workers.split(',')]:
+            cache_dir = os.path.join(work, f'cache{workers}')
+            renderer = PreviewRenderer(BlobCache(cache_dir, 512 * 1024 * 1024), workers=workers)
+            cold = page_load(renderer, paths, 'md')
+            warm = page_load(renderer, paths, 'md')
+            thumbs = renderer.cache.stats()['bytes']
+            print(f"  {workers} worker(s): cold page {cold:6.2f}s ({cold / len(paths) * 1000:5.0f} ms/thumb)   "
+                  f"warm page {warm * 1000:6.1f} ms   bytes {originals / 1024 / 1024:6.1f} MB originals -> "
+                  f"{thumbs / 1024:6.0f} KB thumbnails")
+
+        renders = []
+        lock = threading.Lock()
+
+        def render():
+            with lock:
+                renders.append(1)
+            return render_image(paths[0], THUMBNAIL_SIZES['lg'])
+        renderer = PreviewRenderer(BlobCache(os.path.join(work, 'herd'), 64 * 1024 * 1024), workers=2)
+        start = time.perf_counter()
+        threads = [threading.Thread(target=renderer.get, args=('herd-lg', render)) for _ in range(args.herd)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        print(f"  herd: {args.herd} concurrent requests for one uncached preview -> {len(renders)} rendering(s), "
+              f"{time.perf_counter() - start:.2f}s")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
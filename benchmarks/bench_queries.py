@@ -0,0 +1,140 @@
+"""Query benchmark for the file_metadata access paths, before and after migrations.
+
+Builds a database with the pre-migration schema (no indexes beyond primary
+keys), seeds it, times the listing, lookup, category and delete paths the
+routes use, then runs migrations.upgrade() and times them again.
+
+    python benchmarks/bench_queries.py
+    python benchmarks/bench_queries.py --users 200 --files-per-user 500 --iterations 300
+    python benchmarks/bench_queries.py --database-url postgresql://localhost/bench   # must be an empty database
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text  # noqa: E402
+import migrations  # noqa: E402
+
+CATEGORIES = ['Documents', 'Images', 'Finance', 'Code', 'Travel', 'Work', 'Personal', 'Uncategorized']
+
+LEGACY_SCHEMA = [
+    'CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR(150) UNIQUE NOT NULL, password VARCHAR(512) NOT NULL)',
+    'CREATE TABLE file_metadata (id INTEGER PRIMARY KEY, filename VARCHAR(300) NOT NULL, tags VARCHAR(500), '
+    'user_id INTEGER NOT NULL REFERENCES "user"(id))',
+]
+
+
+def seed(engine, users, files_per_user):
+    with engine.begin() as conn:
+        for ddl in LEGACY_SCHEMA:
+            conn.execute(text(ddl))
+        conn.execute(text('INSERT INTO "user" (id, username, password) VALUES (:id, :u, :p)'),
+                     [{'id': u, 'u': f"user{u}", 'p': 'x'} for u in range(1, users + 1)])
+    # Legacy databases picked up the remaining columns through ALTER TABLE
+    migrations.upgrade(engine, target=2)
+    rows = []
+    file_id = 0
+    for f in range(files_per_user):
+        for u in range(1, users + 1):  # Interleaved, as real uploads arrive
+            file_id += 1
+            rows.append({'id': file_id, 'fn': f"file_{f}.pdf", 'tags': 'a,b,c', 'u': u,
+                         'cat': random.choice(CATEGORIES), 'size': random.randint(1000, 10 ** 6)})
+    with engine.begin() as conn:
+        conn.execute(text(
+            'INSERT INTO file_metadata (id, filename, tags, user_id, category, file_size) '
+            'VALUES (:id, :fn, :tags, :u, :cat, :size)'), rows)
+    return file_id
+
+
+def time_query(engine, sql, params_fn, iterations):
+    samples = []
+    with engine.connect() as conn:
+        for _ in range(iterations):
+            params = params_fn()
+            start = time.perf_counter()
+            conn.execute(text(sql), params).fetchall()
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def time_delete(engine, users, files_per_user, iterations, next_id):
+    """Delete-by-(user_id, filename) followed by re-inserting the row, as a replace-on-upload does."""
+    samples = []
+    with engine.connect() as conn:
+        for i in range(iterations):
+            u, f = random.randint(1, users), random.randrange(files_per_user)
+            start = time.perf_counter()
+            conn.execute(text('DELETE FROM file_metadata WHERE user_id = :u AND filename = :fn'),
+                         {'u': u, 'fn': f"file_{f}.pdf"})
+            samples.append((time.perf_counter() - start) * 1000)
+            conn.execute(text('INSERT INTO file_metadata (id, filename, tags, user_id, category, file_size) '
+                              'VALUES (:id, :fn, :tags, :u, :cat, 0)'),
+                         {'id': next_id + i + 1, 'fn': f"file_{f}.pdf", 'tags': '', 'u': u, 'cat': 'Work'})
+            conn.commit()
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def run_suite(engine, args, next_id):
+    user = lambda: random.randint(1, args.users)  # noqa: E731
+    results = {
+        'listing (user_id)': time_query(
+            engine, 'SELECT * FROM file_metadata WHERE user_id = :u',
+            lambda: {'u': user()}, args.iterations),
+        'storage sum (user_id)': time_query(
+            engine, 'SELECT SUM(file_size) FROM file_metadata WHERE user_id = :u',
+            lambda: {'u': user()}, args.iterations),
+        'lookup (user_id, filename)': time_query(
+            engine, 'SELECT * FROM file_metadata WHERE user_id = :u AND filename = :fn',
+            lambda: {'u': user(), 'fn': f"file_{random.randrange(args.files_per_user)}.pdf"}, args.iterations),
+        'folder (user_id, category)': time_query(
+            engine, 'SELECT * FROM file_metadata WHERE user_id = :u AND category = :c',
+            lambda: {'u': user(), 'c': random.choice(CATEGORIES)}, args.iterations),
+        'delete (user_id, filename)': time_delete(engine, args.users, args.files_per_user, args.iterations, next_id),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--files-per-user', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+    random.seed(42)
+
+    temp_dir = None
+    url = args.database_url
+    if not url:
+        temp_dir = tempfile.mkdtemp(prefix='bench-queries-')
+        url = f"sqlite:///{os.path.join(temp_dir, 'bench.db')}"
+    engine = create_engine(url)
+
+    total = seed(engine, args.users, args.files_per_user)
+    print(f"📊 {total} file rows across {args.users} users ({engine.dialect.name})\n")
+
+    before = run_suite(engine, args, next_id=total)
+    migrations.upgrade(engine)
+    after = run_suite(engine, args, next_id=total + args.iterations)
+
+    print(f"\n  {'query':<28} {'before p50/p99 ms':>20} {'after p50/p99 ms':>20} {'speedup':>8}")
+    for name in before:
+        b, a = before[name], after[name]
+        print(f"  {name:<28} {b[0]:9.3f} /{b[1]:8.3f} {a[0]:9.3f} /{a[1]:8.3f} {b[0] / a[0]:7.1f}x")
+
+    engine.dispose()
+    if temp_dir:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
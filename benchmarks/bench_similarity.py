@@ -0,0 +1,166 @@
+"""Near-duplicate lookup benchmark: multi-index hashing vs BK-tree vs linear scan over 64-bit dHashes.
+
+Builds a library of perceptual hashes shaped like a real photo collection —
+mostly unrelated images plus bursts/re-saves of the same shot (a few flipped
+bits each) — and times index build, radius queries at several Hamming
+distances and the full duplicate report. The BK-tree is the textbook
+alternative, kept here to show why similarity.py doesn't use it. Also times dHash itself on generated
+JPEGs, since that cost is paid on every image upload.
+
+    python benchmarks/bench_similarity.py
+    python benchmarks/bench_similarity.py --count 100000 --queries 500 --distances 4,8,10
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw  # noqa: E402
+from similarity import MultiIndexHash, dhash, duplicate_groups, hamming, HASH_BITS  # noqa: E402
+
+
+class BKTree:
+    """Metric tree keyed by distance to the parent; each node is [hash, items, {distance: child}]."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = (value ^ node[0]).bit_count()
+            if d == 0:
+                node[1].append(item)
+                return
+            if d not in node[2]:
+                node[2][d] = [value, [item], {}]
+                return
+            node = node[2][d]
+
+    def search(self, value, max_distance):
+        found, visited, stack = [], 0, [self.root]
+        while stack:
+            node = stack.pop()
+            visited += 1
+            d = (value ^ node[0]).bit_count()
+            if d <= max_distance:
+                found.extend((d, item) for item in node[1])
+            for dist, child in node[2].items():
+                if d - max_distance <= dist <= d + max_distance:
+                    stack.append(child)
+        return found, visited
+
+
+def build(cls, entries):
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = cls()
+    for item, value in entries:
+        index.add(value, item)
+    elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+    tracemalloc.stop()
+    print(f"  {cls.__name__:<15} build {elapsed:5.2f}s   memory {memory:6.1f} MB")
+    return index
+
+
+def time_queries(index, queries, distance):
+    times, work = [], []
+    for value in queries:
+        t0 = time.perf_counter()
+        found, checked = index.search(value, distance)
+        times.append(time.perf_counter() - t0)
+        work.append(checked)
+    return times, work
+
+
+def synthetic_library(count, burst_fraction, rng):
+    """[(id, hash)]: unrelated hashes, plus bursts of 2-6 near-copies (1-6 bits flipped)."""
+    entries = []
+    while len(entries) < count:
+        base = rng.getrandbits(HASH_BITS)
+        entries.append((len(entries), base))
+        if rng.random() < burst_fraction:
+            for _ in range(rng.randint(1, 5)):
+                value = base
+                for bit in rng.sample(range(HASH_BITS), rng.randint(1, 6)):
+                    value ^= 1 << bit
+                entries.append((len(entries), value))
+    return entries[:count]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def bench_dhash(count, rng):
+    images = []
+    for _ in range(count):
+        im = Image.new('RGB', (1600, 1200), 'white')
+        draw = ImageDraw.Draw(im)
+        for _ in range(40):
+            x, y = rng.randint(0, 1400), rng.randint(0, 1000)
+            draw.ellipse([x, y, x + rng.randint(20, 200), y + rng.randint(20, 200)], fill=(rng.randint(0, 255),) * 3)
+        buf = io.BytesIO()
+        im.save(buf, 'JPEG', quality=85)
+        images.append(buf.getvalue())
+    start = time.perf_counter()
+    for data in images:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft('L', (64, 64))
+            dhash(img)
+    per_image = (time.perf_counter() - start) / count * 1000
+    print(f"  dHash of a 1600x1200 JPEG: {per_image:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--distances', default='4,8,10')
+    parser.add_argument('--burst-fraction', type=float, default=0.2, help='share of shots with near-copies')
+    parser.add_argument('--images', type=int, default=50, help='JPEGs for the dHash timing')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"📊 {args.count} hashes, {args.queries} queries per distance")
+    entries = synthetic_library(args.count, args.burst_fraction, rng)
+
+    mih = build(MultiIndexHash, entries)
+    bk = build(BKTree, entries)
+
+    queries = [value for _, value in rng.sample(entries, args.queries)]
+    for distance in [int(d) for d in args.distances.split(',')]:
+        mih_times, checked = time_queries(mih, queries, distance)
+        bk_times, visited = time_queries(bk, queries[:max(len(queries) // 10, 5)], distance)
+        scan_times = []
+        for value in queries[:max(len(queries) // 10, 5)]:
+            t0 = time.perf_counter()
+            linear = [item for item, other in entries if hamming(value, other) <= distance]
+            scan_times.append(time.perf_counter() - t0)
+            assert len(linear) == len(mih.search(value, distance)[0]), "index and linear scan disagree"
+        print(f"  k={distance:<3} multi-index p50 {percentile(mih_times, 0.5) * 1000:6.2f} ms "
+              f"p99 {percentile(mih_times, 0.99) * 1000:6.2f} ms (checks {sum(checked) / len(checked) / len(entries):5.1%})   "
+              f"BK-tree p50 {percentile(bk_times, 0.5) * 1000:6.2f} ms (visits {sum(visited) / len(visited) / len(entries):5.1%})   "
+              f"linear p50 {percentile(scan_times, 0.5) * 1000:6.2f} ms")
+
+    for distance in [int(d) for d in args.distances.split(',')][:2]:
+        start = time.perf_counter()
+        groups = duplicate_groups(entries, distance)
+        print(f"  duplicate report k={distance}: {len(groups)} groups in {time.perf_counter() - start:.1f}s")
+
+    bench_dhash(args.images, rng)
+
+
+if __name__ == '__main__':
+    main()
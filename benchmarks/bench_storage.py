@@ -0,0 +1,128 @@
+"""Storage backend throughput benchmark.
+
+Measures upload/download throughput for large files and for many concurrent
+workers against the local blob store and an S3-compatible endpoint.
+
+Runs offline by default: if S3_ENDPOINT_URL is not set, an in-process
+``moto`` server is started as the S3 stand-in (pip install "moto[server]").
+
+    python benchmarks/bench_storage.py
+    python benchmarks/bench_storage.py --large-mb 64 --workers 16 --small-count 400
+    S3_ENDPOINT_URL=http://localhost:9000 python benchmarks/bench_storage.py   # e.g. MinIO
+"""
+import argparse
+import io
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import LocalBlobStore, S3BlobStore, MB  # noqa: E402
+
+
+def start_s3_stand_in():
+    """Return (endpoint_url, stop_fn) for an S3-compatible endpoint."""
+    endpoint = os.environ.get('S3_ENDPOINT_URL')
+    if endpoint:
+        return endpoint, lambda: None
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError:
+        print("⚠️ moto not installed and S3_ENDPOINT_URL not set — skipping S3 benchmarks")
+        return None, lambda: None
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # silence per-request access logs
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0)
+    server.start()
+    host, port = server.get_host_and_port()
+    return f"http://{host}:{port}", server.stop
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def bench_large(store, label, size_mb):
+    payload = os.urandom(size_mb * MB)
+    key = f"bench/large_{size_mb}mb.bin"
+
+    up = timed(lambda: store.save(key, io.BytesIO(payload)))
+    sink = io.BytesIO()
+    down = timed(lambda: store.download(key, sink))
+    assert sink.getvalue() == payload, "round-trip mismatch"
+    store.delete(key)
+    print(f"  {label:<28} large {size_mb}MB   upload {size_mb / up:8.1f} MB/s   download {size_mb / down:8.1f} MB/s")
+
+
+def bench_concurrent(store, label, workers, count, size_kb):
+    payload = os.urandom(size_kb * 1024)
+    keys = [f"bench/small_{i}.bin" for i in range(count)]
+
+    def upload_all():
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda k: store.save(k, io.BytesIO(payload)), keys))
+
+    def download_all():
+        def fetch(k):
+            with store.open(k) as f:
+                f.read()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(fetch, keys))
+
+    up = timed(upload_all)
+    down = timed(download_all)
+    for k in keys:
+        store.delete(k)
+    print(f"  {label:<28} {count}x{size_kb}KB x{workers:<3} upload {count / up:8.1f} obj/s   download {count / down:8.1f} obj/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--large-mb', type=int, default=32)
+    parser.add_argument('--small-count', type=int, default=200)
+    parser.add_argument('--small-kb', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=16)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='bench-storage-')
+    try:
+        print("💻 Local blob store")
+        for policy in ('none', 'file', 'full'):
+            store = LocalBlobStore(os.path.join(root, policy), fsync_policy=policy)
+            bench_large(store, f"fsync={policy}", args.large_mb)
+            bench_concurrent(store, f"fsync={policy}", args.workers, args.small_count, args.small_kb)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    endpoint, stop = start_s3_stand_in()
+    if not endpoint:
+        return
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    bucket = os.environ.get('S3_BUCKET_NAME', 'bench-bucket')
+    try:
+        print(f"☁️ S3 at {endpoint}")
+        profiles = [
+            ("defaults (pool=10, 1 thread)", dict(max_pool_connections=10, max_concurrency=1)),
+            ("tuned (pool=50, 10 threads)", dict(max_pool_connections=50, max_concurrency=10)),
+        ]
+        for label, kwargs in profiles:
+            store = S3BlobStore(bucket, region='us-east-1', endpoint_url=endpoint, **kwargs)
+            try:
+                store.client.create_bucket(Bucket=bucket)
+            except store.client.exceptions.BucketAlreadyOwnedByYou:
+                pass
+            bench_large(store, label, args.large_mb)
+            bench_concurrent(store, label, args.workers, args.small_count, args.small_kb)
+    finally:
+        stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""Offline benchmark suite with a regression check against a stored baseline.
+
+Everything runs locally: Gemini is replaced by benchmarks/fakes.FakeModel (fixed
+latency, configurable error rate) and S3 by an in-process moto server (or
+S3_ENDPOINT_URL, e.g. MinIO). For every library size a fresh process seeds one
+user with that many files — rows, tags and a few real blobs — then times, with
+the Flask test client, one request at a time:
+
+    upload          POST /upload of a small text file (storage + fake analysis + upsert)
+    index           GET /  (dashboard listing the whole library)
+    search          GET /search (fake Gemini picks a few files from the prompt)
+    shared_download GET /download_shared/<token> (blob streamed from S3)
+
+plus, once, the pure helpers categorize_by_tags_simple and _parse_ai_response.
+Each gets requests/s (single client), p50, p99 and the process's peak RSS.
+Concurrency across gunicorn workers is covered by load_test.py instead.
+
+    python benchmarks/bench_suite.py                          # sizes 10,1000,10000
+    python benchmarks/bench_suite.py --sizes 10,1000,10000,100000
+    python benchmarks/bench_suite.py --save-baseline          # record benchmarks/baseline.json
+    python benchmarks/bench_suite.py --tolerance 0.25         # compare (exit 1 on regression)
+
+Baselines only compare meaningfully on the machine that recorded them.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+TAG_VOCABULARY = ['invoice', 'finance', 'travel', 'photo', 'family', 'receipt', 'work', 'notes', 'code',
+                  'python', 'report', 'tax', 'beach', 'holiday', 'contract', 'recipe', 'music', 'school']
+CATEGORIES = ['Documents', 'Images', 'Code', 'Finance', 'Travel', 'Other']
+SEED_BATCH = 1000
+SHARED_BLOBS = 20
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+        'p99_ms': round(latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000, 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'n': len(latencies),
+    }
+
+
+def measure(fn, max_requests, max_seconds, min_requests=3):
+    """Call fn() until max_requests calls or max_seconds have passed (at least min_requests)."""
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_requests:
+        t0 = time.perf_counter()
+        fn(len(latencies))
+        latencies.append(time.perf_counter() - t0)
+        if len(latencies) >= min_requests and time.perf_counter() - started > max_seconds:
+            break
+    return summarize(latencies, time.perf_counter() - started)
+
+
+# --- CHILD: ONE LIBRARY SIZE IN A FRESH PROCESS ---
+def seed_library(A, size, rng):
+    """One user owning `size` files; only the first SHARED_BLOBS have stored contents."""
+    from tags import replace_file_tags
+
+    with A.app.app_context():
+        user = A.User(username='bench', password=A.password_hasher.hash('bench-password'))
+        A.db.session.add(user)
+        A.db.session.commit()
+        table = A.FileMetadata.__table__
+        last_id = 0
+        for start in range(0, size, SEED_BATCH):
+            rows = []
+            for i in range(start, min(start + SEED_BATCH, size)):
+                tags = rng.sample(TAG_VOCABULARY, 3)
+                rows.append({'filename': f"file_{i:06d}_{tags[0]}.txt", 's3_key': f"user_{user.id}/seed_{i}",
+                             'tags': ','.join(tags), 'category': rng.choice(CATEGORIES),
+                             'file_size': 2048, 'content_hash': None, 'user_id': user.id})
+            A.db.session.execute(table.insert(), rows)
+            ids = A.db.session.execute(A.db.select(table.c.id, table.c.tags).where(
+                table.c.user_id == user.id, table.c.id > last_id)).all()
+            last_id = ids[-1].id
+            replace_file_tags(A.db.session, [(file_id, user.id, tags) for file_id, tags in ids])
+            A.db.session.commit()
+        shared = A.FileMetadata.query.filter_by(user_id=user.id).order_by(A.FileMetadata.id).limit(SHARED_BLOBS).all()
+        payload = b'x' * 2048
+        tokens = []
+        for f in shared:
+            A.storage.save(f.s3_key, io.BytesIO(payload))
+            tokens.append(A.share_signer.issue(f)[0])
+        return tokens
+
+
+def run_child(size, out_path, args):
+    import ai_utils
+    from benchmarks.fakes import FakeModel
+
+    ai_utils.model = FakeModel(latency=args.latency_ms / 1000, error_rate=args.error_rate, seed=args.seed)
+    import app as A
+
+    rng = random.Random(args.seed)
+    tokens = seed_library(A, size, rng)
+    client = A.app.test_client()
+    client.post('/login', data={'username': 'bench', 'password': 'bench-password'})
+    results = {'seeded_rss_mb': round(peak_rss_mb(), 1)}
+
+    def check(resp):
+        assert resp.status_code < 400, f"HTTP {resp.status_code}"
+        return resp
+
+    def upload(i):
+        check(client.post('/upload', data={'file': (io.BytesIO(b'benchmark upload\n' * 64), f"upload_{i}.txt")},
+                          content_type='multipart/form-data'))
+
+    def shared_download(i):
+        check(client.get(f"/download_shared/{tokens[i % len(tokens)]}")).close()
+
+    scenarios = [
+        ('upload', upload),
+        ('index', lambda i: check(client.get('/'))),
+        ('search', lambda i: check(client.get(f"/search?query={TAG_VOCABULARY[i % len(TAG_VOCABULARY)]}"))),
+        ('shared_download', shared_download),
+    ]
+    for name, fn in scenarios:
+        results[name] = measure(fn, args.requests, args.seconds)
+    with open(out_path, 'w') as f:
+        json.dump(results, f)
+
+
+def run_micro(args):
+    """The pure parsing/categorization helpers, timed per call."""
+    from ai_utils import categorize_by_tags_simple, _parse_ai_response
+
+    rng = random.Random(args.seed)
+    tag_strings = [', '.join(rng.sample(TAG_VOCABULARY, 5)) for _ in range(200)]
+    responses = [f"TAGS: {tags}\nCATEGORY: {rng.choice(CATEGORIES)}" for tags in tag_strings]
+    calls = args.requests * 200
+    results = {}
+    for name, fn in [('categorize_by_tags_simple', lambda i: categorize_by_tags_simple(tag_strings[i % 200])),
+                     ('parse_ai_response', lambda i: _parse_ai_response(responses[i % 200], 'text'))]:
+        results[name] = measure(fn, calls, args.seconds)
+    return results
+
+
+def run_size(size, args, env):
+    fd, out_path = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    data_dir = tempfile.mkdtemp(prefix=f'bench-suite-{size}-')
+    child_env = dict(env, DATABASE_URL=f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+                     S3_BUCKET_NAME=f"bench-suite-{size}-{os.getpid()}")
+    try:
+        import boto3
+        boto3.client('s3', endpoint_url=env['S3_ENDPOINT_URL'], region_name=env['AWS_REGION']).create_bucket(
+            Bucket=child_env['S3_BUCKET_NAME'])
+        cmd = [sys.executable, os.path.abspath(__file__), '--child', str(size), '--out', out_path,
+               '--requests', str(args.requests), '--seconds', str(args.seconds),
+               '--latency-ms', str(args.latency_ms), '--error-rate', str(args.error_rate), '--seed', str(args.seed)]
+        subprocess.run(cmd, env=child_env, cwd=data_dir, check=True)
+        with open(out_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(out_path)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+# --- BASELINE COMPARISON ---
+def compare(current, baseline, tolerance):
+    """Print current vs baseline; return the list of regressions beyond tolerance."""
+    regressions = []
+    print(f"\n  {'benchmark':<34}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'RSS MB':>9}   vs baseline")
+    for key, result in current.items():
+        base = baseline.get(key)
+        notes = []
+        if base:
+            if result['rps'] < base['rps'] * (1 - tolerance):
+                notes.append(f"req/s {result['rps'] / base['rps'] - 1:+.0%}")
+            if result['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+                notes.append(f"p99 {result['p99_ms'] / base['p99_ms'] - 1:+.0%}")
+            if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance):
+                notes.append(f"RSS {result['peak_rss_mb'] / base['peak_rss_mb'] - 1:+.0%}")
+            status = ('❌ ' + ', '.join(notes)) if notes else f"ok (req/s {result['rps'] / base['rps'] - 1:+.0%})"
+        else:
+            status = 'new'
+        if notes:
+            regressions.append(key)
+        print(f"  {key:<34}{result['rps']:>10.2f}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+              f"{result['peak_rss_mb']:>9.0f}   {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,1000,10000', help='comma-separated library sizes')
+    parser.add_argument('--requests', type=int, default=50, help='max requests per benchmark')
+    parser.add_argument('--seconds', type=float, default=5, help='time budget per benchmark')
+    parser.add_argument('--latency-ms', type=int, default=20, help='fake Gemini latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of fake Gemini calls that fail')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='write results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown before failing')
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--out', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child, args.out, args)
+        return
+
+    from benchmarks.bench_storage import start_s3_stand_in
+    endpoint, stop_s3 = start_s3_stand_in()
+    if not endpoint:
+        sys.exit(1)
+    env = dict(os.environ, RENDER='1', SECRET_KEY='bench-suite-secret', USE_S3='true', S3_ENDPOINT_URL=endpoint,
+               AWS_REGION='us-east-1', AWS_ACCESS_KEY_ID='bench', AWS_SECRET_ACCESS_KEY='bench',
+               LOG_LEVEL='WARNING', PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+    os.environ.update({k: env[k] for k in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY')})
+
+    print(f"📊 fake Gemini {args.latency_ms} ms / {args.error_rate:.0%} errors, S3 at {endpoint}, "
+          f"up to {args.requests} requests or {args.seconds:g}s per benchmark")
+    current = {}
+    try:
+        for size in [int(s) for s in args.sizes.split(',') if s.strip()]:
+            started = time.perf_counter()
+            result = run_size(size, args, env)
+            print(f"  {size:>7} files: seeded at {result.pop('seeded_rss_mb'):.0f} MB RSS, "
+                  f"measured in {time.perf_counter() - started:.1f}s")
+            current.update({f"{size}/{name}": stats for name, stats in result.items()})
+    finally:
+        stop_s3()
+    current.update({f"micro/{name}": stats for name, stats in run_micro(args).items()})
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    regressions = compare(current, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'args': vars(args), 'results': current},
+                      f, indent=2, sort_keys=True)
+        print(f"\n💾 Baseline written to {args.baseline}")
+    elif regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+    elif baseline:
+        print(f"\n✅ No regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Version history storage benchmark: content-defined vs fixed-size chunks vs whole copies.
+
+Edits a document many times the way people do — small inserts, deletes and
+overwrites at random places — and reports how much storage the history takes
+with the gear-hash chunker from versioning.py at several average chunk sizes,
+with fixed-size blocks (where one inserted byte shifts every later block), and
+with a whole copy per version. Also times chunking and the streaming
+reassembly used by version downloads and restores, against a local blob store.
+
+    python benchmarks/bench_versioning.py
+    python benchmarks/bench_versioning.py --size-mb 16 --versions 50 --chunk-kb 16,64,256
+"""
+import argparse
+import hashlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import LocalBlobStore  # noqa: E402
+from versioning import Chunker, chunk_key, iter_chunks  # noqa: E402
+
+
+def edit(data, rng):
+    """One editing session: a few inserts, deletes and in-place changes of up to a few KB."""
+    data = bytearray(data)
+    for _ in range(rng.randint(1, 4)):
+        pos = rng.randrange(len(data))
+        kind = rng.choice(('insert', 'delete', 'overwrite'))
+        n = rng.randint(1, 4096)
+        if kind == 'insert':
+            data[pos:pos] = rng.randbytes(n)
+        elif kind == 'delete':
+            del data[pos:pos + n]
+        else:
+            data[pos:pos + n] = rng.randbytes(min(n, len(data) - pos))
+    return bytes(data)
+
+
+def fixed_chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def history_bytes(versions, split):
+    """Bytes stored for all versions when identical chunks are kept once."""
+    seen = {}
+    for data in versions:
+        for chunk in split(data):
+            seen.setdefault(hashlib.sha256(chunk).digest(), len(chunk))
+    return sum(seen.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=8)
+    parser.add_argument('--versions', type=int, default=30)
+    parser.add_argument('--chunk-kb', default='16,64,256', help='average chunk sizes to compare')
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    versions = [rng.randbytes(int(args.size_mb * 1024 * 1024))]
+    for _ in range(args.versions - 1):
+        versions.append(edit(versions[-1], rng))
+    total = sum(len(v) for v in versions)
+    print(f"📊 {args.versions} versions of a {args.size_mb:g} MB file, 1-4 edits of up to 4 KB each")
+    print(f"  whole copies:              {total / 1024 / 1024:8.1f} MB")
+
+    for kb in [int(k) for k in args.chunk_kb.split(',')]:
+        chunker = Chunker(kb * 1024)
+        start = time.perf_counter()
+        stored = history_bytes(versions, lambda data: chunker.chunks(io.BytesIO(data)))
+        elapsed = time.perf_counter() - start
+        fixed = history_bytes(versions, lambda data: fixed_chunks(data, kb * 1024))
+        per_edit = (stored - len(versions[0])) / (args.versions - 1)
+        print(f"  {kb:>4} KB chunks  CDC {stored / 1024 / 1024:8.1f} MB ({per_edit / 1024:6.1f} KB/version, "
+              f"chunking {total / elapsed / 1024 / 1024:5.1f} MB/s)   fixed-size {fixed / 1024 / 1024:8.1f} MB")
+
+    # Streaming reassembly from a local blob store, as /versions/<id>/<n>/download does it
+    chunker = Chunker()
+    with tempfile.TemporaryDirectory() as root:
+        store = LocalBlobStore(root, fsync_policy='none')
+        chunks = []
+        for data in chunker.chunks(io.BytesIO(versions[-1])):
+            digest = hashlib.sha256(data).hexdigest()
+            store.save(chunk_key(1, digest), io.BytesIO(data))
+            chunks.append((digest, len(data)))
+        start = time.perf_counter()
+        size = sum(len(part) for part in iter_chunks(store, 1, chunks))
+        elapsed = time.perf_counter() - start
+        assert size == len(versions[-1])
+        print(f"  reassembly (local store, {len(chunks)} chunks): {size / elapsed / 1024 / 1024:.0f} MB/s")
+
+
+if __name__ == '__main__':
+    main()
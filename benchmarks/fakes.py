@@ -0,0 +1,60 @@
+"""Offline stand-ins for Gemini, shared by the benchmarks.
+
+FakeModel replaces ``ai_utils.model``: every call blocks for a fixed latency
+(like the network wait on the real API) and fails at a configurable rate.
+Analysis prompts get a TAGS/CATEGORY answer; search prompts get the first few
+filenames listed in the prompt, so results pages render real rows.
+"""
+import random
+import re
+import threading
+import time
+
+_FILENAME_LINE = re.compile(r'^- Filename: (.+?), Tags:', re.MULTILINE)
+
+ANALYSIS_TEXT = "TAGS: benchmark, load test, sample, offline, fake\nCATEGORY: Documents"
+
+
+class FakeGeminiError(Exception):
+    """Raised for the configured fraction of calls, standing in for API errors and timeouts."""
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+    def resolve(self):
+        pass
+
+
+class FakeModel:
+    model_name = 'fake-gemini'
+
+    def __init__(self, latency=0.3, error_rate=0.0, search_matches=5, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.search_matches = search_matches
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def generate_content(self, contents):
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)  # Releases the GIL like a real network wait
+        if fail:
+            raise FakeGeminiError("fake Gemini failure")
+        prompt = contents if isinstance(contents, str) else contents[0]
+        if "USER'S SEARCH QUERY" in prompt:
+            names = []
+            for match in _FILENAME_LINE.finditer(prompt):
+                names.append(match.group(1))
+                if len(names) >= self.search_matches:
+                    break
+            return FakeResponse(', '.join(names) or 'NONE')
+        return FakeResponse(ANALYSIS_TEXT)
@@ -0,0 +1,20 @@
+"""WSGI entry point for load_test.py: the real app with Gemini replaced by a fixed-latency fake.
+
+    gunicorn -c gunicorn.conf.py benchmarks.load_app:app
+
+FAKE_GEMINI_LATENCY_MS (default 300) sets how long each fake model call blocks,
+standing in for the network wait on the real API; FAKE_GEMINI_ERROR_RATE
+(default 0) the fraction of calls that fail.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_utils  # noqa: E402
+from benchmarks.fakes import FakeModel  # noqa: E402
+
+ai_utils.model = FakeModel(latency=int(os.environ.get('FAKE_GEMINI_LATENCY_MS', 300)) / 1000,
+                           error_rate=float(os.environ.get('FAKE_GEMINI_ERROR_RATE', 0)))
+
+from app import app  # noqa: E402,F401
@@ -0,0 +1,177 @@
+"""Load test: requests/second and latency for sync vs threaded (and gevent) gunicorn workers.
+
+Each configuration runs the real app (benchmarks/load_app.py, Gemini faked with
+a fixed latency) under gunicorn with the same number of worker processes, so
+memory stays roughly constant, and is driven by a fixed number of concurrent
+keep-alive clients. The mix is half /search (waits on Gemini) and half the
+dashboard (database only). Summed worker RSS is reported alongside.
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --workers 2 --threads 16 --clients 64 --seconds 20 --latency-ms 500
+"""
+import argparse
+import http.client
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PORT = 8765
+
+
+def rss_mb(root_pid):
+    """Resident memory of a process and its children, from /proc (Linux only)."""
+    pids = {root_pid}
+    try:
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                with open(f'/proc/{entry}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == root_pid:
+                        pids.add(int(entry))
+        total = 0
+        for pid in pids:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        return total / 1024
+    except OSError:
+        return float('nan')
+
+
+def request(conn, method, path, body=None, headers=None):
+    conn.request(method, path, body=body, headers=headers or {})
+    resp = conn.getresponse()
+    resp.read()
+    return resp
+
+
+def wait_ready(timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=2)
+            if request(conn, 'GET', '/health').status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not come up")
+
+
+def log_in_and_seed():
+    """Create a user with a few files and return its session cookie."""
+    conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+    form = {'Content-Type': 'application/x-www-form-urlencoded'}
+    creds = urllib.parse.urlencode({'username': 'loadtest', 'password': 'loadtest-password'})
+    request(conn, 'POST', '/signup', creds, form)
+    resp = request(conn, 'POST', '/login', creds, form)
+    cookie = resp.getheader('Set-Cookie').split(';', 1)[0]
+    boundary = 'loadtestboundary'
+    for i in range(5):
+        body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"note_{i}.txt\"\r\n"
+                f"Content-Type: text/plain\r\n\r\nload test file {i}\r\n--{boundary}--\r\n").encode()
+        request(conn, 'POST', '/upload', body,
+                {'Content-Type': f'multipart/form-data; boundary={boundary}', 'Cookie': cookie})
+    return cookie
+
+
+def drive(cookie, clients, seconds):
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=60)
+        rng = random.Random()
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            path = '/search?query=notes' if rng.random() < 0.5 else '/'
+            start = time.perf_counter()
+            try:
+                if request(conn, 'GET', path, headers={'Cookie': cookie}).status >= 400:
+                    failed += 1
+                else:
+                    local.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', PORT, timeout=60)
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    pool = [threading.Thread(target=client) for _ in range(clients)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    latencies.sort()
+    return latencies, errors[0]
+
+
+def run_config(label, worker_class, args):
+    data_dir = tempfile.mkdtemp(prefix='load-test-')
+    env = dict(os.environ,
+               RENDER='1',  # Production config path, so DATABASE_URL and SECRET_KEY are honoured
+               DATABASE_URL=f"sqlite:///{os.path.join(data_dir, 'load.db')}",
+               SECRET_KEY='load-test-secret',
+               PORT=str(PORT),
+               GUNICORN_WORKER_CLASS=worker_class,
+               WEB_CONCURRENCY=str(args.workers),
+               GUNICORN_THREADS=str(args.threads),
+               GUNICORN_CONNECTIONS=str(args.threads * 4),
+               GUNICORN_MAX_REQUESTS='0',
+               FAKE_GEMINI_LATENCY_MS=str(args.latency_ms),
+               GEMINI_MAX_CONCURRENCY=str(args.threads * 4),
+               LOGIN_MAX_ATTEMPTS_PER_IP='100000')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--log-level', 'warning', 'benchmarks.load_app:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready()
+        cookie = log_in_and_seed()
+        latencies, errors = drive(cookie, args.clients, args.seconds)
+        memory = rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if not latencies:
+        print(f"  {label:<30} no successful requests ({errors} errors)")
+        return
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"  {label:<30} {len(latencies) / args.seconds:8.1f} req/s   p50 {p50:8.1f} ms   "
+          f"p99 {p99:8.1f} ms   errors {errors:<4} RSS {memory:6.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2, help='worker processes in every configuration')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gthread worker')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--latency-ms', type=int, default=300, help='fake Gemini call latency')
+    args = parser.parse_args()
+
+    print(f"📊 {args.workers} workers, {args.clients} clients, {args.seconds:g}s, "
+          f"Gemini latency {args.latency_ms} ms, 50% /search + 50% dashboard")
+    configs = [('sync', 'sync'), (f'gthread ({args.threads} threads)', 'gthread')]
+    try:
+        import gevent  # noqa: F401
+        configs.append(('gevent', 'gevent'))
+    except ImportError:
+        print("  (gevent not installed — skipping the gevent configuration)")
+    for label, worker_class in configs:
+        run_config(label, worker_class, args)
+
+
+if __name__ == '__main__':
+    main()
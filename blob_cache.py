@@ -0,0 +1,239 @@
+import os
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from werkzeug.utils import secure_filename
+from storage import StorageError, COPY_BUFFER_SIZE
+
+try:
+    import fcntl
+except ImportError:  # Windows: sweeps from several processes aren't serialized
+    fcntl = None
+
+SWEEP_FRACTION = 0.1     # Re-scan the shared directory after this process wrote this share of the budget
+STALE_TMP_SECONDS = 3600  # Partial fills older than this were abandoned by a dead process
+
+
+class _HashingWriter:
+    """File wrapper that hashes everything written through it."""
+
+    def __init__(self, fileobj):
+        self._f = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, b):
+        self.sha256.update(b)
+        self.size += len(b)
+        return self._f.write(b)
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class BlobCache:
+    """Read-through LRU cache of remote blobs on local disk, bounded by a byte budget.
+
+    Every fill is checked against the file's stored SHA-256 before it is
+    admitted, and concurrent misses for the same key download only once.
+
+    Several gunicorn workers share the directory and the budget. Each keeps
+    its own LRU index for lookups. After writing SWEEP_FRACTION of the budget,
+    a worker sweeps the whole directory under a file lock: it evicts the
+    least recently used files (by access time) until everything fits, then
+    adopts the scan as its index. Between sweeps, total use can exceed
+    max_bytes by at most SWEEP_FRACTION of it per worker. A file evicted by
+    another worker is simply a miss.
+    """
+
+    def __init__(self, root, max_bytes, verify_on_hit=False):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.verify_on_hit = verify_on_hit
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # path -> size, least recently used first
+        self._total_bytes = 0
+        self._inflight = {}  # path -> threading.Event for single-flight fills
+        self._written = 0  # Bytes this process admitted since its last sweep
+        self.hits = 0
+        self.misses = 0
+        self.integrity_failures = 0
+        os.makedirs(self.root, exist_ok=True)
+        self._sweep()
+
+    @contextmanager
+    def _directory_lock(self):
+        """Serialize sweeps across the processes sharing root."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.root, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _sweep(self):
+        """Evict least recently used files across every process until the directory fits the budget."""
+        with self._lock, self._directory_lock():
+            found = []
+            now = time.time()
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                        if name.startswith('.tmp-'):
+                            # Another process may be filling it right now; only remove abandoned ones
+                            if now - stat.st_mtime > STALE_TMP_SECONDS:
+                                os.remove(path)
+                            continue
+                    except OSError:
+                        continue  # Removed by another process meanwhile
+                    if name != '.lock':
+                        found.append((stat.st_atime, path, stat.st_size))
+            found.sort()
+            total = sum(size for _, _, size in found)
+            while total > self.max_bytes and len(found) > 1:
+                _, path, size = found.pop(0)
+                total -= size
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._entries = OrderedDict((path, size) for _, path, size in found)
+            self._total_bytes = total
+            self._written = 0
+    def path_for(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        leaf = secure_filename(key.rsplit('/', 1)[-1])
+        return os.path.join(self.root, digest[:2], f"{digest}_{leaf}" if leaf else digest)
+
+    def get_path(self, key, fetch, expected_hash=None):
+        """Return a local path holding the blob for key, calling fetch(fileobj) on a miss."""
+        path = self.path_for(key)
+        while True:
+            with self._lock:
+                if path in self._entries and os.path.exists(path):
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    verify = self.verify_on_hit and expected_hash
+                    break
+                event = self._inflight.get(path)
+                if event is None:
+                    # This thread fills the entry; others wait on the event
+                    self.misses += 1
+                    event = self._inflight[path] = threading.Event()
+                    owner = True
+                else:
+                    owner = False
+            if not owner:
+                event.wait()
+                continue
+            try:
+                self._fill(path, fetch, expected_hash)
+            finally:
+                with self._lock:
+                    self._inflight.pop(path, None)
+                event.set()
+            return path
+
+        if verify and sha256_file(path) != expected_hash:
+            self.integrity_failures += 1
+            self.invalidate(key)
+            return self.get_path(key, fetch, expected_hash)
+        try:
+            os.utime(path)  # Keeps LRU order meaningful across restarts
+        except OSError:
+            pass
+        return path
+
+    def cached_path(self, key):
+        """Path of key if it is cached right now, else None. Never fetches."""
+        path = self.path_for(key)
+        with self._lock:
+            if path not in self._entries or not os.path.exists(path):
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+        return path
+
+    def put_file(self, key, src_path):
+        """Admit a file we already have locally (e.g. a fresh upload) without a round-trip."""
+        self._fill(self.path_for(key), lambda out: self._copy_from(src_path, out), None)
+
+    @staticmethod
+    def _copy_from(src_path, out):
+        with open(src_path, 'rb') as src:
+            shutil.copyfileobj(src, out, COPY_BUFFER_SIZE)
+
+    def _fill(self, path, fetch, expected_hash):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                writer = _HashingWriter(out)
+                fetch(writer)
+            if expected_hash and writer.sha256.hexdigest() != expected_hash:
+                with self._lock:
+                    self.integrity_failures += 1
+                raise StorageError(f"Integrity check failed for cached blob {os.path.basename(path)}")
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            self._total_bytes -= self._entries.pop(path, 0)
+            self._entries[path] = writer.size
+            self._total_bytes += writer.size
+            self._written += writer.size
+            self._evict()
+            sweep = self._written >= self.max_bytes * SWEEP_FRACTION
+        if sweep:
+            self._sweep()
+
+    def _evict(self):
+        """Drop least recently used entries until within budget. Caller holds the lock."""
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def invalidate(self, key):
+        path = self.path_for(key)
+        with self._lock:
+            self._total_bytes -= self._entries.pop(path, 0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'integrity_failures': self.integrity_failures,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
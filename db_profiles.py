@@ -0,0 +1,61 @@
+import os
+from sqlalchemy import event
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def engine_options(database_uri):
+    """SQLAlchemy create_engine() options for the database behind database_uri.
+
+    PostgreSQL: a sized connection pool with pre-ping and recycling, plus a
+    server-side statement timeout so one slow query can't hold a worker.
+    DB_POOL_SIZE (5), DB_MAX_OVERFLOW (10), DB_POOL_TIMEOUT (30s),
+    DB_POOL_RECYCLE (1800s), DB_STATEMENT_TIMEOUT_MS (30000), DB_CONNECT_TIMEOUT (10s).
+
+    SQLite: the driver-level busy timeout; the PRAGMAs are applied per
+    connection by install_sqlite_pragmas().
+    """
+    if database_uri.startswith('postgresql'):
+        return {
+            'pool_size': _env_int('DB_POOL_SIZE', 5),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+            'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+            'pool_pre_ping': True,
+            'connect_args': {
+                'connect_timeout': _env_int('DB_CONNECT_TIMEOUT', 10),
+                'options': f"-c statement_timeout={_env_int('DB_STATEMENT_TIMEOUT_MS', 30000)}",
+            },
+        }
+    if database_uri.startswith('sqlite'):
+        return {
+            'connect_args': {'timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000) / 1000},
+        }
+    return {'pool_pre_ping': True}
+
+
+def install_sqlite_pragmas(engine):
+    """Run WAL, synchronous and busy_timeout PRAGMAs on every new SQLite connection.
+
+    WAL lets readers proceed while one writer commits, and synchronous=NORMAL
+    is durable across application crashes in WAL mode (only an OS crash can
+    lose the last transactions). SQLITE_JOURNAL_MODE (WAL), SQLITE_SYNCHRONOUS
+    (NORMAL), SQLITE_BUSY_TIMEOUT_MS (5000).
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    journal_mode = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL').upper()
+    synchronous = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+    busy_timeout = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    in_memory = engine.url.database in (None, '', ':memory:')
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+        cursor.close()
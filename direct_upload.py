@@ -0,0 +1,90 @@
+"""Browser uploads straight to object storage, bypassing the web worker.
+
+1. POST /upload/presign: the server picks a storage key for each file and
+   returns a presigned POST policy that only accepts that key, the declared
+   content type and 1..max bytes, plus a signed upload ticket describing it.
+2. The browser POSTs the file to the bucket.
+3. POST /upload/complete with the tickets: the server checks each object
+   exists and fits its ticket, registers the file and queues analysis, which
+   fetches only the bytes the analyzer needs with ranged reads.
+
+Tickets are HMAC-signed like share links, so presign needs no database write
+and a completion can't register a key the server didn't hand out.
+"""
+import hashlib
+import time
+from signed_tokens import BadSignature, TokenSigner
+
+COMPLETION_GRACE_SECONDS = 3600  # An upload that started just before its policy expired may still be in flight
+RANGE_BLOCK_SIZE = 8 * 1024 * 1024  # Bytes per ranged GET when fetching an object for analysis
+ANALYSIS_PREFIX_BYTES = 64 * 1024  # analyze_file reads at most the first 4000 characters of text and code
+# Keep in sync with the text and code branches of ai_utils.analyze_file
+PREFIX_EXTENSIONS = ('.txt', '.md', '.json', '.csv', '.xml', '.html',
+                     '.py', '.js', '.java', '.cpp', '.c', '.cs', '.php', '.rb', '.go', '.rs', '.ts', '.jsx', '.tsx')
+
+
+class InvalidUploadTicket(Exception):
+    """Raised when an upload ticket is malformed, forged, expired or someone else's."""
+
+
+class UploadTicketSigner:
+    """Issues and verifies ``<base64 payload>.<base64 HMAC>`` tickets for presigned uploads."""
+
+    def __init__(self, secret):
+        self._signer = TokenSigner(secret, b'upload-ticket')
+
+    def issue(self, user_id, key, filename, max_bytes, content_type, expires_in):
+        payload = {'u': user_id, 'k': key, 'n': filename, 'm': max_bytes, 't': content_type,
+                   'e': int(time.time()) + int(expires_in)}
+        return self._signer.dumps(payload)
+
+    def verify(self, ticket, user_id):
+        """Return the payload of a genuine, unexpired ticket issued to user_id or raise InvalidUploadTicket."""
+        try:
+            payload = self._signer.loads(ticket)
+        except BadSignature:
+            raise InvalidUploadTicket('Invalid upload ticket')
+        except ValueError:
+            raise InvalidUploadTicket('Malformed upload ticket')
+        if not isinstance(payload, dict) or not {'u', 'k', 'n', 'm', 't', 'e'} <= payload.keys():
+            raise InvalidUploadTicket('Malformed upload ticket')
+        if payload['u'] != user_id:
+            raise InvalidUploadTicket('Upload ticket belongs to another user')
+        if payload['e'] + COMPLETION_GRACE_SECONDS < time.time():
+            raise InvalidUploadTicket('Upload ticket has expired')
+        return payload
+
+
+def analysis_length(filename, size):
+    """How many leading bytes of an object the analyzer needs.
+
+    Text and code are analyzed from their first few thousand characters.
+    Images, PDFs and DOCX files need all of it (the PDF cross-reference table
+    and the DOCX zip directory are at the end).
+    """
+    if filename.lower().endswith(PREFIX_EXTENSIONS):
+        return min(size, ANALYSIS_PREFIX_BYTES)
+    return size
+
+
+def fetch_prefix(storage, key, length, out, block_size=RANGE_BLOCK_SIZE):
+    """Copy the first length bytes of a blob into out with ranged reads. Returns their SHA-256 hex digest."""
+    digest = hashlib.sha256()
+    position = 0
+    while position < length:
+        data = storage.read_range(key, position, min(position + block_size, length) - 1)
+        if not data:
+            break
+        out.write(data)
+        digest.update(data)
+        position += len(data)
+    return digest.hexdigest()
+
+
+def hash_object(storage, key, block_size=1024 * 1024):
+    """SHA-256 hex digest of a whole blob from one streamed read (nothing is kept in memory or on disk)."""
+    digest = hashlib.sha256()
+    with storage.open(key) as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
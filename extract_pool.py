@@ -0,0 +1,219 @@
+"""PDF and DOCX parsing in a pool of worker processes, with time and memory limits.
+
+PyPDF2 and python-docx are pure Python: in the web worker they hold the GIL
+for as long as a parse takes, and a malformed or huge PDF can spin for minutes
+or grow the process until the OOM killer takes it (and every request it was
+serving) down. Here each parse runs in a separate process:
+
+- RLIMIT_AS caps a worker's address space, so runaway allocations raise
+  MemoryError inside the worker instead of swapping the host;
+- SIGALRM interrupts a parse that runs past its wall-clock budget, and a
+  worker that doesn't come back even then is killed and the pool rebuilt;
+- workers are replaced after max_tasks_per_child parses, returning whatever
+  memory the parsers fragmented;
+- failures come back as results ({'error': 'timeout' | 'memory' | 'invalid' |
+  'crashed', 'detail': ...}), never as exceptions in the caller.
+
+Workers fork from a forkserver that has already imported the parsers, so
+recycling them is cheap.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import docx
+import PyPDF2
+import metrics
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+log = logging.getLogger(__name__)
+
+KILL_GRACE_SECONDS = 5  # Beyond the task timeout, before the parent gives up on a worker and kills it
+DETAIL_CHARS = 300
+
+EXTRACT_RESULTS = metrics.counter('extraction_tasks_total', 'Document parses by outcome', ('task', 'result'))
+EXTRACT_LATENCY = metrics.histogram('extraction_duration_seconds', 'Document parse time including queueing', ('task',))
+
+
+# --- PARSERS (run inside the workers) ---
+def extract_pdf_text(file_path, max_pages=None):
+    """Text of a PDF's pages (all, or the first max_pages) and its page count."""
+    with open(file_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        count = len(reader.pages)
+        limit = count if max_pages is None else min(max_pages, count)
+        return "".join(reader.pages[i].extract_text() or "" for i in range(limit)), count
+
+
+def extract_docx_text(file_path, max_pages=None):
+    """Text of a DOCX file's paragraphs; DOCX has no fixed pages, so the count is None."""
+    return "\n".join(para.text for para in docx.Document(file_path).paragraphs), None
+
+
+def pdf_cover_image(file_path):
+    """Encoded bytes of the largest picture on the first page of a PDF without text (a scan), or None."""
+    with open(file_path, 'rb') as f:
+        page = PyPDF2.PdfReader(f).pages[0]
+        if (page.extract_text() or '').strip():
+            return None
+        pictures = [picture.data for picture in page.images]
+        return max(pictures, key=len) if pictures else None
+
+
+TASKS = {'pdf_text': extract_pdf_text, 'docx_text': extract_docx_text, 'pdf_cover': pdf_cover_image}
+
+
+class _Timeout(BaseException):
+    """Raised by SIGALRM. Not an Exception, so the parsers' own broad except blocks can't swallow it."""
+
+
+def _on_alarm(signum, frame):
+    raise _Timeout()
+
+
+def _init_worker(memory_bytes):
+    if resource and memory_bytes:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, hard))
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+
+def _run_task(task, args, timeout):
+    """Worker entry point: run one parser under the alarm and turn every failure into a result."""
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        try:
+            return {'value': TASKS[task](*args), 'error': None}
+        finally:
+            if timeout:
+                signal.setitimer(signal.ITIMER_REAL, 0)  # An alarm just before this is still caught below
+    except _Timeout:
+        return {'error': 'timeout', 'detail': f"exceeded {timeout}s"}
+    except MemoryError:
+        return {'error': 'memory', 'detail': 'exceeded the worker memory limit'}
+    except Exception as e:
+        return {'error': 'invalid', 'detail': f"{type(e).__name__}: {e}"[:DETAIL_CHARS]}
+
+
+# --- POOL ---
+class ExtractionPool:
+    """Bounded process pool for the parsers above, created on first use.
+
+    workers=0 parses in the calling thread with the same result format but no
+    isolation or limits (for environments that can't start processes).
+    """
+
+    def __init__(self, workers=2, timeout=30, memory_mb=512, max_tasks_per_child=50):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_bytes = memory_mb * 1024 * 1024 if memory_mb else None
+        self.max_tasks_per_child = max_tasks_per_child
+        self._executor = None
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                if 'forkserver' in methods:
+                    context.set_forkserver_preload(['extract_pool'])
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context,
+                    max_tasks_per_child=self.max_tasks_per_child or None,
+                    initializer=_init_worker, initargs=(self.memory_bytes,))
+            return self._executor
+
+    def _discard(self, executor, kill=False):
+        """Replace a broken or stuck executor (once, however many callers notice)."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.restarts += 1
+        if kill:
+            # No public API to stop a running task; _processes is the executor's pid -> Process map
+            for process in list((getattr(executor, '_processes', None) or {}).values()):
+                process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, task, *args):
+        """Run TASKS[task](*args) in a worker. Returns {'value': ...} or {'error': kind, 'detail': ...}."""
+        start = time.perf_counter()
+        result = self._run(task, args)
+        EXTRACT_LATENCY.observe(time.perf_counter() - start, task=task)
+        EXTRACT_RESULTS.inc(task=task, result=result['error'] or 'ok')
+        if result['error']:
+            log.warning("Extraction failed", extra={'task': task, 'file_name': os.path.basename(str(args[0])),
+                                                    'error': result['error'], 'detail': result.get('detail')})
+        return result
+
+    def _run(self, task, args):
+        if not self.workers:
+            try:
+                return {'value': TASKS[task](*args), 'error': None}
+            except MemoryError:
+                return {'error': 'memory', 'detail': 'out of memory'}
+            except Exception as e:
+                return {'error': 'invalid', 'detail': f"{type(e).__name__}: {e}"[:DETAIL_CHARS]}
+
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_run_task, task, args, self.timeout)
+            except (BrokenProcessPool, RuntimeError):
+                self._discard(executor)
+                continue
+            try:
+                return future.result(self.timeout + KILL_GRACE_SECONDS if self.timeout else None)
+            except FutureTimeout:
+                # The alarm didn't get through (stuck in C code): kill the worker, fail only this task
+                self._discard(executor, kill=True)
+                return {'error': 'timeout', 'detail': f"worker killed after {self.timeout + KILL_GRACE_SECONDS}s"}
+            except BrokenProcessPool:
+                # A worker died (killed by the kernel, crashed in C). It may not have been this
+                # task's; every task in flight fails with the pool, so try once more on a new one.
+                self._discard(executor)
+        return {'error': 'crashed', 'detail': 'worker process died'}
+
+    # --- CONVENIENCE WRAPPERS ---
+    def extract_text(self, file_path, max_pages=None):
+        """{'text', 'pages', 'error', 'detail'} for a PDF or DOCX file; text is '' on error."""
+        task = 'pdf_text' if file_path.lower().endswith('.pdf') else 'docx_text'
+        result = self.run(task, file_path, max_pages)
+        if result['error']:
+            return {'text': '', 'pages': None, 'error': result['error'], 'detail': result.get('detail')}
+        text, pages = result['value']
+        return {'text': text, 'pages': pages, 'error': None, 'detail': None}
+
+    def pdf_cover(self, file_path):
+        """Encoded first-page picture of a scanned PDF, or None (also on error)."""
+        result = self.run('pdf_cover', file_path)
+        return None if result['error'] else result['value']
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def create_extraction_pool():
+    """Pool configured from EXTRACT_WORKERS (2, 0 = in-process), EXTRACT_TIMEOUT_SECONDS (30),
+    EXTRACT_MEMORY_MB (512) and EXTRACT_MAX_TASKS_PER_CHILD (50)."""
+    return ExtractionPool(
+        workers=int(os.environ.get('EXTRACT_WORKERS', 2)),
+        timeout=float(os.environ.get('EXTRACT_TIMEOUT_SECONDS', 30)),
+        memory_mb=int(os.environ.get('EXTRACT_MEMORY_MB', 512)),
+        max_tasks_per_child=int(os.environ.get('EXTRACT_MAX_TASKS_PER_CHILD', 50)),
+    )
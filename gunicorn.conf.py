@@ -0,0 +1,42 @@
+"""Gunicorn settings: threaded workers so Gemini and S3 waits don't hold a whole process.
+
+Every request that waits on Gemini (upload analysis, search) or S3 only holds one
+thread, so a worker process keeps serving other requests meanwhile. Tune with:
+
+    GUNICORN_WORKER_CLASS  gthread (default) | gevent | sync
+    WEB_CONCURRENCY        worker processes (default 2) — each costs a full app's memory
+    GUNICORN_THREADS       threads per gthread worker (default 8) — cheap, a few MB each
+    GUNICORN_CONNECTIONS   concurrent requests per gevent worker (default 100)
+    GUNICORN_TIMEOUT       seconds (default 120)
+    GUNICORN_MAX_REQUESTS  recycle workers after this many requests to cap memory growth (default 1000, 0 = off)
+
+gevent needs `pip install gevent` (and `psycogreen` for PostgreSQL so database waits yield too).
+Run: gunicorn -c gunicorn.conf.py app:app
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+if worker_class == 'gthread':
+    threads = int(os.environ.get('GUNICORN_THREADS', 8))
+elif worker_class == 'gevent':
+    worker_connections = int(os.environ.get('GUNICORN_CONNECTIONS', 100))
+
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+# No preload_app: background threads (share-stats flusher, hashing pool) must start in each worker
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning("psycogreen not installed: PostgreSQL queries will block gevent workers")
@@ -0,0 +1,213 @@
+"""Local, model-free file analysis with a confidence score.
+
+Scores every category from cheap signals — the file extension, words in the
+filename, keyword hits in the extracted text and, for images, EXIF and
+dimension hints — using the same vocabulary as categorize_by_tags_simple.
+``ai_utils.analyze_file`` keeps the local answer when its confidence clears
+LOCAL_ANALYSIS_THRESHOLD and only asks Gemini otherwise.
+
+Confidence is the winning category's share of all evidence, with a smoothing
+term so a single weak hint never looks certain:
+
+    confidence = top / (total + SMOOTHING)
+"""
+import collections
+import math
+import os
+import re
+
+# Define category keywords (ordered by priority - most specific first)
+CATEGORY_KEYWORDS = {
+    # Content-specific categories (highest priority)
+    "Sports": ["cricket", "cricketer", "football", "soccer", "basketball", "tennis", "badminton",
+               "athlete", "player", "match", "tournament", "trophy", "stadium", "team",
+               "fitness", "gym", "workout", "sport", "olympic", "ipl", "world cup",
+               "batting", "bowling", "goal", "score", "champion"],
+    "Travel & Nature": ["travel", "vacation", "trip", "journey", "tourism", "landmark",
+                       "landscape", "nature", "mountain", "beach", "ocean", "river", "forest",
+                       "sunset", "sunrise", "scenery", "outdoor", "hiking", "adventure",
+                       "monument", "temple", "heritage", "destination"],
+    "Food & Recipes": ["food", "recipe", "cooking", "meal", "dish", "restaurant", "cuisine",
+                      "breakfast", "lunch", "dinner", "snack", "dessert", "cake", "pizza",
+                      "coffee", "tea", "beverage", "kitchen", "chef", "delicious"],
+    "Celebrations": ["birthday", "party", "wedding", "festival", "celebration", "ceremony",
+                    "diwali", "holi", "christmas", "new year", "anniversary", "graduation",
+                    "event", "decoration", "cake", "gift"],
+    "Animals & Pets": ["dog", "cat", "pet", "animal", "puppy", "kitten", "bird", "fish",
+                      "wildlife", "zoo", "horse", "cow", "lion", "tiger", "elephant"],
+    "Fashion & Lifestyle": ["fashion", "clothing", "outfit", "dress", "style", "accessory",
+                           "shoes", "watch", "jewelry", "lifestyle", "beauty", "makeup",
+                           "hairstyle", "shopping", "brand"],
+    "Vehicles": ["car", "bike", "motorcycle", "vehicle", "automobile", "truck", "bus",
+                "train", "airplane", "driving", "road", "engine", "speed"],
+    "Technology": ["gadget", "smartphone", "laptop", "computer", "electronic", "device",
+                  "app", "software", "hardware", "tech", "robot", "ai", "machine learning"],
+    
+    # Specific document/media categories
+    "Screenshots": ["screenshot", "screen capture", "screen shot", "snip", "printscreen"],
+    "Memes & Entertainment": ["meme", "funny", "joke", "entertainment", "viral", "humor",
+                              "movie", "series", "anime", "cartoon"],
+    "Receipts": ["receipt", "purchase receipt", "transaction", "order confirmation"],
+    "Invoices": ["invoice", "billing", "payment due", "amount due"],
+    "Certificates": ["certificate", "certification", "degree", "diploma", "award", "achievement", "license"],
+    "Resume & CV": ["resume", "cv", "curriculum vitae", "cover letter", "job application", "career"],
+    "Financial": ["bank", "statement", "tax", "financial", "investment", "salary", "income", "expense"],
+    "Medical": ["medical", "health", "prescription", "doctor", "hospital", "diagnosis", "patient", "medicine"],
+    "Legal": ["legal", "contract", "agreement", "court", "law", "attorney", "lawyer"],
+    "Code": ["code", "programming", "python", "javascript", "java", "function", "class", "api", "github", "repository"],
+    "Art & Design": ["art", "design", "illustration", "graphic", "creative", "artwork", "drawing", "sketch"],
+    
+    # Broader categories (lower priority)
+    "Study Materials": ["study", "notes", "lecture", "course", "exam", "homework", "assignment", 
+                      "textbook", "education", "school", "university", "college", "research", "academic",
+                      "thesis", "essay", "tutorial", "learning", "student"],
+    "Reports": ["report", "analysis", "summary", "evaluation", "assessment", "findings"],
+    "People & Selfies": ["selfie", "portrait", "group photo", "family", "friends", "photo",
+                        "picture", "photography", "memories"],
+    "Documents": ["document", "form", "id card", "passport", "official", "paper", "pdf", "docx"],
+    "Work & Business": ["work", "project", "meeting", "presentation", "business", "client", "company", "office",
+                       "professional", "corporate", "proposal", "strategy"],
+    "Personal": ["personal", "diary", "journal", "private"],
+    "Music": ["music", "song", "audio", "mp3", "wav", "album", "artist", "playlist"],
+    "Videos": ["video", "movie", "clip", "mp4", "recording", "footage"],
+}
+
+
+# Extension priors: (tags, category, weight). Code and media are near-certain from the extension alone;
+# documents only say "some kind of document" and need filename or text evidence to be confident.
+CODE_LANGUAGES = {
+    'py': 'python', 'js': 'javascript', 'jsx': 'javascript', 'ts': 'typescript', 'tsx': 'typescript',
+    'java': 'java', 'cpp': 'c++', 'c': 'c', 'cs': 'c#', 'php': 'php', 'rb': 'ruby', 'go': 'go', 'rs': 'rust',
+}
+EXTENSION_PRIORS = {
+    **{ext: (['code', lang], 'Code', 4.0) for ext, lang in CODE_LANGUAGES.items()},
+    'pdf': (['pdf', 'document'], 'Documents', 0.5),
+    'docx': (['docx', 'document'], 'Documents', 0.5),
+    'txt': (['text'], 'Documents', 0.5),
+    'md': (['markdown', 'notes'], 'Documents', 0.5),
+    'csv': (['csv', 'data'], 'Data', 1.5),
+    'json': (['json', 'data'], 'Data', 1.5),
+    'xml': (['xml', 'data'], 'Data', 1.0),
+    'html': (['html', 'web page'], 'Documents', 0.5),
+}
+
+FILENAME_WEIGHT = 3.0       # A keyword someone put in the filename is strong evidence
+TEXT_WEIGHT = 1.0           # Per distinct keyword found in the content...
+TEXT_REPEAT_WEIGHT = 0.25   # ...plus this per repeat, up to TEXT_MAX_REPEATS
+TEXT_MAX_REPEATS = 3
+SCREEN_WEIGHT = 2.5
+CAMERA_WEIGHT = 1.0
+SMOOTHING = 1.5
+MAX_TAGS = 7
+TEXT_SCAN_CHARS = 4000
+
+# Full-screen captures come out at these sizes (either orientation)
+SCREEN_SIZES = {(1280, 720), (1366, 768), (1440, 900), (1536, 864), (1600, 900), (1920, 1080), (1920, 1200),
+                (2560, 1440), (2560, 1600), (2880, 1800), (3024, 1964), (3840, 2160),
+                (750, 1334), (828, 1792), (1080, 1920), (1080, 2340), (1080, 2400), (1170, 2532), (1179, 2556),
+                (1284, 2778), (1290, 2796), (1242, 2688), (1440, 3200)}
+EXIF_MAKE, EXIF_MODEL, EXIF_IFD, GPS_IFD = 0x010F, 0x0110, 0x8769, 0x8825
+
+STOPWORDS = {'the', 'and', 'for', 'with', 'from', 'this', 'that', 'file', 'final', 'copy', 'new', 'old', 'img',
+             'image', 'doc', 'scan', 'dsc', 'pxl', 'untitled', 'version', 'draft', 'edit', 'edited'}
+
+_CAMEL = re.compile(r'([a-z])([A-Z])')
+_WORD = re.compile(r'[a-z]+')
+
+# keyword -> categories using it, in CATEGORY_KEYWORDS priority order
+_SINGLE_WORDS = collections.defaultdict(list)
+_PHRASES = collections.defaultdict(list)
+for _category, _keywords in CATEGORY_KEYWORDS.items():
+    for _keyword in _keywords:
+        (_PHRASES if ' ' in _keyword else _SINGLE_WORDS)[_keyword].append(_category)
+_PRIORITY = {category: i for i, category in enumerate(CATEGORY_KEYWORDS)}
+
+
+def tokenize(text):
+    """Lowercase word tokens, splitting camelCase, snake_case, digits and punctuation."""
+    return _WORD.findall(_CAMEL.sub(r'\1 \2', text).lower())
+
+
+def keyword_hits(tokens):
+    """Counter of vocabulary keywords (single words and phrases) present in a token list."""
+    hits = collections.Counter(token for token in tokens if token in _SINGLE_WORDS)
+    if _PHRASES:
+        joined = f" {' '.join(tokens)} "
+        for phrase in _PHRASES:
+            count = joined.count(f" {phrase} ")
+            if count:
+                hits[phrase] += count
+    return hits
+
+
+def image_hints(image):
+    """(tags, {category: weight}) from EXIF and dimensions of an open PIL image."""
+    tags, scores = [], {}
+    try:
+        exif = image.getexif()
+    except Exception:
+        exif = {}
+    make = str(exif.get(EXIF_MAKE, '')).strip('\x00 ')
+    if make or exif.get(EXIF_MODEL):
+        tags.append('photo')
+        if make:
+            tags.append(make.lower())
+        scores['People & Selfies'] = CAMERA_WEIGHT  # The vocabulary's home for "photo"; weak on purpose
+        if exif.get(GPS_IFD):
+            tags.append('geotagged')
+    elif image.size in SCREEN_SIZES or image.size[::-1] in SCREEN_SIZES:
+        tags.append('screenshot')
+        scores['Screenshots'] = SCREEN_WEIGHT
+    return tags, scores
+
+
+def analyze_locally(filename, text=None, image=None):
+    """Tags, category and confidence (0..1) for a file without calling a model.
+
+    text is the extracted content for documents, text and code; image an open
+    PIL image for pictures.
+    """
+    stem, ext = os.path.splitext(filename)
+    ext = ext.lstrip('.').lower()
+    scores = collections.defaultdict(float)
+    tag_weights = collections.Counter()
+
+    prior = EXTENSION_PRIORS.get(ext)
+    if prior:
+        prior_tags, category, weight = prior
+        scores[category] += weight
+        for tag in prior_tags:
+            tag_weights[tag] += weight
+
+    name_tokens = tokenize(stem)
+    for keyword, count in keyword_hits(name_tokens).items():
+        for category in _SINGLE_WORDS.get(keyword) or _PHRASES[keyword]:
+            scores[category] += FILENAME_WEIGHT
+        tag_weights[keyword] += FILENAME_WEIGHT
+    for token in name_tokens:
+        if len(token) >= 3 and token not in STOPWORDS:
+            tag_weights[token] += 0.5  # Descriptive filename words make good tags even off-vocabulary
+
+    if text:
+        for keyword, count in keyword_hits(tokenize(text[:TEXT_SCAN_CHARS])).items():
+            weight = TEXT_WEIGHT + TEXT_REPEAT_WEIGHT * (min(count, TEXT_MAX_REPEATS) - 1)
+            for category in _SINGLE_WORDS.get(keyword) or _PHRASES[keyword]:
+                scores[category] += weight
+            tag_weights[keyword] += weight
+
+    if image is not None:
+        hint_tags, hint_scores = image_hints(image)
+        for category, weight in hint_scores.items():
+            scores[category] += weight
+        for tag in hint_tags:
+            tag_weights[tag] += 1.0
+
+    if ext:
+        tag_weights[ext] += 0.1
+    tags = [tag for tag, _ in sorted(tag_weights.items(), key=lambda item: -item[1])[:MAX_TAGS]]
+
+    if not scores:
+        return {"tags": tags, "category": "Other", "confidence": 0.0}
+    category, top = max(scores.items(), key=lambda item: (item[1], -_PRIORITY.get(item[0], math.inf)))
+    confidence = top / (sum(scores.values()) + SMOOTHING)
+    return {"tags": tags, "category": category, "confidence": round(confidence, 3)}
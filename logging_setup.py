@@ -0,0 +1,126 @@
+"""Structured, non-blocking logging.
+
+Request threads only put log records on a bounded in-memory queue; a background
+QueueListener thread formats them (JSON by default) and writes to stdout. Every
+record carries the current request's correlation ID, and DEBUG records are
+sampled so high-volume diagnostics can stay enabled under load.
+
+    LOG_LEVEL              INFO | DEBUG | WARNING ... (default INFO)
+    LOG_FORMAT             json (default) | text
+    LOG_DEBUG_SAMPLE_RATE  fraction of DEBUG records kept (default 0.01); a record can
+                           override it with extra={'sample_rate': 1.0}
+    LOG_QUEUE_SIZE         records buffered before new ones are dropped (default 10000)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from flask import g, has_request_context, request
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# Attributes every LogRecord has; anything else was passed via extra= and is emitted as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id', 'sample_rate'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class ContextFilter(logging.Filter):
+    """Runs on the calling thread: attaches the request ID and samples DEBUG records."""
+
+    def __init__(self, debug_sample_rate):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG:
+            rate = getattr(record, 'sample_rate', self.debug_sample_rate)
+            if rate < 1 and random.random() >= rate:
+                return False
+        record.request_id = g.get('request_id') if has_request_context() else None
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread and drops records when the queue is full."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Resolve args and traceback now (they may not outlive the call); the JSON work happens later
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            NonBlockingQueueHandler.dropped += 1
+
+
+_listener = None
+
+
+def configure_logging():
+    """Route the root logger through the queue (idempotent; call before other modules log)."""
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    if os.environ.get('LOG_FORMAT', 'json').lower() == 'text':
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=int(os.environ.get('LOG_QUEUE_SIZE', 10000))))
+    handler.addFilter(ContextFilter(float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.01))))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def init_request_ids(app):
+    """Give every request a correlation ID (honouring an incoming X-Request-ID) and echo it back."""
+
+    @app.before_request
+    def assign_request_id():
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        g.request_id = incoming[:64] if incoming else uuid.uuid4().hex[:16]
+
+    @app.after_request
+    def echo_request_id(response):
+        if 'request_id' in g:
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+        return response
@@ -0,0 +1,240 @@
+"""In-process metrics with Prometheus text exposition, aggregated across gunicorn workers.
+
+Each worker records into its own registry (one small lock per metric, held for
+a dict lookup and a few additions). With METRICS_DIR set, a background thread
+writes the worker's snapshot to ``<METRICS_DIR>/<pid>.json`` every
+METRICS_FLUSH_SECONDS, and whichever worker serves /metrics sums the snapshots
+of all workers. Without METRICS_DIR, /metrics shows only the serving worker.
+"""
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+STALE_SNAPSHOT_SECONDS = 24 * 3600
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {'type': 'counter', 'help': self.help, 'labels': self.labelnames,
+                    'samples': [[list(k), v] for k, v in self._values.items()]}
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_text, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, '')) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {'type': 'histogram', 'help': self.help, 'labels': self.labelnames, 'buckets': list(self.buckets),
+                    'samples': [[list(k), list(v)] for k, v in self._values.items()]}
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram, self.labels = histogram, labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(self, fn):
+        """fn() returns {name: (help, labelnames, [(label values, value)])} of absolute counter values."""
+        self._collectors.append(fn)
+
+    def snapshot(self):
+        data = {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+        for collect in self._collectors:
+            for name, (help_text, labelnames, samples) in collect().items():
+                data[name] = {'type': 'counter', 'help': help_text, 'labels': list(labelnames),
+                              'samples': [[list(k), v] for k, v in samples]}
+        return data
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+
+
+# --- MULTI-WORKER AGGREGATION ---
+class SnapshotWriter:
+    """Periodically persists this worker's snapshot so other workers can serve it."""
+
+    def __init__(self, registry, directory, interval=5):
+        self.registry, self.directory, self.interval = registry, directory, interval
+        os.makedirs(directory, exist_ok=True)
+        self._thread = None
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f"{os.getpid()}.json")  # Evaluated after fork
+
+    def write(self):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp, self.path)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError:
+                pass
+
+    def collect(self):
+        """Fresh snapshot of this worker merged with the latest ones from the others."""
+        self.write()
+        snapshots = []
+        now = time.time()
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                if now - os.path.getmtime(path) > STALE_SNAPSHOT_SECONDS:
+                    os.remove(path)  # Long-gone worker; Prometheus treats the drop as a counter reset
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return merge(snapshots)
+
+
+def merge(snapshots):
+    merged = {}
+    for snap in snapshots:
+        for name, family in snap.items():
+            target = merged.setdefault(name, {**family, 'samples': {}})
+            for labels, value in family['samples']:
+                key = tuple(labels)
+                if family['type'] == 'histogram':
+                    current = target['samples'].get(key)
+                    target['samples'][key] = [a + b for a, b in zip(current, value)] if current else list(value)
+                else:
+                    target['samples'][key] = target['samples'].get(key, 0) + value
+    return merged
+
+
+# --- PROMETHEUS TEXT FORMAT ---
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(merged):
+    lines = []
+    for name in sorted(merged):
+        family = merged[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        names = family['labels']
+        for values, value in sorted(family['samples'].items()):
+            if family['type'] == 'histogram':
+                cumulative = 0
+                for bound, count in zip(family['buckets'] + ['+Inf'], value[:-1]):
+                    cumulative += count
+                    le = _labels(names, values, f'le="{bound}"')
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                lines.append(f"{name}_sum{_labels(names, values)} {_number(value[-1])}")
+                lines.append(f"{name}_count{_labels(names, values)} {cumulative}")
+            else:
+                lines.append(f"{name}{_labels(names, values)} {_number(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+def local_collect(registry=REGISTRY):
+    return merge([json.loads(json.dumps(registry.snapshot()))])
+
+
+# --- BOTO3 INSTRUMENTATION ---
+def instrument_boto_client(client, latency, errors):
+    """Time every API call made by a botocore client (including multipart parts) via its event hooks."""
+    service = client.meta.service_model.service_name
+
+    def before(context, **kwargs):
+        context['metrics_start'] = time.perf_counter()
+
+    def after(http_response, parsed, model, context, **kwargs):
+        start = context.pop('metrics_start', None)
+        if start is not None:
+            latency.observe(time.perf_counter() - start, service=service, operation=model.name)
+        if http_response.status_code >= 400:
+            errors.inc(service=service, operation=model.name, code=parsed.get('Error', {}).get('Code', http_response.status_code))
+
+    def after_error(exception, model, context, **kwargs):
+        start = context.pop('metrics_start', None)
+        if start is not None:
+            latency.observe(time.perf_counter() - start, service=service, operation=model.name)
+        errors.inc(service=service, operation=model.name, code=type(exception).__name__)
+
+    client.meta.events.register(f'before-call.{service}', before)
+    client.meta.events.register(f'after-call.{service}', after)
+    client.meta.events.register(f'after-call-error.{service}', after_error)
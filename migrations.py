@@ -0,0 +1,262 @@
+"""Versioned schema migrations.
+
+Each migration is a function registered with ``@migration(version, description)``
+that receives an open connection inside a transaction (or, for long backfills
+registered with ``transactional=False``, the engine, committing per batch). Applied versions are
+recorded in the ``schema_version`` table, so ``upgrade()`` only runs what is
+pending. Migrations inspect the live schema instead of relying on error
+messages, which keeps them safe on databases that were created fresh by
+``db.create_all()`` (already up to date) as well as on older deployments.
+
+Run from the command line:
+
+    flask --app app db-upgrade
+    flask --app app db-status
+    flask --app app orphan-cleanup
+
+Migrations only touch the database. Blobs they stop referencing are recorded
+in ``orphaned_blob``; ``db-status`` reports them and ``orphan-cleanup``
+deletes them from storage.
+"""
+import logging
+from datetime import datetime, timezone
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, inspect, select, text
+import tags
+
+log = logging.getLogger(__name__)
+
+MIGRATIONS = []
+BACKFILL_BATCH_SIZE = 1000
+
+
+def migration(version, description, transactional=True):
+    """Register a migration. Non-transactional ones receive the engine and commit in their own batches."""
+    def register(fn):
+        MIGRATIONS.append((version, description, fn, transactional))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+# --- SCHEMA HELPERS ---
+def has_column(conn, table, column):
+    return any(col['name'] == column for col in inspect(conn).get_columns(table))
+
+
+def has_index(conn, table, name):
+    insp = inspect(conn)
+    return (any(ix['name'] == name for ix in insp.get_indexes(table))
+            or any(uc['name'] == name for uc in insp.get_unique_constraints(table)))
+
+
+def add_column(conn, table, column, ddl):
+    if has_column(conn, table, column):
+        return False
+    conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+    return True
+
+
+def create_index(conn, table, name, columns, unique=False):
+    if has_index(conn, table, name):
+        return False
+    kind = 'UNIQUE INDEX' if unique else 'INDEX'
+    conn.execute(text(f'CREATE {kind} {name} ON {table} ({", ".join(columns)})'))
+    return True
+
+
+def record_orphaned_blobs(conn, keys, reason):
+    """Queue storage keys a migration stopped referencing for ``orphan-cleanup``."""
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS orphaned_blob ('
+        's3_key VARCHAR(500) PRIMARY KEY, reason VARCHAR(200) NOT NULL, recorded_at VARCHAR(40) NOT NULL)'
+    ))
+    now = datetime.now(timezone.utc).isoformat()
+    for key in keys:
+        if not conn.execute(text('SELECT 1 FROM orphaned_blob WHERE s3_key = :k'), {'k': key}).first():
+            conn.execute(text('INSERT INTO orphaned_blob (s3_key, reason, recorded_at) VALUES (:k, :r, :t)'),
+                         {'k': key, 'r': reason, 't': now})
+
+
+def orphaned_blobs(engine):
+    """Recorded orphan keys that no file_metadata row references (again), oldest first."""
+    if not inspect(engine).has_table('orphaned_blob'):
+        return []
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(text(
+            'SELECT s3_key FROM orphaned_blob WHERE s3_key NOT IN '
+            '(SELECT s3_key FROM file_metadata WHERE s3_key IS NOT NULL) ORDER BY recorded_at, s3_key'
+        ))]
+
+
+def forget_orphaned_blobs(engine, keys=None):
+    """Drop keys from orphaned_blob once deleted; with no keys, drop those a file row references again."""
+    if not inspect(engine).has_table('orphaned_blob'):
+        return
+    with engine.begin() as conn:
+        if keys is None:
+            conn.execute(text('DELETE FROM orphaned_blob WHERE s3_key IN '
+                              '(SELECT s3_key FROM file_metadata WHERE s3_key IS NOT NULL)'))
+        for key in keys or ():
+            conn.execute(text('DELETE FROM orphaned_blob WHERE s3_key = :k'), {'k': key})
+
+
+# --- MIGRATIONS ---
+@migration(1, 'Widen user.password to 512 characters')
+def widen_password_column(conn):
+    if conn.dialect.name != 'postgresql':
+        return  # SQLite does not enforce VARCHAR lengths
+    for col in inspect(conn).get_columns('user'):
+        if col['name'] == 'password' and (getattr(col['type'], 'length', None) or 512) < 512:
+            conn.execute(text('ALTER TABLE "user" ALTER COLUMN password TYPE VARCHAR(512)'))
+
+
+@migration(2, 'Add storage, category, size, sharing and hash columns to file_metadata')
+def add_file_metadata_columns(conn):
+    add_column(conn, 'file_metadata', 's3_key', 'VARCHAR(500)')
+    add_column(conn, 'file_metadata', 'category', 'VARCHAR(100)')
+    add_column(conn, 'file_metadata', 'file_size', 'INTEGER DEFAULT 0')
+    add_column(conn, 'file_metadata', 'share_token', 'VARCHAR(32)')
+    add_column(conn, 'file_metadata', 'content_hash', 'VARCHAR(64)')
+
+
+@migration(3, 'Index file_metadata lookups; unique (user_id, filename)')
+def index_file_metadata(conn):
+    # Uploads replace by (user_id, filename), but nothing enforced it. Keep the newest row of any duplicates.
+    dupes = conn.execute(text(
+        'SELECT id, s3_key FROM file_metadata WHERE id NOT IN '
+        '(SELECT MAX(id) FROM file_metadata GROUP BY user_id, filename)'
+    )).fetchall()
+    if dupes:
+        log.warning("Removing %d duplicate file_metadata rows; their blobs are queued for orphan-cleanup",
+                    len(dupes), extra={'file_ids': [row.id for row in dupes]})
+        record_orphaned_blobs(conn, [row.s3_key for row in dupes if row.s3_key],
+                              'migration 3: duplicate (user_id, filename) row')
+        conn.execute(text(
+            'DELETE FROM file_metadata WHERE id NOT IN '
+            '(SELECT MAX(id) FROM file_metadata GROUP BY user_id, filename)'
+        ))
+    # (user_id, filename) also serves every user_id-only filter, so no separate user_id index is needed
+    create_index(conn, 'file_metadata', 'uq_file_metadata_user_filename', ['user_id', 'filename'], unique=True)
+    create_index(conn, 'file_metadata', 'ix_file_metadata_user_category', ['user_id', 'category'])
+    # share_token was added by ALTER TABLE on older databases, which dropped its UNIQUE
+    insp = inspect(conn)
+    share_token_indexed = any(ix['column_names'] == ['share_token'] for ix in insp.get_indexes('file_metadata')) \
+        or any(uc['column_names'] == ['share_token'] for uc in insp.get_unique_constraints('file_metadata'))
+    if not share_token_indexed:
+        create_index(conn, 'file_metadata', 'uq_file_metadata_share_token', ['share_token'], unique=True)
+
+
+@migration(4, 'Normalized tag and file_tag tables, backfilled from file_metadata.tags', transactional=False)
+def normalize_tags(engine):
+    metadata = MetaData()
+    Table('tag', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', String(100), nullable=False, unique=True))
+    Table('file_tag', metadata,
+          Column('file_id', Integer, ForeignKey('file_metadata.id', ondelete='CASCADE'), primary_key=True),
+          Column('tag_id', Integer, ForeignKey('tag.id'), primary_key=True),
+          Column('user_id', Integer, nullable=False),
+          Index('ix_file_tag_user_tag', 'user_id', 'tag_id'))
+    Table('file_metadata', metadata, Column('id', Integer, primary_key=True))  # FK target only
+    with engine.begin() as conn:
+        metadata.tables['tag'].create(conn, checkfirst=True)
+        metadata.tables['file_tag'].create(conn, checkfirst=True)
+
+    # Backfill in keyset-paginated batches, one transaction each; re-running is safe
+    source = Table('file_metadata', MetaData(), Column('id', Integer), Column('user_id', Integer), Column('tags', String))
+    last_id, total = 0, 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(select(source.c.id, source.c.user_id, source.c.tags)
+                                .where(source.c.id > last_id).order_by(source.c.id)
+                                .limit(BACKFILL_BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+            tags.replace_file_tags(conn, [(row.id, row.user_id, row.tags) for row in rows])
+        last_id = rows[-1].id
+        total += len(rows)
+        log.info("Tagged %d files", total)
+
+
+
+@migration(5, 'Add perceptual hash column to file_metadata')
+def add_phash_column(conn):
+    # Existing images are hashed afterwards by `flask --app app phash-backfill` (needs the blobs)
+    add_column(conn, 'file_metadata', 'phash', 'VARCHAR(16)')
+
+
+@migration(6, 'Version history tables: file_version, chunk, file_version_chunk')
+def add_version_tables(conn):
+    metadata = MetaData()
+    Table('file_version', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('user_id', Integer, nullable=False),
+          Column('filename', String(300), nullable=False),
+          Column('version', Integer, nullable=False),
+          Column('file_size', Integer),
+          Column('content_hash', String(64)),
+          Column('tags', String(500)),
+          Column('category', String(100)),
+          Column('phash', String(16)),
+          Column('stored_bytes', Integer, nullable=False, default=0),
+          Column('created_at', DateTime, nullable=False),
+          Index('uq_file_version_user_filename_version', 'user_id', 'filename', 'version', unique=True))
+    Table('chunk', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('user_id', Integer, nullable=False),
+          Column('digest', String(64), nullable=False),
+          Column('size', Integer, nullable=False),
+          Index('uq_chunk_user_digest', 'user_id', 'digest', unique=True))
+    Table('file_version_chunk', metadata,
+          Column('version_id', Integer, ForeignKey('file_version.id', ondelete='CASCADE'), primary_key=True),
+          Column('seq', Integer, primary_key=True),
+          Column('chunk_id', Integer, ForeignKey('chunk.id'), nullable=False, index=True))
+    metadata.create_all(conn, checkfirst=True)
+
+
+@migration(7, 'Add chunk.unused_since so unused chunks are reaped after a grace period')
+def add_chunk_unused_since(conn):
+    # Chunks pruned before this were deleted with their rows, so existing rows are all in use
+    add_column(conn, 'chunk', 'unused_since', 'TIMESTAMP')
+    create_index(conn, 'chunk', 'ix_chunk_unused_since', ['unused_since'])
+
+
+# --- RUNNER ---
+def _ensure_version_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_version ('
+            'version INTEGER PRIMARY KEY, description VARCHAR(200) NOT NULL, applied_at VARCHAR(40) NOT NULL)'
+        ))
+
+
+def applied_versions(engine):
+    _ensure_version_table(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_version'))}
+
+
+def pending(engine):
+    done = applied_versions(engine)
+    return [(v, desc) for v, desc, _, _ in MIGRATIONS if v not in done]
+
+
+def upgrade(engine, target=None):
+    """Apply pending migrations in order, each in its own transaction. Returns the versions applied."""
+    done = applied_versions(engine)
+    applied = []
+    for version, description, fn, transactional in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        print(f"⏫ Migration {version}: {description}")
+        if not transactional:
+            fn(engine)
+        with engine.begin() as conn:
+            if transactional:
+                fn(conn)
+            conn.execute(
+                text('INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)'),
+                {'v': version, 'd': description, 't': datetime.now(timezone.utc).isoformat()}
+            )
+        applied.append(version)
+    return applied
@@ -0,0 +1,208 @@
+"""Thumbnails and document previews, rendered lazily and cached on disk.
+
+A preview is named by the file's content hash plus a variant (a thumbnail
+size, or the text snippet), so its URL changes whenever the contents do and
+browsers may cache it forever. Images are downscaled; PDFs and DOCX files
+get a page-like card with the start of their text (or, for scanned PDFs, the
+picture on the first page) and a JSON snippet.
+
+Rendering runs on a small worker pool rather than on request threads. The
+pool bounds how many originals are decoded at once however many previews a
+page asks for, and concurrent requests for the same preview wait on a single
+rendering (single flight) instead of each decoding the original.
+"""
+import io
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+from ai_utils import extraction_pool
+from similarity import IMAGE_EXTENSIONS
+
+log = logging.getLogger(__name__)
+
+THUMBNAIL_SIZES = {'sm': 96, 'md': 320, 'lg': 1024}  # Longest side in pixels
+DOCUMENT_EXTENSIONS = ('.pdf', '.docx')
+SNIPPET_CHARS = 1500
+JPEG_QUALITY = 82
+CARD_SIZE = (600, 780)  # Roughly letter-shaped
+CARD_COLORS = {'PDF': (220, 38, 38), 'DOCX': (37, 99, 235)}
+FAILURE_TTL = 300  # Seconds a failed rendering is remembered before it is retried
+
+
+class PreviewUnavailable(Exception):
+    """Raised when a preview can't be rendered (corrupt or unsupported file)."""
+
+
+class PreviewTimeout(Exception):
+    """Raised when a preview is still rendering after the caller's timeout."""
+
+
+def preview_kind(filename):
+    name = filename.lower()
+    if name.endswith(IMAGE_EXTENSIONS):
+        return 'image'
+    if name.endswith(DOCUMENT_EXTENSIONS):
+        return 'document'
+    return None
+
+
+def _jpeg(img):
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        background = Image.new('RGB', img.size, 'white')
+        background.paste(img.convert('RGBA'), mask=img.convert('RGBA').getchannel('A'))
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=img.width > 200)
+    return out.getvalue()
+
+
+def render_image(path, size):
+    """JPEG of the image scaled to fit size x size, EXIF rotation applied."""
+    with Image.open(path) as img:
+        img.draft('RGB', (size, size))  # JPEG: decode at the smallest scale that still covers size
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        return _jpeg(img)
+
+
+def document_text(path):
+    """(text of the first pages, page count or None), parsed in the extraction pool; ('', None) if unreadable."""
+    extracted = extraction_pool.extract_text(path, max_pages=2)
+    return extracted['text'], extracted['pages']
+
+
+def _first_page_picture(path):
+    """The picture on the first page of a scanned PDF, or None."""
+    data = extraction_pool.pdf_cover(path)
+    if not data:
+        return None
+    picture = Image.open(io.BytesIO(data))
+    picture.load()
+    return picture
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except (TypeError, OSError):  # Pillow without FreeType only has the small bitmap font
+        return ImageFont.load_default()
+
+
+def _wrap(draw, text, font, width, max_lines):
+    lines = []
+    for paragraph in text.splitlines():
+        line = ''
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if draw.textlength(candidate, font=font) <= width:
+                line = candidate
+                continue
+            if line:
+                lines.append(line)
+            line = word
+            if len(lines) >= max_lines:
+                return lines
+        if line:
+            lines.append(line)
+        if len(lines) >= max_lines:
+            return lines
+    return lines
+
+
+def render_document(path, size):
+    """JPEG card with the start of a document's text, or the first page's picture for scanned PDFs."""
+    label = 'PDF' if path.lower().endswith('.pdf') else 'DOCX'
+    if label == 'PDF':
+        picture = _first_page_picture(path)
+        if picture is not None:
+            picture.thumbnail((size, size), Image.Resampling.LANCZOS)
+            return _jpeg(picture)
+    text, _ = document_text(path)
+    card = Image.new('RGB', CARD_SIZE, 'white')
+    draw = ImageDraw.Draw(card)
+    draw.rectangle([0, 0, CARD_SIZE[0], 56], fill=CARD_COLORS[label])
+    draw.text((24, 12), label, fill='white', font=_font(28))
+    font = _font(18)
+    line_height = 26
+    lines = _wrap(draw, text[:SNIPPET_CHARS * 2], font, CARD_SIZE[0] - 48, (CARD_SIZE[1] - 88) // line_height)
+    for i, line in enumerate(lines or ['(no text)']):
+        draw.text((24, 80 + i * line_height), line, fill=(55, 65, 81), font=font)
+    draw.rectangle([0, 0, CARD_SIZE[0] - 1, CARD_SIZE[1] - 1], outline=(209, 213, 219), width=2)
+    card.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return _jpeg(card)
+
+
+def render_snippet(path):
+    """JSON {text, pages} with the start of a document's text."""
+    text, pages = document_text(path)
+    return json.dumps({'text': ' '.join(text.split())[:SNIPPET_CHARS], 'pages': pages}).encode('utf-8')
+
+
+class PreviewRenderer:
+    """Single-flight, bounded-concurrency rendering into a BlobCache."""
+
+    def __init__(self, cache, workers=2):
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='preview')
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Future
+        self._failed = OrderedDict()  # key -> monotonic time of the failure
+        self.renders = 0
+        self.shared = 0
+        self.failures = 0
+        self.timeouts = 0
+
+    def get(self, key, render, timeout=None):
+        """Local path of the cached preview `key`, calling render() -> bytes on a miss.
+
+        Raises PreviewUnavailable if rendering fails (remembered for a few
+        minutes) and PreviewTimeout if it takes longer than timeout; the
+        rendering still finishes and is cached for the next request.
+        """
+        path = self.cache.cached_path(key)
+        if path:
+            return path
+        with self._lock:
+            failed_at = self._failed.get(key)
+            if failed_at is not None:
+                if time.monotonic() - failed_at < FAILURE_TTL:
+                    raise PreviewUnavailable(key)
+                del self._failed[key]
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = self._pool.submit(self._fill, key, render)
+            else:
+                self.shared += 1
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            raise PreviewTimeout(key)
+
+    def _fill(self, key, render):
+        try:
+            return self.cache.get_path(key, lambda out: out.write(render()))
+        except Exception as e:
+            log.warning("Preview rendering failed for %s: %s", key, e)
+            with self._lock:
+                self.failures += 1
+                self._failed[key] = time.monotonic()
+                while len(self._failed) > 10000:
+                    self._failed.popitem(last=False)
+            raise PreviewUnavailable(key) from e
+        finally:
+            with self._lock:
+                self.renders += 1
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'renders': self.renders, 'shared': self.shared, 'failures': self.failures,
+                    'timeouts': self.timeouts, 'inflight': len(self._inflight), **self.cache.stats()}
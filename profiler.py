@@ -0,0 +1,217 @@
+"""Opt-in slow-request profiler.
+
+A sampled fraction of requests is watched by one background thread that reads
+the request thread's stack from ``sys._current_frames()`` every few
+milliseconds. Requests that finish above the latency threshold get their
+samples written as folded stacks (one ``frame;frame;frame count`` line each —
+the input format of flamegraph.pl and speedscope) and a log line summarising
+their SQL: statement count, time, and statements repeated often enough to look
+like an N+1 (e.g. lazy ``owner`` loads while a template renders).
+Unsampled requests only pay for a random() call.
+
+Settings can be changed at runtime with ``update()``; when a state file is
+configured every worker picks the change up within a second.
+"""
+import collections
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger(__name__)
+
+_LIBRARY_MARKERS = (f'{os.sep}sqlalchemy{os.sep}', f'{os.sep}flask_sqlalchemy{os.sep}', f'{os.sep}profiler.py')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fold(frame):
+    """Root-first ``file:function`` chain for one stack."""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+def _caller():
+    """First frame outside SQLAlchemy — the code (or template) that triggered a statement."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        if not any(marker in frame.f_code.co_filename for marker in _LIBRARY_MARKERS):
+            return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}"
+        frame = frame.f_back
+    return None
+
+
+class StackSampler:
+    """One daemon thread sampling the stacks of the threads currently registered with it."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._active = {}  # thread ident -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, ident):
+        stacks = collections.Counter()
+        with self._lock:
+            self._active[ident] = stacks
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return stacks
+
+    def remove(self, ident):
+        with self._lock:
+            self._active.pop(ident, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                watched = list(self._active.items())
+                if not watched:
+                    self._wakeup.clear()
+            if not watched:
+                self._wakeup.wait()
+                continue
+            frames = sys._current_frames()
+            for ident, stacks in watched:
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[fold(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class SlowRequestProfiler:
+    SETTINGS = ('enabled', 'sample_rate', 'threshold_ms')
+
+    def __init__(self, enabled=False, sample_rate=0.05, threshold_ms=500, interval_ms=5,
+                 output_dir='profiles', query_budget=20, n_plus_one=5, state_file=None):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.threshold_ms = threshold_ms
+        self.output_dir = output_dir
+        self.query_budget = query_budget
+        self.n_plus_one = n_plus_one
+        self.state_file = state_file
+        self.sampler = StackSampler(interval_ms / 1000)
+        self._state_mtime = None
+        self._state_checked = 0.0
+
+    # --- RUNTIME SETTINGS ---
+    def settings(self):
+        self._reload_state()
+        return {name: getattr(self, name) for name in self.SETTINGS}
+
+    def update(self, **changes):
+        """Apply new settings; with a state file they reach every worker."""
+        for name, value in changes.items():
+            if name in self.SETTINGS and value is not None:
+                setattr(self, name, value)
+        if self.state_file:
+            tmp = f"{self.state_file}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump({name: getattr(self, name) for name in self.SETTINGS}, f)
+            os.replace(tmp, self.state_file)
+        return self.settings()
+
+    def _reload_state(self):
+        now = time.monotonic()
+        if not self.state_file or now - self._state_checked < 1:
+            return
+        self._state_checked = now
+        try:
+            mtime = os.path.getmtime(self.state_file)
+            if mtime == self._state_mtime:
+                return
+            with open(self.state_file) as f:
+                state = json.load(f)
+            self._state_mtime = mtime
+        except (OSError, ValueError):
+            return
+        for name in self.SETTINGS:
+            if name in state:
+                setattr(self, name, state[name])
+
+    # --- FLASK INTEGRATION ---
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+        event.listen(Engine, 'before_cursor_execute', self._before_statement)
+        event.listen(Engine, 'after_cursor_execute', self._after_statement)
+
+    def _start(self):
+        g.profile_started = time.perf_counter()
+        self._reload_state()
+        if self.enabled and random.random() < self.sample_rate:
+            g.profile_stacks = self.sampler.add(threading.get_ident())
+            g.profile_sql = {}  # normalized statement -> [count, seconds, first caller]
+
+    def _before_statement(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'profile_sql' in g:
+            conn.info['profile_statement_start'] = time.perf_counter()
+
+    def _after_statement(self, conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop('profile_statement_start', None)
+        if start is None or not has_request_context() or 'profile_sql' not in g:
+            return
+        key = _WHITESPACE.sub(' ', statement).strip()
+        entry = g.profile_sql.get(key)
+        if entry is None:
+            entry = g.profile_sql[key] = [0, 0.0, _caller()]
+        entry[0] += 1
+        entry[1] += time.perf_counter() - start
+
+    def _finish(self, exc):
+        if 'profile_started' not in g:
+            return
+        elapsed_ms = (time.perf_counter() - g.profile_started) * 1000
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        queries = g.get('db_queries', 0)  # Counted for every request by the metrics hook in app.py
+        if queries > self.query_budget:
+            log.warning("Request exceeded its query budget",
+                        extra={'route': route, 'db_queries': queries, 'query_budget': self.query_budget,
+                               'duration_ms': round(elapsed_ms, 1)})
+        if 'profile_stacks' not in g:
+            return
+        self.sampler.remove(threading.get_ident())
+        if elapsed_ms < self.threshold_ms:
+            return
+        try:
+            path = self._write_folded(route, g.profile_stacks)
+        except OSError as e:
+            log.warning("Could not write profile: %s", e)
+            path = None
+        sql = g.profile_sql
+        repeated = sorted(([count, key, seconds, caller] for key, (count, seconds, caller) in sql.items()
+                           if count >= self.n_plus_one and key.upper().startswith('SELECT')), reverse=True)
+        log.warning("Slow request profiled", extra={
+            'route': route,
+            'duration_ms': round(elapsed_ms, 1),
+            'samples': sum(g.profile_stacks.values()),
+            'profile': path,
+            'sql_statements': sum(entry[0] for entry in sql.values()),
+            'sql_ms': round(sum(entry[1] for entry in sql.values()) * 1000, 1),
+            'n_plus_one': [{'statement': key[:200], 'count': count, 'ms': round(seconds * 1000, 1), 'caller': caller}
+                           for count, key, seconds, caller in repeated],
+        })
+
+    def _write_folded(self, route, stacks):
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{g.get('request_id', os.getpid())}.folded")
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
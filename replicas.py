@@ -0,0 +1,60 @@
+import random
+import time
+from functools import wraps
+from flask import g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA_BIND_PREFIX = 'replica_'
+LAST_WRITE_SESSION_KEY = '_db_last_write'
+
+
+def replica_binds(urls, options_for):
+    """SQLALCHEMY_BINDS entries for a list of replica URLs, each with its own engine options."""
+    return {f"{REPLICA_BIND_PREFIX}{i}": {'url': url, **options_for(url)} for i, url in enumerate(urls)}
+
+
+class RoutingSession(Session):
+    """Session that sends reads from read-only request handlers to a replica engine.
+
+    Everything goes to the primary unless the current request was marked with
+    @read_only and the client has not written recently. Flushes and
+    INSERT/UPDATE/DELETE statements always go to the primary, and once a
+    request has written, its remaining reads do too.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                g.db_wrote = True
+            elif g.get('db_read_only') and not g.get('db_wrote'):
+                engines = self._db.engines
+                replicas = [key for key in engines if isinstance(key, str) and key.startswith(REPLICA_BIND_PREFIX)]
+                if replicas:
+                    if 'db_replica' not in g:
+                        g.db_replica = random.choice(replicas)  # One replica per request for consistent reads
+                    return engines[g.db_replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(sticky_seconds):
+    """Decorator for handlers that only read, routing them to replicas.
+
+    Clients that wrote within the last sticky_seconds keep reading from the
+    primary so they see their own changes despite replication lag.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            last_write = session.get(LAST_WRITE_SESSION_KEY)
+            g.db_read_only = not last_write or time.time() - last_write > sticky_seconds
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def remember_write(response):
+    """after_request hook: stamp the session when this request wrote to the primary."""
+    if g.get('db_wrote'):
+        session[LAST_WRITE_SESSION_KEY] = time.time()
+    return response
@@ -0,0 +1,152 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import table, column, update
+from signed_tokens import BadSignature, TokenSigner
+
+# Use counters of limited-use links (the ShareLinkUse model in app.py)
+link_use_table = table('share_link_use', column('jti'), column('uses'), column('max_uses'))
+
+
+class InvalidShareToken(Exception):
+    """Raised when a share token is malformed, forged, expired or revoked."""
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+class ShareLinkSigner:
+    """Issues and verifies self-contained share tokens.
+
+    A token is ``<base64 payload>.<base64 HMAC>``. The payload carries only
+    the file id and owner, which the app resolves to the file's current row,
+    plus a link id, the issue time, the expiry and an optional use limit.
+    The payload is readable by anyone holding the link, so it leaves out the
+    storage key, filename and content hash.
+    """
+
+    def __init__(self, secret):
+        self._signer = TokenSigner(secret, b'share-link')
+
+    def issue(self, file_meta, expires_in=None, max_uses=None):
+        """Return (token, payload) for a file. expires_in is in seconds; None never expires."""
+        issued = now_ms()
+        payload = {
+            'f': file_meta.id,
+            'u': file_meta.user_id,
+            'i': issued,
+            'j': secrets.token_hex(8),
+        }
+        if expires_in:
+            payload['e'] = issued // 1000 + int(expires_in)
+        if max_uses:
+            payload['m'] = int(max_uses)
+        return self._signer.dumps(payload), payload
+
+    def verify(self, token):
+        """Return the payload of a genuine, unexpired token or raise InvalidShareToken."""
+        try:
+            payload = self._signer.loads(token)
+        except BadSignature:
+            raise InvalidShareToken('Invalid share link')
+        except ValueError:
+            raise InvalidShareToken('Malformed share link')
+        if not isinstance(payload, dict):
+            raise InvalidShareToken('Malformed share link')
+        if payload.get('e') and payload['e'] < time.time():
+            raise InvalidShareToken('This share link has expired')
+        return payload
+
+    @staticmethod
+    def is_signed(token):
+        # Legacy random tokens from secrets.token_urlsafe never contain a dot
+        return '.' in token
+
+
+def claim_use(session, jti):
+    """Take one download of a limited-use link with a single conditional UPDATE; False once none are left."""
+    return session.execute(update(link_use_table).where(
+        link_use_table.c.jti == jti, link_use_table.c.uses < link_use_table.c.max_uses
+    ).values(uses=link_use_table.c.uses + 1)).rowcount == 1
+
+
+def release_use(session, jti):
+    """Give back a use claimed for a download that then failed."""
+    session.execute(update(link_use_table).where(
+        link_use_table.c.jti == jti, link_use_table.c.uses > 0
+    ).values(uses=link_use_table.c.uses - 1))
+
+
+class RevocationList:
+    """Per-worker copy of {file_id: revoked_at_ms}, refreshed from the database on an interval.
+
+    Revoking a file invalidates every link issued for it before that moment,
+    so the list holds one small row per revoked file rather than one per link.
+    Other workers pick up a revocation within ``refresh_seconds``.
+    """
+
+    def __init__(self, loader, refresh_seconds=30):
+        self._loader = loader
+        self.refresh_seconds = refresh_seconds
+        self._revoked = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _maybe_refresh(self):
+        if time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if time.monotonic() - self._loaded_at < self.refresh_seconds:
+                return
+            self._revoked = dict(self._loader())
+            self._loaded_at = time.monotonic()
+
+    def is_revoked(self, payload):
+        self._maybe_refresh()
+        revoked_at = self._revoked.get(payload['f'])
+        return revoked_at is not None and payload['i'] <= revoked_at
+
+    def mark_revoked(self, file_id, revoked_at):
+        """Apply a revocation made by this worker immediately."""
+        with self._lock:
+            self._revoked[file_id] = revoked_at
+
+
+class SharedFileCache:
+    """Per-worker TTL cache of the file a share link points at, keyed by file id.
+
+    Entries are detached snapshots (or None for a file that no longer exists),
+    so repeated views and downloads of a popular link skip the database.
+    Writes in this worker invalidate the file immediately; other workers see
+    the change within ``ttl`` seconds, and a download that finds its blob
+    gone reloads the row once.
+    """
+
+    def __init__(self, loader, ttl=30, max_entries=10000):
+        self._loader = loader
+        self._entries = OrderedDict()  # file_id -> (expires_at, snapshot or None)
+        self._lock = threading.Lock()
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get(self, file_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(file_id)
+                return entry[1]
+        snapshot = self._loader(file_id)
+        with self._lock:
+            self._entries[file_id] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(file_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, *file_ids):
+        with self._lock:
+            for file_id in file_ids:
+                self._entries.pop(file_id, None)
@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+class ShareStatsBuffer:
+    """Collects share-link download counters in memory and flushes them in batches.
+
+    Each worker accumulates ``{link_id: [downloads, bytes, last_access, file_id]}``
+    and hands the whole batch to ``flush_fn`` once ``max_pending`` links are
+    dirty or ``flush_interval`` seconds have passed, so the download path
+    itself never writes to the database.
+    """
+
+    def __init__(self, flush_fn, flush_interval=30, max_pending=500):
+        self._flush_fn = flush_fn
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background flusher (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name='share-stats-flush', daemon=True)
+        self._thread.start()
+
+    def record(self, link_id, file_id, bytes_served):
+        with self._lock:
+            entry = self._pending.get(link_id)
+            if entry is None:
+                entry = self._pending[link_id] = [0, 0, 0.0, file_id]
+            entry[0] += 1
+            entry[1] += bytes_served
+            entry[2] = time.time()
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def pending(self, link_id):
+        """Counts recorded by this worker that have not been flushed yet."""
+        with self._lock:
+            entry = self._pending.get(link_id)
+            return (entry[0], entry[1], entry[2]) if entry else (0, 0, None)
+
+    def flush(self):
+        """Write out everything pending. Failed batches are merged back for the next attempt."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            try:
+                self._flush_fn(batch)
+            except Exception as e:
+                log.warning("Share stats flush failed, will retry: %s", e)
+                with self._lock:
+                    for link_id, (downloads, nbytes, last, file_id) in batch.items():
+                        entry = self._pending.setdefault(link_id, [0, 0, 0.0, file_id])
+                        entry[0] += downloads
+                        entry[1] += nbytes
+                        entry[2] = max(entry[2], last)
+                return 0
+            return len(batch)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
@@ -0,0 +1,52 @@
+"""Self-contained signed tokens: ``<base64 JSON payload>.<base64 HMAC>``.
+
+Used by share links and direct-upload tickets. Each use derives its own key
+from the app secret and a purpose string, so a token issued for one can
+never verify as the other.
+"""
+import base64
+import hashlib
+import hmac
+import json
+
+SIGNATURE_BYTES = 16  # Truncated HMAC-SHA256: 128-bit tags keep URLs short
+
+
+class BadSignature(Exception):
+    """Raised when a well-formed token was not signed with this key."""
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TokenSigner:
+    def __init__(self, secret, purpose):
+        if isinstance(secret, str):
+            secret = secret.encode('utf-8')
+        self._key = hashlib.sha256(purpose + b':' + secret).digest()
+
+    def sign(self, body):
+        return hmac.new(self._key, body.encode('ascii'), hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+    def dumps(self, payload):
+        body = b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+        return f"{body}.{b64encode(self.sign(body))}"
+
+    def loads(self, token):
+        """Return the payload of a token signed with this key.
+
+        Raises BadSignature if it was forged or tampered with, ValueError if it is malformed.
+        """
+        try:
+            body, signature = token.split('.', 1)
+            valid = hmac.compare_digest(b64decode(signature), self.sign(body))
+        except (ValueError, UnicodeError, AttributeError, TypeError):
+            raise ValueError('Malformed token')
+        if not valid:
+            raise BadSignature('Invalid token signature')
+        return json.loads(b64decode(body))
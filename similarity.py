@@ -0,0 +1,194 @@
+"""Perceptual hashing and near-duplicate lookup for images.
+
+``dhash`` reduces an image to 64 bits describing whether brightness rises or
+falls between neighbouring pixels of a 9x8 thumbnail, so re-encoding, resizing
+and small edits flip only a few bits. Near-duplicates are hashes within a small
+Hamming distance, found with multi-index hashing. (A BK-tree was measured too:
+dHashes are spread too evenly over 64 bits for its triangle-inequality pruning,
+and at radius 8 it visited ~45% of a 100k library — slower than a linear scan.
+See benchmarks/bench_similarity.py.)
+
+Images with almost no left-right gradient (blank scans, solid fills, clear
+skies, near-black photos) have nothing for the bits to describe: they come out
+as compression noise or all zero, so all such images would "match" each other.
+They get no hash and stay out of the index.
+
+SimilarityIndex keeps one index per user in memory, built from the database on
+first use and rebuilt when the user's image set changes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from PIL import Image
+
+HASH_BITS = 64
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp', '.tiff')
+MIN_GRADIENT = 1.0  # Mean grey-level step (0-255) between neighbouring thumbnail pixels below which an image is flat
+
+
+def dhash(image, size=8):
+    """64-bit difference hash of a PIL image, or None if it is too flat to hash."""
+    small = image.convert('L').resize((size + 1, size), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    value = steps = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            left, right = pixels[offset + col], pixels[offset + col + 1]
+            value = (value << 1) | (left > right)
+            steps += abs(left - right)
+    if steps < MIN_GRADIENT * size * size:
+        return None
+    return value
+
+
+def dhash_file(path):
+    """Hex dHash of an image file, or None if it isn't a readable image or is flat."""
+    if not path.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    try:
+        with Image.open(path) as img:
+            img.draft('L', (64, 64))  # JPEG: decode at reduced size, much faster for camera photos
+            value = dhash(img)
+            return to_hex(value) if value is not None else None
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def to_hex(value):
+    return f"{value:016x}"
+
+
+def from_hex(text):
+    return int(text, 16)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """Multi-index hashing over 64-bit hashes (Norouzi et al.): exact Hamming radius search.
+
+    Each hash is split into CHUNKS 16-bit chunks, each indexed in its own dict.
+    If two hashes differ in at most k bits, some chunk differs in at most
+    k // CHUNKS bits (pigeonhole), so a query only probes the chunk values within
+    that small radius and checks the full distance of what it finds there.
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = HASH_BITS // CHUNKS
+    _CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+    def __init__(self):
+        self._tables = [{} for _ in range(self.CHUNKS)]  # chunk value -> [(hash, item)]
+        self.size = 0
+
+    def _chunks(self, value):
+        return [(value >> (i * self.CHUNK_BITS)) & self._CHUNK_MASK for i in range(self.CHUNKS)]
+
+    def add(self, value, item):
+        self.size += 1
+        entry = (value, item)
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            table.setdefault(chunk, []).append(entry)
+
+    def search(self, value, max_distance):
+        """[(distance, item)] for every item within max_distance, nearest first, and how many were checked."""
+        flips = _flip_masks(self.CHUNK_BITS, max_distance // self.CHUNKS)
+        found, seen, checked = [], set(), 0
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            for flip in flips:
+                bucket = table.get(chunk ^ flip)
+                if not bucket:
+                    continue
+                for other, item in bucket:
+                    if item in seen:
+                        continue
+                    seen.add(item)
+                    checked += 1
+                    d = (value ^ other).bit_count()
+                    if d <= max_distance:
+                        found.append((d, item))
+        found.sort()
+        return found, checked
+
+
+_FLIP_MASKS = {}
+
+
+def _flip_masks(bits, radius):
+    """Every mask of `bits` bits with at most `radius` bits set (cached)."""
+    key = (bits, radius)
+    if key not in _FLIP_MASKS:
+        masks = [0]
+        for _ in range(radius):
+            masks = sorted({mask | (1 << b) for mask in masks for b in range(bits)} | set(masks))
+        _FLIP_MASKS[key] = masks
+    return _FLIP_MASKS[key]
+
+
+def duplicate_groups(entries, max_distance):
+    """Cluster (item, hash) pairs whose hashes are within max_distance of each other (transitively).
+
+    Returns lists of items, largest groups first; singletons are left out.
+    """
+    index = MultiIndexHash()
+    for item, value in entries:
+        index.add(value, item)
+    parent = {item: item for item, _ in entries}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for item, value in entries:
+        for _, other in index.search(value, max_distance)[0]:
+            a, b = find(item), find(other)
+            if a != b:
+                parent[b] = a
+    groups = {}
+    for item, _ in entries:
+        groups.setdefault(find(item), []).append(item)
+    return sorted((g for g in groups.values() if len(g) > 1), key=len, reverse=True)
+
+
+class SimilarityIndex:
+    """Per-user MultiIndexHash indexes cached in memory (LRU over users).
+
+    load(user_id) -> [(file_id, hash int)] builds an index; signature(user_id) is
+    a cheap value (e.g. count and max id) that changes when images are added or
+    removed, checked on every lookup. Indexes are also rebuilt after ttl seconds
+    so replaced files uploaded through other workers are picked up.
+    """
+
+    def __init__(self, load, signature, max_users=256, ttl=300):
+        self._load = load
+        self._signature = signature
+        self.max_users = max_users
+        self.ttl = ttl
+        self._indexes = OrderedDict()  # user_id -> (signature, built_at, index)
+        self._lock = threading.Lock()
+
+    def index(self, user_id):
+        signature = self._signature(user_id)
+        with self._lock:
+            cached = self._indexes.get(user_id)
+            if cached and cached[0] == signature and time.monotonic() - cached[1] < self.ttl:
+                self._indexes.move_to_end(user_id)
+                return cached[2]
+        index = MultiIndexHash()
+        for file_id, value in self._load(user_id):
+            index.add(value, file_id)
+        with self._lock:
+            self._indexes[user_id] = (signature, time.monotonic(), index)
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._indexes.pop(user_id, None)
@@ -115,7 +115,12 @@ function updateFileName(input) {
     if (!fileNameDisplay) return;
     
     try {
-        if (input.files && input.files[0]) {
+        if (input.files && input.files.length > 1) {
+            const totalSize = Array.from(input.files).reduce((sum, f) => sum + f.size, 0);
+            fileNameDisplay.textContent = `${input.files.length} files (${formatFileSize(totalSize)})`;
+            fileNameDisplay.classList.remove('text-white');
+            fileNameDisplay.classList.add('text-blue-100', 'font-medium');
+        } else if (input.files && input.files[0]) {
             const file = input.files[0];
             const fileName = file.name;
             const fileSize = formatFileSize(file.size);
@@ -137,9 +142,10 @@ function validateFileSize(input) {
     const maxSize = 50 * 1024 * 1024; // 50MB in bytes
     
     try {
-        if (input.files && input.files[0]) {
-            if (input.files[0].size > maxSize) {
-                alert('File size exceeds 50MB limit. Please choose a smaller file.');
+        if (input.files && input.files.length > 0) {
+            const tooLarge = Array.from(input.files).find(f => f.size > maxSize);
+            if (tooLarge) {
+                alert(`"${tooLarge.name}" exceeds the 50MB limit. Please choose a smaller file.`);
                 input.value = '';
                 updateFileName(input);
                 return false;
@@ -413,4 +419,62 @@ function initDragDrop() {
     } catch (error) {
         console.error('Error initializing drag and drop:', error);
     }
-}
\ No newline at end of file
+}
+
+// Direct-to-storage upload: presign, POST each file straight to the bucket, then register them.
+// Resolves to false when the server doesn't offer direct uploads (the form upload is used instead),
+// otherwise to {uploaded, failed: [names], message}.
+const DIRECT_UPLOAD_PARALLEL = 3;
+
+async function directUpload(files, onProgress) {
+    files = Array.from(files);
+    const presign = await fetch('/upload/presign', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({files: files.map(f => ({name: f.name, size: f.size, type: f.type}))})
+    });
+    if (presign.status === 404) return false;
+    const data = await presign.json();
+    if (!presign.ok) throw new Error(data.error || 'Could not prepare the upload');
+
+    const tickets = [];
+    const failed = [];
+    let message = null;
+    let next = 0;
+    let done = 0;
+    async function worker() {
+        while (next < data.uploads.length) {
+            const i = next++;
+            const upload = data.uploads[i];
+            const form = new FormData();
+            Object.entries(upload.fields).forEach(([name, value]) => form.append(name, value));
+            form.append('file', files[i]);  // Must come after the policy fields
+            try {
+                const response = await fetch(upload.url, {method: 'POST', body: form});
+                if (response.ok) {
+                    tickets.push(upload.ticket);
+                } else {
+                    failed.push(upload.name);
+                }
+            } catch (error) {
+                console.error('Direct upload failed:', upload.name, error);
+                failed.push(upload.name);
+            }
+            if (onProgress) onProgress(++done, data.uploads.length);
+        }
+    }
+    await Promise.all(Array.from({length: Math.min(DIRECT_UPLOAD_PARALLEL, data.uploads.length)}, worker));
+
+    if (tickets.length) {
+        const complete = await fetch('/upload/complete', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({tickets: tickets})
+        });
+        const result = await complete.json();
+        (result.files || []).filter(f => f.status !== 'registered').forEach(f => failed.push(f.name || f.status));
+        if (!result.files) failed.push(result.error || 'Upload failed');
+        message = result.message || null;
+    }
+    return {uploaded: tickets.length, failed: failed, message: message};
+}
@@ -0,0 +1,371 @@
+import os
+import hashlib
+import shutil
+import tempfile
+from datetime import datetime, timezone
+import boto3
+from boto3.exceptions import S3UploadFailedError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from werkzeug.utils import secure_filename
+
+# fsync policies for the local blob store:
+#   none - rely on the OS page cache (fastest, may lose recent writes on power loss)
+#   file - fsync the blob before it is renamed into place (default)
+#   full - also fsync the shard directory so the rename itself is durable
+FSYNC_POLICIES = ('none', 'file', 'full')
+
+COPY_BUFFER_SIZE = 1024 * 1024  # 1MB
+MB = 1024 * 1024
+S3_DELETE_BATCH_SIZE = 1000  # Hard limit of DeleteObjects
+
+
+class StorageError(Exception):
+    """Raised when a storage backend operation fails."""
+
+
+class BlobStore:
+    """Interface shared by every storage backend.
+
+    Keys are opaque strings such as ``user_1/<token>_report.pdf``.
+    """
+
+    def save(self, key, fileobj, content_type=None):
+        """Store a readable binary file-like object under key. Returns the size in bytes."""
+        raise NotImplementedError
+
+    def open(self, key):
+        """Return a readable binary file-like object for key. Caller closes it."""
+        raise NotImplementedError
+
+    def download(self, key, fileobj):
+        """Copy the blob into a writable binary file-like object."""
+        with self.open(key) as src:
+            shutil.copyfileobj(src, fileobj, COPY_BUFFER_SIZE)
+
+    def delete(self, key):
+        """Remove a blob. Missing blobs are not an error."""
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        """Remove several blobs. Returns {key: error message} for the ones that failed."""
+        errors = {}
+        for key in keys:
+            try:
+                self.delete(key)
+            except StorageError as e:
+                errors[key] = str(e)
+        return errors
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def stat(self, key):
+        """Return {'size', 'content_type'} for a blob (content_type may be None). Raises StorageError if missing."""
+        raise NotImplementedError
+
+    def read_range(self, key, start, end):
+        """Return bytes start..end (inclusive, like an HTTP Range) of a blob; shorter at the end of it."""
+        with self.open(key) as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    def list(self, prefix='', limit=100):
+        """Return up to limit dicts with key, size and last_modified."""
+        raise NotImplementedError
+
+    def local_path(self, key):
+        """Return a filesystem path for key if the backend keeps blobs on local disk, else None."""
+        return None
+
+    def presigned_url(self, key, expires_in=3600, filename=None):
+        """Return a time-limited direct download URL, or None if the backend can't issue one."""
+        return None
+
+    def presigned_post(self, key, max_bytes, content_type, expires_in=900):
+        """Return {'url', 'fields'} for a browser form POST straight to the backend, or None if unsupported.
+
+        The policy only accepts exactly this key and content type and bodies of 1..max_bytes.
+        """
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    """Durable blob store on local disk with a hash-sharded directory layout.
+
+    A key like ``user_1/3f2a..._report.pdf`` is stored at
+    ``<root>/<h[0:2]>/<h[2:4]>/<h>_3f2a..._report.pdf`` where ``h`` is the SHA-1
+    of the key, so no single directory grows past a few thousand entries. The
+    full hash in the name keeps keys with the same last segment apart (e.g.
+    every user's ``chunks/<sha256>``); blobs written before it was added, named
+    by the last segment alone, are still found.
+    """
+
+    def __init__(self, root, fsync_policy='file'):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync_policy}', expected one of {FSYNC_POLICIES}")
+        self.root = os.path.abspath(root)
+        self.fsync_policy = fsync_policy
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        """Return the on-disk path for a key (the file may not exist)."""
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        leaf = secure_filename(key.rsplit('/', 1)[-1])[-200:]  # Stays under the 255-byte name limit
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}_{leaf}" if leaf else digest)
+
+    def _legacy_path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        leaf = secure_filename(key.rsplit('/', 1)[-1]) or digest
+        return os.path.join(self.root, digest[:2], digest[2:4], leaf)
+
+    def _existing_path(self, key):
+        """path(key), or where the old layout put the blob if only that exists."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            legacy = self._legacy_path(key)
+            if os.path.exists(legacy):
+                return legacy
+        return path
+
+    def local_path(self, key):
+        return self._existing_path(key)
+
+    def save(self, key, fileobj, content_type=None):
+        """Atomically write a file-like object under key. Returns the size in bytes."""
+        final_path = self.path(key)
+        shard_dir = os.path.dirname(final_path)
+        os.makedirs(shard_dir, exist_ok=True)
+
+        # Write next to the final location so the rename never crosses filesystems
+        fd, tmp_path = tempfile.mkstemp(dir=shard_dir, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(fileobj, out, COPY_BUFFER_SIZE)
+                out.flush()
+                if self.fsync_policy != 'none':
+                    os.fsync(out.fileno())
+                size = out.tell()
+            os.replace(tmp_path, final_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        if self.fsync_policy == 'full':
+            self._fsync_dir(shard_dir)
+        return size
+
+    def open(self, key):
+        try:
+            return open(self._existing_path(key), 'rb')
+        except FileNotFoundError as e:
+            raise StorageError(f"Blob not found: {key}") from e
+
+    def exists(self, key):
+        return os.path.exists(self._existing_path(key))
+
+    def stat(self, key):
+        try:
+            return {'size': os.path.getsize(self._existing_path(key)), 'content_type': None}
+        except FileNotFoundError as e:
+            raise StorageError(f"Blob not found: {key}") from e
+
+    def delete(self, key):
+        try:
+            os.remove(self._existing_path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            raise StorageError(f"Could not delete {key}: {e}") from e
+
+    def list(self, prefix='', limit=100):
+        # Keys are hashed into shards, so prefixes can't be filtered here; this walks the whole tree
+        items = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.startswith('.tmp-'):
+                    continue
+                stat = os.stat(os.path.join(dirpath, name))
+                items.append({
+                    'Key': os.path.relpath(os.path.join(dirpath, name), self.root),
+                    'Size': stat.st_size,
+                    'LastModified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+                })
+                if len(items) >= limit:
+                    return items
+        return items
+
+    @staticmethod
+    def _fsync_dir(directory):
+        # Directories can't be opened for fsync on Windows
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class S3BlobStore(BlobStore):
+    """S3 backend with a sized connection pool and tuned multipart transfers.
+
+    ``endpoint_url`` points the client at any S3-compatible service, e.g. a
+    local MinIO or ``moto_server`` instance for benchmarks.
+    """
+
+    def __init__(self, bucket, region=None, endpoint_url=None,
+                 aws_access_key_id=None, aws_secret_access_key=None,
+                 max_pool_connections=50, multipart_threshold=8 * MB,
+                 multipart_chunksize=8 * MB, max_concurrency=10, client=None):
+        self.bucket = bucket
+        # Each transfer thread holds a pooled connection, so the pool must cover them
+        max_pool_connections = max(max_pool_connections, max_concurrency)
+        self.client = client or boto3.client(
+            's3',
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key,
+            region_name=region,
+            endpoint_url=endpoint_url,
+            config=Config(
+                max_pool_connections=max_pool_connections,
+                retries={'max_attempts': 5, 'mode': 'adaptive'},
+            ),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=max_concurrency > 1,
+        )
+
+    def save(self, key, fileobj, content_type=None):
+        extra_args = {'ContentType': content_type} if content_type else None
+        size = None
+        if fileobj.seekable():
+            # Measure up front: the transfer manager may close the file object when it's done
+            start = fileobj.tell()
+            size = fileobj.seek(0, os.SEEK_END) - start
+            fileobj.seek(start)
+        try:
+            self.client.upload_fileobj(fileobj, self.bucket, key,
+                                       ExtraArgs=extra_args, Config=self.transfer_config)
+        except (ClientError, S3UploadFailedError) as e:  # The transfer manager wraps ClientError
+            raise StorageError(f"S3 upload failed for {key}: {e}") from e
+        if size is None:
+            size = self.stat(key)['size']
+        return size
+
+    def open(self, key):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+        except ClientError as e:
+            raise StorageError(f"S3 read failed for {key}: {e}") from e
+
+    def download(self, key, fileobj):
+        # download_fileobj splits large objects into parallel ranged GETs
+        try:
+            self.client.download_fileobj(self.bucket, key, fileobj, Config=self.transfer_config)
+        except ClientError as e:
+            raise StorageError(f"S3 download failed for {key}: {e}") from e
+
+    def delete(self, key):
+        try:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            raise StorageError(f"S3 delete failed for {key}: {e}") from e
+
+    def delete_many(self, keys):
+        """Delete in DeleteObjects batches of up to 1000 keys instead of one request per key."""
+        errors = {}
+        keys = list(keys)
+        for i in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+            batch = keys[i:i + S3_DELETE_BATCH_SIZE]
+            try:
+                resp = self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={'Objects': [{'Key': k} for k in batch], 'Quiet': True},
+                )
+            except ClientError as e:
+                errors.update({k: f"S3 batch delete failed: {e}" for k in batch})
+                continue
+            for err in resp.get('Errors', []):
+                errors[err['Key']] = f"{err.get('Code')}: {err.get('Message')}"
+        return errors
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    def stat(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            raise StorageError(f"S3 head failed for {key}: {e}") from e
+        return {'size': head['ContentLength'], 'content_type': head.get('ContentType')}
+
+    def read_range(self, key, start, end):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key, Range=f'bytes={start}-{end}')['Body'].read()
+        except ClientError as e:
+            raise StorageError(f"S3 ranged read failed for {key}: {e}") from e
+
+    def list(self, prefix='', limit=100):
+        try:
+            resp = self.client.list_objects_v2(Bucket=self.bucket, Prefix=prefix, MaxKeys=limit)
+        except ClientError as e:
+            raise StorageError(f"S3 list failed: {e}") from e
+        return resp.get('Contents', [])
+
+    def presigned_url(self, key, expires_in=3600, filename=None):
+        params = {'Bucket': self.bucket, 'Key': key}
+        if filename:
+            params['ResponseContentDisposition'] = f'inline; filename="{secure_filename(filename) or "download"}"'
+        try:
+            return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+        except ClientError as e:
+            raise StorageError(f"S3 presign failed for {key}: {e}") from e
+
+    def presigned_post(self, key, max_bytes, content_type, expires_in=900):
+        try:
+            return self.client.generate_presigned_post(
+                self.bucket, key,
+                Fields={'Content-Type': content_type, 'success_action_status': '204'},
+                Conditions=[{'Content-Type': content_type}, {'success_action_status': '204'},
+                            ['content-length-range', 1, max_bytes]],
+                ExpiresIn=expires_in,
+            )
+        except ClientError as e:
+            raise StorageError(f"S3 presign failed for {key}: {e}") from e
+
+
+def create_blob_store(upload_folder, use_s3=False):
+    """Build the configured storage backend from environment variables.
+
+    Local: LOCAL_STORAGE_FSYNC (none | file | full).
+    S3: S3_BUCKET_NAME, AWS_REGION, S3_ENDPOINT_URL, S3_MAX_POOL_CONNECTIONS,
+    S3_MULTIPART_THRESHOLD_MB, S3_MULTIPART_CHUNKSIZE_MB, S3_MAX_CONCURRENCY.
+    """
+    if use_s3:
+        return S3BlobStore(
+            bucket=os.environ.get('S3_BUCKET_NAME'),
+            region=os.environ.get('AWS_REGION', 'ap-south-1'),
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL') or None,
+            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+            max_pool_connections=int(os.environ.get('S3_MAX_POOL_CONNECTIONS', 50)),
+            multipart_threshold=int(os.environ.get('S3_MULTIPART_THRESHOLD_MB', 8)) * MB,
+            multipart_chunksize=int(os.environ.get('S3_MULTIPART_CHUNKSIZE_MB', 8)) * MB,
+            max_concurrency=int(os.environ.get('S3_MAX_CONCURRENCY', 10)),
+        )
+    return LocalBlobStore(
+        os.path.join(upload_folder, 'blobs'),
+        fsync_policy=os.environ.get('LOCAL_STORAGE_FSYNC', 'file').lower()
+    )
@@ -0,0 +1,89 @@
+from sqlalchemy import table, column, select, delete, insert, func
+
+TAG_NAME_MAX = 100
+
+# Lightweight table handles so the same helpers work from the app (session) and migrations (connection)
+tag_table = table('tag', column('id'), column('name'))
+file_tag_table = table('file_tag', column('file_id'), column('tag_id'), column('user_id'))
+
+
+def split_tags(raw):
+    """Normalized, de-duplicated tag names from a comma-joined tags string or a list."""
+    parts = raw.split(',') if isinstance(raw, str) else (raw or [])
+    names = []
+    for part in parts:
+        name = part.strip().lower()[:TAG_NAME_MAX]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _dialect(executor):
+    return executor.dialect.name if hasattr(executor, 'dialect') else executor.get_bind().dialect.name
+
+
+def ensure_tag_ids(executor, names):
+    """Return {name: id}, inserting missing tags with one INSERT ... ON CONFLICT DO NOTHING."""
+    names = sorted(set(names))
+    if not names:
+        return {}
+    dialect = _dialect(executor)
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        executor.execute(dialect_insert(tag_table).values([{'name': n} for n in names])
+                         .on_conflict_do_nothing(index_elements=['name']))
+    else:
+        existing = {row.name for row in executor.execute(
+            select(tag_table.c.name).where(tag_table.c.name.in_(names)))}
+        missing = [{'name': n} for n in names if n not in existing]
+        if missing:
+            executor.execute(insert(tag_table), missing)
+    return {row.name: row.id for row in executor.execute(
+        select(tag_table.c.id, tag_table.c.name).where(tag_table.c.name.in_(names)))}
+
+
+def replace_file_tags(executor, entries):
+    """Set the tags of many files at once. entries: iterable of (file_id, user_id, tag names).
+
+    Three statements regardless of batch size: upsert the tag names, clear the
+    files' old associations, insert the new ones.
+    """
+    entries = [(file_id, user_id, split_tags(names)) for file_id, user_id, names in entries]
+    if not entries:
+        return
+    ids = ensure_tag_ids(executor, [name for _, _, names in entries for name in names])
+    executor.execute(delete(file_tag_table).where(file_tag_table.c.file_id.in_([e[0] for e in entries])))
+    rows = [{'file_id': file_id, 'tag_id': ids[name], 'user_id': user_id}
+            for file_id, user_id, names in entries for name in names]
+    if rows:
+        executor.execute(insert(file_tag_table), rows)
+
+
+def delete_file_tags(executor, file_ids):
+    file_ids = list(file_ids)
+    if file_ids:
+        executor.execute(delete(file_tag_table).where(file_tag_table.c.file_id.in_(file_ids)))
+
+
+def tag_facets(executor, user_id, limit=None):
+    """[(tag name, file count)] for one user, most used first, from the (user_id, tag_id) index."""
+    counts = (select(file_tag_table.c.tag_id, func.count().label('files'))
+              .where(file_tag_table.c.user_id == user_id)
+              .group_by(file_tag_table.c.tag_id)
+              .subquery())
+    stmt = (select(tag_table.c.name, counts.c.files)
+            .join(counts, counts.c.tag_id == tag_table.c.id)
+            .order_by(counts.c.files.desc(), tag_table.c.name))
+    if limit:
+        stmt = stmt.limit(limit)
+    return [(row.name, row.files) for row in executor.execute(stmt)]
+
+
+def file_ids_with_tag(user_id, name):
+    """Subquery of a user's file ids carrying tag name, for FileMetadata.id.in_(...)."""
+    return (select(file_tag_table.c.file_id)
+            .join(tag_table, tag_table.c.id == file_tag_table.c.tag_id)
+            .where(file_tag_table.c.user_id == user_id, tag_table.c.name == name.strip().lower()))
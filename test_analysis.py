@@ -0,0 +1,46 @@
+"""analyze_file on stored blobs, offline: python -m pytest test_analysis.py"""
+import pytest
+
+import ai_utils
+
+BLOB_PREFIX = 'cafebabedeadbeefaddface0'  # Like the secrets.token_hex(12) prefix of storage keys
+NOTES = 'Meeting notes for the quarterly budget review.\nAction items: update the forecast.\n'
+
+
+class CapturingModel:
+    """Stands in for Gemini and keeps every prompt it was sent."""
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate_content(self, contents):
+        self.prompts.append(contents)
+        return self
+
+    def resolve(self):
+        pass
+
+    text = "TAGS: meeting, budget\nCATEGORY: Work"
+
+
+@pytest.fixture
+def blob(tmp_path):
+    path = tmp_path / f"{BLOB_PREFIX}_notes.txt"
+    path.write_text(NOTES)
+    return str(path)
+
+
+def test_local_tags_come_from_the_upload_name(blob, monkeypatch):
+    monkeypatch.setattr(ai_utils, 'model', None)
+    result = ai_utils.analyze_file(blob, 'notes.txt')
+    assert result['tags']
+    assert [tag for tag in result['tags'] if tag in BLOB_PREFIX] == []
+
+
+def test_prompt_uses_the_upload_name(blob, monkeypatch):
+    model = CapturingModel()
+    monkeypatch.setattr(ai_utils, 'model', model)
+    monkeypatch.setattr(ai_utils, 'LOCAL_ANALYSIS_THRESHOLD', 1.01)  # Always ask the model
+    ai_utils.analyze_file(blob, 'notes.txt')
+    assert 'FILENAME: notes.txt' in model.prompts[0]
+    assert BLOB_PREFIX not in model.prompts[0]
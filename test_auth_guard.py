@@ -0,0 +1,89 @@
+"""Login throttling and bounded password hashing: python -m pytest test_auth_guard.py"""
+import threading
+
+import pytest
+
+import auth_guard
+from auth_guard import HashingBusy, PasswordHasher, SlidingWindowLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(auth_guard.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def test_limit_applies_within_the_window(clock):
+    limiter = SlidingWindowLimiter(max_events=3, window_seconds=60)
+    assert [limiter.hit('alice') for _ in range(4)] == [True, True, True, False]
+    assert limiter.hit('bob')
+
+
+def test_rejected_attempts_do_not_extend_the_block(clock):
+    limiter = SlidingWindowLimiter(max_events=2, window_seconds=60)
+    limiter.hit('alice')
+    clock.now += 30
+    limiter.hit('alice')
+    for _ in range(5):
+        assert not limiter.hit('alice')
+    clock.now += 30  # The first attempt slides out of the window
+    assert limiter.hit('alice')
+    assert not limiter.hit('alice')
+
+
+def test_retry_after_counts_down_to_the_oldest_attempt_leaving(clock):
+    limiter = SlidingWindowLimiter(max_events=1, window_seconds=300)
+    assert limiter.retry_after('alice') == 0
+    limiter.hit('alice')
+    clock.now += 100
+    assert limiter.retry_after('alice') == 201
+    clock.now += 200
+    assert limiter.hit('alice')
+
+
+def test_reset_clears_a_key(clock):
+    limiter = SlidingWindowLimiter(max_events=1, window_seconds=60)
+    limiter.hit('alice')
+    limiter.reset('alice')
+    assert limiter.hit('alice')
+
+
+def test_idle_keys_are_pruned_when_full(clock):
+    limiter = SlidingWindowLimiter(max_events=1, window_seconds=60, max_keys=2)
+    limiter.hit('a')
+    limiter.hit('b')
+    clock.now += 61
+    limiter.hit('c')
+    assert set(limiter._events) == {'c'}
+
+
+def test_hash_round_trips_and_reports_old_methods():
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', max_workers=1)
+    stored = hasher.hash('secret1')
+    assert hasher.verify(stored, 'secret1')
+    assert not hasher.verify(stored, 'wrong')
+    assert not hasher.needs_rehash(stored)
+    assert PasswordHasher(method='pbkdf2:sha256:2000').needs_rehash(stored)
+    assert hasher.needs_rehash('not a hash')
+
+
+def test_saturated_pool_refuses_more_work(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(auth_guard, 'generate_password_hash', lambda password, method: release.wait(5))
+    hasher = PasswordHasher(method='pbkdf2:sha256:1000', max_workers=1, max_pending=1, timeout=0.05)
+    with pytest.raises(HashingBusy, match='timed out'):
+        hasher.hash('one')
+    with pytest.raises(HashingBusy, match='timed out'):
+        hasher.hash('two')
+    with pytest.raises(HashingBusy, match='Too many'):
+        hasher.hash('three')
+    release.set()
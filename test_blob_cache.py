@@ -0,0 +1,46 @@
+"""BlobCache shared by several worker processes (one instance each): python -m pytest test_blob_cache.py"""
+import os
+
+from blob_cache import BlobCache
+
+KB = 1024
+
+
+def cached_bytes(root):
+    return sum(os.path.getsize(os.path.join(dirpath, name))
+               for dirpath, _, names in os.walk(root) for name in names if name != '.lock')
+
+
+def fill(cache, key, size):
+    return cache.get_path(key, lambda out: out.write(b'x' * size))
+
+
+def test_workers_share_one_budget(tmp_path):
+    workers = [BlobCache(str(tmp_path), max_bytes=100 * KB) for _ in range(4)]
+    for i in range(40):
+        fill(workers[i % 4], f'user_1/blob{i}', 10 * KB)
+    # Each worker may be one sweep interval (10% of the budget) ahead of the last sweep
+    assert cached_bytes(tmp_path) <= 100 * KB * 1.4
+    for worker in workers:
+        worker._sweep()
+    assert cached_bytes(tmp_path) <= 100 * KB
+
+
+def test_sweep_evicts_least_recently_used_across_workers(tmp_path):
+    first, second = BlobCache(str(tmp_path), max_bytes=30 * KB), BlobCache(str(tmp_path), max_bytes=30 * KB)
+    old = fill(first, 'user_1/old', 10 * KB)
+    os.utime(old, (1, 1))
+    fill(second, 'user_1/a', 10 * KB)
+    fill(second, 'user_1/b', 10 * KB)
+    fill(first, 'user_1/c', 10 * KB)
+    second._sweep()
+    assert not os.path.exists(old)
+    assert cached_bytes(tmp_path) <= 30 * KB
+
+
+def test_partial_fills_of_other_workers_survive_a_restart(tmp_path):
+    BlobCache(str(tmp_path), max_bytes=100 * KB)
+    in_flight = tmp_path / '.tmp-abc'
+    in_flight.write_bytes(b'partial')
+    BlobCache(str(tmp_path), max_bytes=100 * KB)  # A recycled worker starting up
+    assert in_flight.exists()
@@ -0,0 +1,63 @@
+"""Document parsing in the limited worker pool: python -m pytest test_extract_pool.py"""
+import signal
+import time
+
+import pytest
+from PIL import Image
+
+import extract_pool
+from extract_pool import ExtractionPool
+
+
+def stubborn_parser(path, max_pages=None):
+    """Loops forever and swallows every Exception, like parsers with broad recovery blocks."""
+    while True:
+        try:
+            time.sleep(0.01)
+        except Exception:
+            pass
+
+
+@pytest.fixture
+def scanned_pdf(tmp_path):
+    path = tmp_path / 'scan.pdf'
+    Image.new('RGB', (200, 100), 'white').save(path)
+    return str(path)
+
+
+@pytest.fixture
+def alarm(monkeypatch):
+    previous = signal.getsignal(signal.SIGALRM)
+    extract_pool._init_worker(None)
+    yield
+    signal.signal(signal.SIGALRM, previous)
+
+
+def test_timeout_gets_past_broad_except_blocks(alarm, monkeypatch):
+    monkeypatch.setitem(extract_pool.TASKS, 'stubborn', stubborn_parser)
+    start = time.monotonic()
+    result = extract_pool._run_task('stubborn', ('x.pdf',), 0.2)
+    assert result['error'] == 'timeout'
+    assert time.monotonic() - start < 2
+
+
+def test_parser_errors_come_back_as_results(alarm, tmp_path):
+    (tmp_path / 'broken.pdf').write_bytes(b'%PDF-1.4 not really')
+    result = extract_pool._run_task('pdf_text', (str(tmp_path / 'broken.pdf'),), 5)
+    assert result['error'] == 'invalid'
+    assert result['detail']
+
+
+def test_in_process_pool_parses(scanned_pdf):
+    pool = ExtractionPool(workers=0)
+    assert pool.extract_text(scanned_pdf) == {'text': '', 'pages': 1, 'error': None, 'detail': None}
+    assert pool.extract_text(scanned_pdf + '.missing')['error'] == 'invalid'
+
+
+def test_worker_pool_parses(scanned_pdf):
+    pool = ExtractionPool(workers=1, timeout=30)
+    try:
+        assert pool.extract_text(scanned_pdf)['pages'] == 1
+        assert pool.pdf_cover(scanned_pdf) is not None
+    finally:
+        pool.shutdown()
@@ -0,0 +1,62 @@
+"""Read-replica routing with read-your-writes stickiness: python -m pytest test_replicas.py"""
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import column, table, text, update
+
+from replicas import LAST_WRITE_SESSION_KEY, RoutingSession, read_only, remember_write, replica_binds
+
+
+@pytest.fixture
+def client(tmp_path):
+    """An app whose primary and replica hold different rows, so each response shows where it read from."""
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+        SQLALCHEMY_BINDS=replica_binds([f"sqlite:///{tmp_path / 'replica.db'}"], lambda url: {}),
+    )
+    db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+    with app.app_context():
+        for name, engine in db.engines.items():
+            with engine.begin() as conn:
+                conn.execute(text('CREATE TABLE note (body TEXT)'))
+                conn.execute(text('INSERT INTO note VALUES (:where)'), {'where': 'replica' if name else 'primary'})
+
+    def where():
+        return db.session.execute(text('SELECT body FROM note LIMIT 1')).scalar()
+
+    @app.route('/read')
+    @read_only(sticky_seconds=10)
+    def read():
+        return where()
+
+    @app.route('/read-unmarked')
+    def read_unmarked():
+        return where()
+
+    @app.route('/write-then-read')
+    @read_only(sticky_seconds=10)
+    def write_then_read():
+        db.session.execute(update(table('note', column('body'))).values(body=column('body')))
+        return where()
+
+    app.after_request(remember_write)
+    return app.test_client()
+
+
+def test_marked_handlers_read_from_a_replica(client):
+    assert client.get('/read').text == 'replica'
+    assert client.get('/read-unmarked').text == 'primary'
+
+
+def test_reads_after_a_write_in_the_same_request_use_the_primary(client):
+    assert client.get('/write-then-read').text == 'primary'
+
+
+def test_recent_writers_stay_on_the_primary(client):
+    client.get('/write-then-read')
+    assert client.get('/read').text == 'primary'
+    with client.session_transaction() as session:
+        session[LAST_WRITE_SESSION_KEY] -= 11
+    assert client.get('/read').text == 'replica'
@@ -0,0 +1,145 @@
+"""Signed share links: expiry, tampering, revocation, use limits and the file cache. python -m pytest test_share_links.py"""
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, select
+from sqlalchemy.orm import Session
+
+import share_links
+from share_links import InvalidShareToken, RevocationList, SharedFileCache, ShareLinkSigner, claim_use, release_use
+from signed_tokens import b64decode, b64encode
+
+FILE = SimpleNamespace(id=7, user_id=3, filename='quarterly report.pdf', s3_key='user_3/0123abcd_quarterly report.pdf',
+                       file_size=1234, content_hash='ab' * 32)
+
+
+@pytest.fixture
+def signer():
+    return ShareLinkSigner('test-secret')
+
+
+@pytest.fixture
+def session():
+    metadata = MetaData()
+    Table('share_link_use', metadata, Column('jti', String(16), primary_key=True),
+          Column('uses', Integer, nullable=False), Column('max_uses', Integer, nullable=False))
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+def uses(session, jti):
+    table = share_links.link_use_table
+    return session.execute(select(table.c.uses).where(table.c.jti == jti)).scalar_one()
+
+
+def test_token_round_trips(signer):
+    token, payload = signer.issue(FILE, expires_in=3600, max_uses=5)
+    assert ShareLinkSigner.is_signed(token)
+    assert signer.verify(token) == payload
+    assert (payload['f'], payload['u'], payload['m']) == (7, 3, 5)
+
+
+def test_token_does_not_reveal_the_stored_file(signer):
+    token, _ = signer.issue(FILE)
+    body = b64decode(token.split('.')[0]).decode('utf-8')
+    assert set(json.loads(body)) == {'f', 'u', 'i', 'j'}
+    for private in (FILE.s3_key, FILE.filename, FILE.content_hash):
+        assert private not in body
+
+
+def test_expired_token_is_rejected(signer, monkeypatch):
+    token, _ = signer.issue(FILE, expires_in=60)
+    monkeypatch.setattr(time, 'time', lambda real=time.time: real() + 61)
+    with pytest.raises(InvalidShareToken, match='expired'):
+        signer.verify(token)
+
+
+def test_tokens_without_expiry_never_expire(signer, monkeypatch):
+    token, _ = signer.issue(FILE)
+    monkeypatch.setattr(time, 'time', lambda real=time.time: real() + 10 * 365 * 86400)
+    assert signer.verify(token)['f'] == FILE.id
+
+
+def test_raising_the_use_limit_breaks_the_signature(signer):
+    token, payload = signer.issue(FILE, max_uses=1)
+    body = b64encode(json.dumps(dict(payload, m=1000)).encode('utf-8'))
+    with pytest.raises(InvalidShareToken, match='Invalid'):
+        signer.verify(body + '.' + token.split('.')[1])
+    with pytest.raises(InvalidShareToken, match='Invalid'):
+        ShareLinkSigner('another-secret').verify(token)
+
+
+@pytest.mark.parametrize('token', ['', 'no-dot-at-all', 'abc.def', '!!!.???'])
+def test_malformed_tokens_are_rejected(signer, token):
+    with pytest.raises(InvalidShareToken):
+        signer.verify(token)
+
+
+def test_links_issued_before_a_revocation_are_revoked(signer):
+    revoked = {}
+    revocations = RevocationList(lambda: revoked.items(), refresh_seconds=0)
+    _, before = signer.issue(FILE)
+    revoked[FILE.id] = before['i']
+    time.sleep(0.002)
+    _, after = signer.issue(FILE)
+    assert revocations.is_revoked(before)
+    assert not revocations.is_revoked(after)
+    assert not revocations.is_revoked(dict(before, f=FILE.id + 1))
+
+
+def test_revocations_from_other_workers_arrive_on_refresh(signer):
+    revoked = {}
+    revocations = RevocationList(lambda: revoked.items(), refresh_seconds=3600)
+    _, payload = signer.issue(FILE)
+    assert not revocations.is_revoked(payload)
+    revoked[FILE.id] = payload['i']
+    assert not revocations.is_revoked(payload)  # Not refreshed yet
+    revocations.mark_revoked(FILE.id, payload['i'])  # This worker's own revocation applies at once
+    assert revocations.is_revoked(payload)
+
+
+def test_use_limit_is_enforced(session):
+    session.execute(share_links.link_use_table.insert().values(jti='link', uses=0, max_uses=2))
+    assert [claim_use(session, 'link') for _ in range(3)] == [True, True, False]
+    assert uses(session, 'link') == 2
+
+
+def test_released_use_can_be_claimed_again(session):
+    session.execute(share_links.link_use_table.insert().values(jti='link', uses=0, max_uses=1))
+    assert claim_use(session, 'link')
+    release_use(session, 'link')
+    assert uses(session, 'link') == 0
+    assert claim_use(session, 'link')
+    release_use(session, 'unknown')
+    assert not claim_use(session, 'unknown')
+
+
+def test_file_cache_serves_repeat_lookups_until_invalidated():
+    loads = []
+    cache = SharedFileCache(lambda file_id: loads.append(file_id) or SimpleNamespace(id=file_id), ttl=60)
+    assert cache.get(7).id == 7 and cache.get(7).id == 7
+    assert loads == [7]
+    cache.invalidate(7)
+    cache.get(7)
+    assert loads == [7, 7]
+
+
+def test_file_cache_remembers_missing_files_for_the_ttl():
+    loads = []
+    cache = SharedFileCache(lambda file_id: loads.append(file_id), ttl=0.05)
+    assert cache.get(7) is None and cache.get(7) is None
+    assert loads == [7]
+    time.sleep(0.06)
+    cache.get(7)
+    assert loads == [7, 7]
+
+
+def test_file_cache_is_bounded():
+    cache = SharedFileCache(lambda file_id: SimpleNamespace(id=file_id), ttl=60, max_entries=2)
+    for file_id in (1, 2, 1, 3):
+        cache.get(file_id)
+    assert list(cache._entries) == [1, 3]
@@ -0,0 +1,72 @@
+"""Perceptual hashes and near-duplicate search: python -m pytest test_similarity.py"""
+import random
+
+from PIL import Image, ImageFilter
+
+from similarity import MultiIndexHash, SimilarityIndex, dhash, dhash_file, duplicate_groups, hamming
+
+
+def photo(seed, size=(320, 240)):
+    """A smooth random image, like a photo: noise blurred into gradients."""
+    rng = random.Random(seed)
+    image = Image.frombytes('L', (32, 24), bytes(rng.randrange(256) for _ in range(32 * 24)))
+    return image.resize(size, Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(4))
+
+
+def brute_force(entries, value, max_distance):
+    return sorted((hamming(value, other), item) for item, other in entries if hamming(value, other) <= max_distance)
+
+
+def test_resized_and_reencoded_copies_hash_close(tmp_path):
+    original = photo(1)
+    original.save(tmp_path / 'original.png')
+    original.resize((160, 120)).save(tmp_path / 'small.jpg', quality=70)
+    a, b = int(dhash_file(str(tmp_path / 'original.png')), 16), int(dhash_file(str(tmp_path / 'small.jpg')), 16)
+    assert hamming(a, b) <= 8
+    assert hamming(a, dhash(photo(2))) > 8
+
+
+def test_flat_images_and_non_images_get_no_hash(tmp_path):
+    assert dhash(Image.new('RGB', (200, 200), 'white')) is None
+    (tmp_path / 'notes.png').write_bytes(b'not really a png')
+    assert dhash_file(str(tmp_path / 'notes.png')) is None
+    assert dhash_file(str(tmp_path / 'notes.txt')) is None
+
+
+def test_search_matches_a_linear_scan():
+    rng = random.Random(5)
+    entries = [(item, rng.getrandbits(64)) for item in range(2000)]
+    base = entries[0][1]
+    entries += [(2000 + i, base ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64))) for i in range(10)]
+    index = MultiIndexHash()
+    for item, value in entries:
+        index.add(value, item)
+    for radius in (0, 4, 8, 12):
+        found, checked = index.search(base, radius)
+        assert found == brute_force(entries, base, radius)
+        assert checked < len(entries)
+
+
+def test_duplicate_groups_are_transitive():
+    a = 0x0123456789ABCDEF
+    b = a ^ 0b111        # 3 bits from a
+    c = b ^ 0b111000     # 3 bits from b, 6 from a
+    far = ~a & (2 ** 64 - 1)
+    assert duplicate_groups([('a', a), ('b', b), ('c', c), ('far', far)], max_distance=4) == [['a', 'b', 'c']]
+
+
+def test_index_is_rebuilt_when_the_signature_changes():
+    images = {1: [(10, 0xFF)]}
+    loads = []
+
+    def load(user_id):
+        loads.append(user_id)
+        return images[user_id]
+
+    cache = SimilarityIndex(load, lambda user_id: len(images[user_id]), ttl=300)
+    assert cache.index(1).search(0xFF, 0)[0] == [(0, 10)]
+    cache.index(1)
+    assert loads == [1]
+    images[1] = images[1] + [(11, 0xFE)]
+    assert cache.index(1).search(0xFF, 1)[0] == [(0, 10), (1, 11)]
+    assert loads == [1, 1]
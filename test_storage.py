@@ -0,0 +1,102 @@
+"""Blob stores: LocalBlobStore on a temp dir, S3BlobStore against moto's in-process S3 mock.
+
+    python -m pytest test_storage.py
+"""
+import hashlib
+import io
+import itertools
+import os
+
+import boto3
+import pytest
+from boto3.exceptions import S3UploadFailedError
+from moto import mock_aws
+
+from storage import LocalBlobStore, S3BlobStore, StorageError
+
+BUCKET = 'test-bucket'
+
+
+@pytest.fixture
+def s3_store(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield S3BlobStore(BUCKET, client=client, max_concurrency=1)
+
+
+def same_shard_keys(make_first, make_second):
+    """make_first(n) and make_second(m) for some n, m whose keys land in the same shard directory."""
+    def shard(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:4]
+    firsts, seconds = {}, {}
+    for n in itertools.count():
+        first, second = make_first(n), make_second(n)
+        firsts.setdefault(shard(first), first)
+        seconds.setdefault(shard(second), second)
+        for key, others in ((first, seconds), (second, firsts)):
+            if shard(key) in others and others[shard(key)] != key:
+                return (key, others[shard(key)]) if key == first else (others[shard(key)], key)
+
+
+def test_local_keys_with_the_same_last_segment_stay_separate(tmp_path):
+    store = LocalBlobStore(str(tmp_path), fsync_policy='none')
+    digest = 'ab' * 32
+    first, second = same_shard_keys(lambda n: f'user_{n}/chunks/{digest}', lambda n: f'user_{n}0/chunks/{digest}')
+    store.save(first, io.BytesIO(b'first'))
+    store.save(second, io.BytesIO(b'second'))
+    store.delete(first)  # e.g. one user's history being pruned
+    assert not store.exists(first)
+    with store.open(second) as f:
+        assert f.read() == b'second'
+
+
+def test_local_keys_folded_by_secure_filename_stay_separate(tmp_path):
+    store = LocalBlobStore(str(tmp_path), fsync_policy='none')
+    accented, plain = same_shard_keys(lambda n: f'user_{n}/résumé.pdf', lambda n: f'user_{n}/resume.pdf')
+    store.save(accented, io.BytesIO(b'one'))
+    store.save(plain, io.BytesIO(b'two'))
+    assert store.read_range(accented, 0, 2) == b'one'
+    assert store.read_range(plain, 0, 2) == b'two'
+
+
+def test_local_blobs_in_the_old_layout_are_still_found(tmp_path):
+    store = LocalBlobStore(str(tmp_path), fsync_policy='none')
+    legacy = store._legacy_path('user_1/abc_notes.txt')
+    os.makedirs(os.path.dirname(legacy))
+    with open(legacy, 'wb') as f:
+        f.write(b'old')
+    assert store.exists('user_1/abc_notes.txt')
+    assert store.read_range('user_1/abc_notes.txt', 0, 2) == b'old'
+    store.delete('user_1/abc_notes.txt')
+    assert not os.path.exists(legacy)
+
+
+def test_save_and_read_back(s3_store):
+    assert s3_store.save('user_1/a.txt', io.BytesIO(b'hello world')) == 11
+    assert s3_store.stat('user_1/a.txt')['size'] == 11
+    assert s3_store.read_range('user_1/a.txt', 6, 10) == b'world'
+
+
+def test_failed_save_raises_storage_error(s3_store):
+    missing_bucket = S3BlobStore('no-such-bucket', client=s3_store.client, max_concurrency=1)
+    with pytest.raises(StorageError):
+        missing_bucket.save('user_1/a.txt', io.BytesIO(b'data'))
+
+
+def test_failed_multipart_save_raises_storage_error(s3_store):
+    missing_bucket = S3BlobStore('no-such-bucket', client=s3_store.client, max_concurrency=1,
+                                 multipart_threshold=5 * 1024 * 1024, multipart_chunksize=5 * 1024 * 1024)
+    with pytest.raises(StorageError):
+        missing_bucket.save('user_1/big.bin', io.BytesIO(b'x' * (6 * 1024 * 1024)))
+
+
+def test_transfer_manager_failure_raises_storage_error(s3_store, monkeypatch):
+    # Depending on the boto3 version and transfer path, failures arrive wrapped in S3UploadFailedError
+    def fail(*args, **kwargs):
+        raise S3UploadFailedError('Failed to upload: An error occurred (SlowDown)')
+    monkeypatch.setattr(s3_store.client, 'upload_fileobj', fail)
+    with pytest.raises(StorageError):
+        s3_store.save('user_1/a.txt', io.BytesIO(b'data'))
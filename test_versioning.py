@@ -0,0 +1,184 @@
+"""Chunked version history on SQLite and a LocalBlobStore in a temp dir: python -m pytest test_versioning.py"""
+import io
+import random
+
+import pytest
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.orm import Session
+
+import migrations
+import versioning
+from storage import LocalBlobStore
+
+USER = 1
+CHUNKER = versioning.Chunker(4 * 1024)
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    url = f"sqlite:///{tmp_path / 'versions.db'}"
+    with create_engine(url).begin() as conn:
+        migrations.add_version_tables(conn)
+        migrations.add_chunk_unused_since(conn)
+    return url
+
+
+@pytest.fixture
+def session(db_url):
+    with Session(create_engine(db_url)) as session:
+        yield session
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalBlobStore(str(tmp_path / 'blobs'), fsync_policy='none')
+
+
+def contents(seed, size=200 * 1024):
+    return random.Random(seed).randbytes(size)
+
+
+def edited(data, at, insert):
+    return data[:at] + insert + data[at:]
+
+
+def save_version(session, store, data, filename='report.bin', **kwargs):
+    number, _ = versioning.snapshot(session, store, io.BytesIO(data), USER, filename, CHUNKER, **kwargs)
+    session.commit()
+    return number
+
+
+def version_chunks(session, number, filename='report.bin'):
+    table = versioning.version_table
+    version_id = session.execute(select(table.c.id).where(
+        table.c.user_id == USER, table.c.filename == filename, table.c.version == number)).scalar_one()
+    return versioning.chunk_list(session, version_id)
+
+
+def version_bytes(session, store, number):
+    return b''.join(versioning.iter_chunks(store, USER, version_chunks(session, number)))
+
+
+def chunk_counts(session):
+    return tuple(session.execute(text('SELECT COUNT(*), COUNT(unused_since) FROM chunk')).one())
+
+
+def test_versions_share_unchanged_chunks(session, store):
+    original = contents(1)
+    save_version(session, store, original)
+    save_version(session, store, edited(original, 100 * 1024, b'a small edit'))
+    first, second = session.execute(text('SELECT stored_bytes FROM file_version ORDER BY version')).scalars()
+    assert first == len(original)
+    assert second < len(original) // 4
+
+
+def test_identical_contents_store_nothing_new(session, store):
+    original = contents(2)
+    save_version(session, store, original)
+    chunks = chunk_counts(session)
+    save_version(session, store, original)
+    assert chunk_counts(session) == chunks
+    assert session.execute(text('SELECT stored_bytes FROM file_version WHERE version = 2')).scalar() == 0
+
+
+def test_each_version_reads_back_exactly(session, store):
+    original = contents(3)
+    later = edited(original, 50 * 1024, b'inserted' * 100)
+    save_version(session, store, original)
+    save_version(session, store, later)
+    assert version_bytes(session, store, 1) == original
+    assert version_bytes(session, store, 2) == later
+    reader = versioning.ChunkReader(versioning.iter_chunks(store, USER, version_chunks(session, 1)))
+    with reader:
+        assert io.BufferedReader(reader).read() == original
+
+
+def test_corrupt_chunk_is_detected(session, store):
+    save_version(session, store, contents(4))
+    digest, _ = version_chunks(session, 1)[0]
+    store.save(versioning.chunk_key(USER, digest), io.BytesIO(b'not the original bytes'))
+    with pytest.raises(versioning.VersionError):
+        version_bytes(session, store, 1)
+
+
+def test_pruned_chunks_are_kept_for_the_grace_period(session, store):
+    for seed in range(3):
+        save_version(session, store, contents(seed + 10), keep=2)
+    assert session.execute(text('SELECT version FROM file_version ORDER BY version')).scalars().all() == [2, 3]
+    total, unused = chunk_counts(session)
+    assert unused > 0
+    assert versioning.reap_chunks(session, grace_seconds=3600) == []
+    keys = versioning.reap_chunks(session, grace_seconds=0)
+    store.delete_many(keys)
+    session.commit()
+    assert len(keys) == unused
+    assert chunk_counts(session) == (total - unused, 0)
+    assert version_bytes(session, store, 2) == contents(11)
+    assert version_bytes(session, store, 3) == contents(12)
+
+
+def test_deleted_history_is_reaped(session, store):
+    save_version(session, store, contents(20))
+    versioning.delete_history(session, USER, ['report.bin'])
+    session.commit()
+    keys = versioning.reap_chunks(session, grace_seconds=0)
+    store.delete_many(keys)
+    session.commit()
+    assert keys and chunk_counts(session) == (0, 0)
+    assert not any(store.exists(key) for key in keys)
+
+
+def test_snapshot_revives_chunks_waiting_to_be_reaped(session, store):
+    data = contents(30)
+    save_version(session, store, data)
+    versioning.delete_history(session, USER, ['report.bin'])
+    session.commit()
+    uploaded = {}
+    versioning.snapshot(session, store, io.BytesIO(data), USER, 'report.bin', CHUNKER, uploaded=uploaded)
+    session.commit()
+    assert uploaded == {}  # Every chunk was still there
+    assert chunk_counts(session)[1] == 0
+    assert versioning.reap_chunks(session, grace_seconds=0) == []
+
+
+def test_snapshot_fails_if_a_chunk_is_reaped_under_it(session, store, monkeypatch):
+    data = contents(40)
+    save_version(session, store, data)
+    versioning.delete_history(session, USER, ['report.bin'])
+    session.commit()
+    claim = versioning._claim_chunks
+
+    def reaped_first(session, user_id, digests):
+        store.delete_many(versioning.reap_chunks(session, grace_seconds=0))
+        return claim(session, user_id, digests)
+
+    monkeypatch.setattr(versioning, '_claim_chunks', reaped_first)
+    with pytest.raises(versioning.VersionError):
+        versioning.snapshot(session, store, io.BytesIO(data), USER, 'report.bin', CHUNKER)
+
+
+def test_retired_uploads_are_reaped_later(session, store):
+    uploaded = {}
+    versioning.snapshot(session, store, io.BytesIO(contents(50)), USER, 'report.bin', CHUNKER, uploaded=uploaded)
+    session.rollback()
+    versioning.retire_chunks(session, USER, uploaded)
+    session.commit()
+    assert chunk_counts(session) == (len(uploaded), len(uploaded))
+    keys = versioning.reap_chunks(session, grace_seconds=0)
+    assert sorted(keys) == sorted(versioning.chunk_key(USER, digest) for digest in uploaded)
+
+
+def test_version_number_taken_concurrently_is_retried(session, store):
+    save_version(session, store, contents(60))
+    raced = []
+
+    @event.listens_for(session.get_bind(), 'before_cursor_execute')
+    def take_the_next_number(conn, cursor, statement, parameters, context, executemany):
+        # Between the MAX() and the insert, as another worker committing first would
+        if statement.startswith('SAVEPOINT') and not raced:
+            raced.append(True)
+            cursor.execute("INSERT INTO file_version (user_id, filename, version, stored_bytes, created_at) "
+                           "VALUES (?, 'report.bin', 2, 0, '2026-01-01 00:00:00')", (USER,))
+
+    assert save_version(session, store, contents(61)) == 3
+    assert raced
@@ -0,0 +1,107 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+
+log = logging.getLogger(__name__)
+
+
+class CachedUser(UserMixin):
+    """Detached snapshot of the User fields requests need, returned by the login loader."""
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    def to_dict(self):
+        return {'id': self.id, 'username': self.username}
+
+
+class UserCache:
+    """Per-worker TTL cache of CachedUser snapshots, with an optional shared Redis tier.
+
+    Without Redis, entries live for ``ttl`` seconds in each worker; an explicit
+    invalidate() clears this worker immediately and other workers on expiry.
+    With Redis, the local tier uses the much shorter ``local_ttl`` and the shared
+    entry is deleted on invalidation, so every worker converges within seconds.
+    """
+
+    def __init__(self, ttl=60, max_entries=10000, redis_url=None, local_ttl=5):
+        self._entries = OrderedDict()  # user_id -> (expires_at, CachedUser)
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self._redis = None
+        if redis_url:
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.25)
+                log.info("User cache using shared Redis backend")
+            except ImportError:
+                log.warning("REDIS_URL set but the redis package is not installed, user cache is per-worker only")
+        self.ttl = ttl
+        self.local_ttl = min(ttl, local_ttl) if self._redis else ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _redis_key(self, user_id):
+        return f"user-cache:{user_id}"
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+        if self._redis:
+            try:
+                raw = self._redis.get(self._redis_key(user_id))
+            except Exception as e:
+                log.warning("User cache Redis read failed: %s", e)
+                raw = None
+            if raw:
+                user = CachedUser(**json.loads(raw))
+                self._store_local(user)
+                with self._lock:
+                    self.hits += 1
+                return user
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, user):
+        self._store_local(user)
+        if self._redis:
+            try:
+                self._redis.set(self._redis_key(user.id), json.dumps(user.to_dict()), ex=self.ttl)
+            except Exception as e:
+                log.warning("User cache Redis write failed: %s", e)
+
+    def _store_local(self, user):
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.local_ttl, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+        if self._redis:
+            try:
+                self._redis.delete(self._redis_key(user_id))
+            except Exception as e:
+                log.warning("User cache Redis invalidation failed: %s", e)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+            }
@@ -0,0 +1,387 @@
+"""Version history for overwritten files, stored as deduplicated chunks.
+
+When a file is replaced, its previous contents become a version made of
+content-defined chunks. Boundaries are picked by a gear rolling hash (FastCDC
+style: a cut wherever the hash of the last 32 bytes matches a mask), so they
+depend on the bytes themselves rather than on offsets — inserting or deleting
+a few bytes only changes the chunks around the edit, and the rest re-align.
+Chunks are addressed by SHA-256 per user and stored once, so every version
+that contains a chunk shares it and history grows with the size of the edits,
+not of the file.
+
+Chunks no version uses any more are not deleted straight away: pruning
+marks them with ``unused_since`` and reap_chunks() deletes them once they
+have been unused for a grace period. A snapshot that started before the prune
+and still counts on one of them revives it in the transaction that adds the
+version, so a concurrent prune can't delete a chunk blob out from under it.
+
+Rows are written through lightweight table handles (like tags.py); the models
+live in app.py and the tables are created by migrations 6 and 7.
+"""
+import collections
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import table, column, select, delete, insert, update, func, exists
+from sqlalchemy.exc import IntegrityError
+
+READ_BLOCK = 1024 * 1024
+WRITE_BATCH = 32        # chunks hashed, checked against the index and uploaded together
+LOOKUP_BATCH = 500      # digests per IN (...) query
+FETCH_AHEAD = 8         # chunks being downloaded ahead of the reader
+NUMBER_ATTEMPTS = 5     # version numbers tried when other workers version the same file concurrently
+
+# Deterministic so every process cuts the same content at the same places
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], 'big') for i in range(256)]
+
+chunk_table = table('chunk', column('id'), column('user_id'), column('digest'), column('size'), column('unused_since'))
+version_table = table('file_version', column('id'), column('user_id'), column('filename'), column('version'),
+                      column('file_size'), column('content_hash'), column('tags'), column('category'),
+                      column('phash'), column('stored_bytes'), column('created_at'))
+version_chunk_table = table('file_version_chunk', column('version_id'), column('seq'), column('chunk_id'))
+
+
+class VersionError(Exception):
+    """Raised when a version's chunks are missing or don't match their digests."""
+
+
+class Chunker:
+    """Content-defined chunking with normalized chunk sizes (FastCDC).
+
+    Nothing is cut before min_size; up to avg_size a stricter mask (two more
+    bits) makes cuts rarer, after it a looser one makes them likelier, which
+    keeps sizes close to the average; max_size forces a cut.
+    """
+
+    def __init__(self, avg_size=64 * 1024, min_size=None, max_size=None):
+        bits = avg_size.bit_length() - 1
+        self.avg_size = 1 << bits
+        self.min_size = min_size or self.avg_size // 4
+        self.max_size = max_size or self.avg_size * 4
+        # Only the high bits of a gear hash depend on the whole 32-byte window
+        self.mask_strict = ((1 << (bits + 2)) - 1) << (32 - bits - 2)
+        self.mask_loose = ((1 << (bits - 2)) - 1) << (32 - bits + 2)
+
+    def cut(self, data, start=0):
+        """Length of the chunk starting at data[start] (data ends at EOF or holds at least max_size bytes)."""
+        remaining = len(data) - start
+        if remaining <= self.min_size:
+            return remaining
+        end = start + min(remaining, self.max_size)
+        normal = start + min(remaining, self.avg_size)
+        gear, h = GEAR, 0
+        mask = self.mask_strict
+        i = start + self.min_size
+        for byte in data[i:normal]:
+            h = ((h << 1) + gear[byte]) & 0xFFFFFFFF
+            i += 1
+            if not h & mask:
+                return i - start
+        mask = self.mask_loose
+        for byte in data[normal:end]:
+            h = ((h << 1) + gear[byte]) & 0xFFFFFFFF
+            i += 1
+            if not h & mask:
+                return i - start
+        return end - start
+
+    def chunks(self, fileobj):
+        """Yield the chunks of a readable binary file-like object, holding at most ~max_size + 1MB."""
+        buf = b''
+        eof = False
+        while True:
+            while not eof and len(buf) < self.max_size:
+                block = fileobj.read(max(READ_BLOCK, self.max_size))
+                if not block:
+                    eof = True
+                buf += block
+            if not buf:
+                return
+            pos = 0
+            while len(buf) - pos >= self.max_size or (eof and pos < len(buf)):
+                size = self.cut(buf, pos)
+                yield buf[pos:pos + size]
+                pos += size
+            buf = buf[pos:]
+
+
+def chunk_key(user_id, digest):
+    return f"user_{user_id}/chunks/{digest}"
+
+
+def _dialect_insert(session):
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def _batched(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _known_digests(session, user_id, digests):
+    known = set()
+    for batch in _batched(digests, LOOKUP_BATCH):
+        known.update(session.execute(select(chunk_table.c.digest).where(
+            chunk_table.c.user_id == user_id, chunk_table.c.digest.in_(batch))).scalars())
+    return known
+
+
+def snapshot(session, storage, fileobj, user_id, filename, chunker, keep=None, concurrency=8, uploaded=None, **attrs):
+    """Record fileobj's contents as the next version of (user_id, filename).
+
+    attrs are copied onto the version (file_size, content_hash, tags, category,
+    phash). Chunk blobs are uploaded as they are found; all rows are added at
+    the end, so a failure part-way leaves nothing in the session. `uploaded`,
+    if given, collects {digest: size} of the blobs this call stored: if the
+    transaction doesn't commit, hand it to retire_chunks(). Returns (version
+    number, chunks left unused by pruning beyond `keep` versions).
+    """
+    order = []              # digest of every chunk, in file order
+    sizes = {} if uploaded is None else uploaded  # digest -> size, for the chunks this version introduces
+    pending = []
+
+    def flush(pool):
+        known = _known_digests(session, user_id, {d for d, _ in pending})
+        fresh = {d: data for d, data in pending if d not in known and d not in sizes}
+        saves = {pool.submit(storage.save, chunk_key(user_id, d), io.BytesIO(data)): (d, len(data))
+                 for d, data in fresh.items()}
+        error = None
+        for future, (digest, size) in saves.items():
+            try:
+                future.result()
+                sizes[digest] = size  # Only blobs that exist, since other snapshots may reuse their rows
+            except Exception as e:
+                error = error or e
+        if error:
+            raise error
+        pending.clear()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='chunk-upload') as pool:
+        for data in chunker.chunks(fileobj):
+            digest = hashlib.sha256(data).hexdigest()
+            order.append(digest)
+            pending.append((digest, data))
+            if len(pending) >= WRITE_BATCH:
+                flush(pool)
+        if pending:
+            flush(pool)
+
+    # Another upload may have added the same chunk meanwhile; its blob is identical
+    _insert_chunks(session, user_id, sizes)
+    chunk_ids = _claim_chunks(session, user_id, set(order))
+    missing = set(order) - set(chunk_ids)
+    if missing:
+        raise VersionError(f"{len(missing)} chunks were reaped while this version was being stored")
+
+    number = _insert_version(session, user_id, filename, stored_bytes=sum(sizes.values()),
+                             created_at=datetime.now(timezone.utc).replace(tzinfo=None), **attrs)
+    version_id = session.execute(select(version_table.c.id).where(
+        version_table.c.user_id == user_id, version_table.c.filename == filename,
+        version_table.c.version == number)).scalar_one()
+    if order:
+        session.execute(insert(version_chunk_table), [
+            {'version_id': version_id, 'seq': seq, 'chunk_id': chunk_ids[d]} for seq, d in enumerate(order)])
+
+    pruned = 0
+    if keep and number > keep:
+        old = session.execute(select(version_table.c.id).where(
+            version_table.c.user_id == user_id, version_table.c.filename == filename,
+            version_table.c.version <= number - keep)).scalars().all()
+        pruned = delete_versions(session, user_id, old)
+    return number, pruned
+
+
+def _insert_chunks(session, user_id, sizes, unused_since=None):
+    """Add chunk rows for {digest: size}, leaving digests that already have one alone."""
+    rows = [{'user_id': user_id, 'digest': d, 'size': size, 'unused_since': unused_since} for d, size in sizes.items()]
+    if not rows:
+        return
+    dialect_insert = _dialect_insert(session)
+    if dialect_insert:
+        session.execute(dialect_insert(chunk_table).values(rows)
+                        .on_conflict_do_nothing(index_elements=['user_id', 'digest']))
+    else:
+        known = _known_digests(session, user_id, sizes)
+        rows = [row for row in rows if row['digest'] not in known]
+        if rows:
+            session.execute(insert(chunk_table), rows)
+
+
+def _claim_chunks(session, user_id, digests):
+    """{digest: chunk id} for the digests that still have a row, reviving any that pruning retired.
+
+    The UPDATE locks retired rows until commit, so reap_chunks() either waits
+    and then skips them or has already deleted them (they come back missing).
+    Rows in use need no lock: reap_chunks() re-checks that no version uses a
+    chunk before deleting it.
+    """
+    chunk_ids = {}
+    for batch in _batched(digests, LOOKUP_BATCH):
+        session.execute(update(chunk_table).where(
+            chunk_table.c.user_id == user_id, chunk_table.c.digest.in_(batch),
+            chunk_table.c.unused_since != None).values(unused_since=None))
+        chunk_ids.update(session.execute(select(chunk_table.c.digest, chunk_table.c.id).where(
+            chunk_table.c.user_id == user_id, chunk_table.c.digest.in_(batch))).all())
+    return chunk_ids
+
+
+def _insert_version(session, user_id, filename, **values):
+    """Insert the next version row of a file and return its number.
+
+    Another worker may take the same number between the MAX() and the insert;
+    the unique (user_id, filename, version) index rejects the second one, which
+    retries inside a savepoint with the number after it.
+    """
+    for attempt in range(NUMBER_ATTEMPTS):
+        number = (session.execute(select(func.max(version_table.c.version)).where(
+            version_table.c.user_id == user_id, version_table.c.filename == filename)).scalar() or 0) + 1
+        try:
+            with session.begin_nested():
+                session.execute(insert(version_table).values(
+                    user_id=user_id, filename=filename, version=number, **values))
+            return number
+        except IntegrityError:
+            if attempt == NUMBER_ATTEMPTS - 1:
+                raise
+
+
+def _unused():
+    return ~exists().where(version_chunk_table.c.chunk_id == chunk_table.c.id)
+
+
+def delete_versions(session, user_id, version_ids):
+    """Delete versions and mark the chunks no other version uses as unused. Returns how many were marked."""
+    if not version_ids:
+        return 0
+    candidates = set()
+    for batch in _batched(version_ids, LOOKUP_BATCH):
+        candidates.update(session.execute(select(version_chunk_table.c.chunk_id).where(
+            version_chunk_table.c.version_id.in_(batch))).scalars())
+        session.execute(delete(version_chunk_table).where(version_chunk_table.c.version_id.in_(batch)))
+        session.execute(delete(version_table).where(version_table.c.id.in_(batch)))
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    retired = 0
+    for batch in _batched(candidates, LOOKUP_BATCH):
+        retired += session.execute(update(chunk_table).where(
+            chunk_table.c.user_id == user_id, chunk_table.c.id.in_(batch),
+            chunk_table.c.unused_since == None, _unused()).values(unused_since=now)).rowcount
+    return retired
+
+
+def delete_history(session, user_id, filenames):
+    """Drop the whole history of some files (they are being deleted). Returns how many chunks became unused."""
+    ids = []
+    for batch in _batched(filenames, LOOKUP_BATCH):
+        ids.extend(session.execute(select(version_table.c.id).where(
+            version_table.c.user_id == user_id, version_table.c.filename.in_(batch))).scalars())
+    return delete_versions(session, user_id, ids)
+
+
+def retire_chunks(session, user_id, sizes):
+    """Mark chunk blobs a rolled-back snapshot stored ({digest: size}) as unused, for reap_chunks().
+
+    They aren't deleted directly: another snapshot may have found the same
+    digest missing and be about to point a row at the identical blob.
+    """
+    _insert_chunks(session, user_id, sizes, unused_since=datetime.now(timezone.utc).replace(tzinfo=None))
+
+
+def reap_chunks(session, grace_seconds, limit=LOOKUP_BATCH):
+    """Delete up to `limit` chunk rows unused for longer than grace_seconds. Returns their blob keys.
+
+    Delete the blobs before committing: until then the rows still exist, so a
+    snapshot that wants one of these chunks sees it, skips the upload and then
+    finds it missing when it tries to revive it (and fails) instead of
+    pointing at a blob that is about to go.
+    """
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=grace_seconds)
+    # Used again by a version that didn't revive it (it was marked after that version's commit)
+    session.execute(update(chunk_table).where(
+        chunk_table.c.unused_since <= cutoff, ~_unused()).values(unused_since=None))
+    expired = [chunk_table.c.unused_since <= cutoff, _unused()]
+    if session.get_bind().dialect.delete_returning:
+        ids = select(chunk_table.c.id).where(*expired).limit(limit)
+        rows = session.execute(delete(chunk_table).where(chunk_table.c.id.in_(ids), *expired)
+                               .returning(chunk_table.c.user_id, chunk_table.c.digest)).all()
+    else:
+        found = session.execute(select(chunk_table.c.id, chunk_table.c.user_id, chunk_table.c.digest)
+                                .where(*expired).limit(limit)).all()
+        session.execute(delete(chunk_table).where(chunk_table.c.id.in_([row.id for row in found]), *expired))
+        rows = [(row.user_id, row.digest) for row in found]
+    return [chunk_key(user_id, digest) for user_id, digest in rows]
+
+
+def chunk_list(session, version_id):
+    """[(digest, size)] of a version in file order."""
+    return session.execute(
+        select(chunk_table.c.digest, chunk_table.c.size)
+        .select_from(version_chunk_table.join(chunk_table, chunk_table.c.id == version_chunk_table.c.chunk_id))
+        .where(version_chunk_table.c.version_id == version_id)
+        .order_by(version_chunk_table.c.seq)).all()
+
+
+def iter_chunks(storage, user_id, chunks, fetch_ahead=FETCH_AHEAD):
+    """Yield a version's bytes chunk by chunk, verifying each, with a few chunks downloaded ahead.
+
+    chunks is chunk_list(); memory stays at about fetch_ahead chunks whatever the file size.
+    """
+    def fetch(digest):
+        with storage.open(chunk_key(user_id, digest)) as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise VersionError(f"Chunk {digest} is corrupt")
+        return data
+
+    with ThreadPoolExecutor(max_workers=fetch_ahead, thread_name_prefix='chunk-fetch') as pool:
+        window = collections.deque()
+        todo = iter(chunks)
+        try:
+            for digest, _ in todo:
+                window.append(pool.submit(fetch, digest))
+                if len(window) >= fetch_ahead:
+                    break
+            while window:
+                data = window.popleft().result()
+                for digest, _ in todo:
+                    window.append(pool.submit(fetch, digest))
+                    break
+                yield data
+        finally:
+            for future in window:
+                future.cancel()
+
+
+class ChunkReader(io.RawIOBase):
+    """Readable file object over iter_chunks(), for handing a version to BlobStore.save()."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buf = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            self._buf = next(self._chunks, b'')
+            if not self._buf:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        close = getattr(self._chunks, 'close', None)
+        if close:
+            close()
+        super().close()
@@ -0,0 +1,163 @@
+import io
+import os
+import queue
+import threading
+import time
+import zipfile
+
+CHUNK_SIZE = 256 * 1024  # 256KB
+READ_AHEAD_CHUNKS = 8    # Bounded prefetch: at most ~2MB buffered at any time
+
+# Formats that are already compressed; deflating them again burns CPU for ~0% gain
+PRECOMPRESSED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic',
+    '.mp3', '.m4a', '.aac', '.flac', '.ogg',
+    '.mp4', '.mov', '.mkv', '.avi', '.wmv', '.webm',
+    '.zip', '.rar', '.7z', '.gz', '.bz2', '.xz',
+    '.docx', '.xlsx', '.pptx', '.pdf',
+}
+
+
+class ZipEntry:
+    """One file to add to the archive. ``opener`` returns a readable binary file-like object."""
+
+    def __init__(self, arcname, opener, size=None, mtime=None):
+        self.arcname = arcname
+        self.opener = opener
+        self.size = size
+        self.mtime = mtime
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable buffer that zipfile writes into and we drain after each write."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _prefetch(entries, stop, chunk_size):
+    """Read blobs on a background thread into a bounded queue so storage I/O overlaps compression."""
+    q = queue.Queue(maxsize=READ_AHEAD_CHUNKS)
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            for entry in entries:
+                try:
+                    src = entry.opener()
+                except Exception as e:
+                    if not put(('error', entry, e)):
+                        return
+                    continue
+                try:
+                    if not put(('start', entry, None)):
+                        return
+                    while True:
+                        chunk = src.read(chunk_size)
+                        if not chunk:
+                            break
+                        if not put(('data', entry, chunk)):
+                            return
+                    if not put(('end', entry, None)):
+                        return
+                except Exception as e:
+                    put(('error', entry, e))
+                finally:
+                    src.close()
+        finally:
+            put(('done', None, None))
+
+    thread = threading.Thread(target=producer, name='zip-prefetch', daemon=True)
+    thread.start()
+    while True:
+        item = q.get()
+        if item[0] == 'done':
+            return
+        yield item
+
+
+def stream_zip(entries, chunk_size=CHUNK_SIZE):
+    """Yield a ZIP archive of entries chunk by chunk, never holding more than a few chunks in memory.
+
+    Entries are written with data descriptors (sizes after the data), so the
+    archive can go straight to the client with no seeking. Files that fail to
+    read mid-way are listed in ``_errors.txt`` at the end of the archive.
+    """
+    sink = _ChunkSink()
+    stop = threading.Event()
+    errors = []
+    seen = set()
+
+    try:
+        # Not a `with` block: on client disconnect we must not try to finalize a half-written archive
+        zf = zipfile.ZipFile(sink, mode='w', allowZip64=True)
+        dest = None
+        for kind, entry, payload in _prefetch(entries, stop, chunk_size):
+            if kind == 'start':
+                info = zipfile.ZipInfo(_unique_name(entry.arcname, seen),
+                                       date_time=time.localtime(entry.mtime or time.time())[:6])
+                is_precompressed = os.path.splitext(entry.arcname)[1].lower() in PRECOMPRESSED_EXTENSIONS
+                info.compress_type = zipfile.ZIP_STORED if is_precompressed else zipfile.ZIP_DEFLATED
+                info.file_size = entry.size or 0
+                dest = zf.open(info, mode='w', force_zip64=entry.size is None or entry.size > zipfile.ZIP64_LIMIT)
+            elif kind == 'data':
+                dest.write(payload)
+                data = sink.drain()
+                if data:
+                    yield data
+            elif kind == 'end':
+                dest.close()
+                dest = None
+                yield sink.drain()
+            elif kind == 'error':
+                if dest is not None:
+                    # Close the partial member so the archive stays well-formed; it is listed in _errors.txt
+                    dest.close()
+                    dest = None
+                errors.append(f"{entry.arcname}: {payload}")
+        if errors:
+            zf.writestr('_errors.txt', "These files could not be read:\n" + "\n".join(errors) + "\n")
+        zf.close()
+        yield sink.drain()
+    finally:
+        # Client disconnects close this generator; let the prefetch thread exit
+        stop.set()
+
+
+def _unique_name(name, seen):
+    base, ext = os.path.splitext(name)
+    candidate = name
+    n = 1
+    while candidate in seen:
+        candidate = f"{base} ({n}){ext}"
+        n += 1
+    seen.add(candidate)
+    return candidate